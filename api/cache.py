@@ -0,0 +1,260 @@
+"""
+Response cache for the read endpoints.
+
+Responses are cached as pre-serialized JSON bytes with an ETag, in an
+in-process LRU with a TTL and, when CACHE_REDIS_URL is set, in Redis as a
+second tier shared by all API workers.
+
+Book data only changes when a crawl writes it, so entries are invalidated by:
+* the cache generation, a counter in the cache_state collection that the
+  crawler bumps when a crawl commits; a new generation drops every entry.
+* change_log entries recorded since the last check, which drop the cached
+  book and every cached list (any list page may contain the book).
+Both are checked at most every CACHE_SYNC_INTERVAL seconds.
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime
+from collections import OrderedDict
+from typing import NamedTuple
+from urllib.parse import urlencode
+
+from fastapi import Request
+
+from crawler.settings import get_settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional, the in-process tier works without it
+    aioredis = None
+
+GENERATION_ID = "generation"
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    headers: dict
+
+def item_key(book_id):
+    return f"book:{book_id}"
+
+def list_key(**params):
+    """
+    Key of a /books response: the parsed parameters, sorted and without unset ones,
+    so equivalent query strings share an entry.
+    """
+    return "books?" + urlencode(sorted((k, v) for k, v in params.items() if v is not None))
+
+def make_etag(body: bytes):
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+class ResponseCache:
+    """
+    LRU + TTL cache of CachedResponse entries with an optional Redis tier.
+    state_collection / changes_collection are async (AsyncMongoClient) collections.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300.0, state_collection=None, changes_collection=None,
+                 redis=None, sync_interval=1.0, prefix="books-api", clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.state_collection = state_collection
+        self.changes_collection = changes_collection
+        self.redis = redis
+        self.sync_interval = sync_interval
+        self.prefix = prefix
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, CachedResponse)
+        self._next_sync = 0.0
+        self._last_change = None  # timestamp of the newest change_log entry applied
+        self.generation = None
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, state_collection=None, changes_collection=None):
+        settings = get_settings()
+        redis_url = settings.cache_redis_url
+        redis = None
+        if redis_url:
+            if aioredis is None:
+                logging.warning("CACHE_REDIS_URL is set but redis is not installed; using the local cache only")
+            else:
+                redis = aioredis.from_url(redis_url)
+        return cls(
+            max_entries=settings.response_cache_size,
+            ttl=settings.response_cache_ttl,
+            state_collection=state_collection,
+            changes_collection=changes_collection,
+            redis=redis,
+            sync_interval=settings.cache_sync_interval,
+        )
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "generation": self.generation,
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def _redis_key(self, key):
+        # list pages also carry the last applied change so a change makes Redis
+        # copies unreachable too; single books are deleted explicitly
+        if key.startswith("books?"):
+            stamp = self._last_change.isoformat() if self._last_change else "-"
+            return f"{self.prefix}:{self.generation}:{stamp}:{key}"
+        return f"{self.prefix}:{self.generation}:{key}"
+
+    async def sync(self):
+        """
+        Apply generation bumps and recorded changes, at most every sync_interval.
+        """
+        now = self._clock()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+        try:
+            await self._sync_generation()
+            await self._sync_changes()
+        except Exception as e:
+            logging.warning("Response cache sync failed: %s", e)
+
+    async def _sync_generation(self):
+        if self.state_collection is None:
+            return
+        doc = await self.state_collection.find_one({"_id": GENERATION_ID})
+        generation = doc["value"] if doc else 0
+        if generation != self.generation:
+            if self.generation is not None:
+                logging.info("Cache generation %s -> %s, dropping %d entries", self.generation, generation,
+                             len(self._entries))
+            self.generation = generation
+            self.clear()
+
+    async def _sync_changes(self):
+        if self.changes_collection is None:
+            return
+        if self._last_change is None:
+            # first sync: nothing is cached yet, only remember where the log ends
+            latest = await self.changes_collection.find({}, {"_id": 0, "timestamp": 1}) \
+                .sort("timestamp", -1).limit(1).to_list(None)
+            self._last_change = latest[0]["timestamp"] if latest else datetime.min
+            return
+        changes = await self.changes_collection.find(
+            {"timestamp": {"$gt": self._last_change}}, {"_id": 0, "book_id": 1, "timestamp": 1}
+        ).sort("timestamp", 1).to_list(None)
+        if not changes:
+            return
+        await self.invalidate_books({c["book_id"] for c in changes})
+        self._last_change = changes[-1]["timestamp"]
+
+    async def invalidate_books(self, book_ids):
+        """
+        Drop the cached responses of these books and every cached list page.
+        """
+        keys = {item_key(b) for b in book_ids}
+        stale = [k for k in self._entries if k in keys or k.startswith("books?")]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        if self.redis is not None and keys:
+            try:
+                await self.redis.delete(*(self._redis_key(k) for k in keys))
+            except Exception as e:
+                logging.warning("Redis cache delete failed: %s", e)
+
+    async def get(self, key):
+        if not self.enabled:
+            return None
+        await self.sync()
+        found = self._entries.get(key)
+        if found is not None:
+            expires_at, entry = found
+            if expires_at > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            del self._entries[key]
+            self.expirations += 1
+        if self.redis is not None:
+            entry = await self._redis_get(key)
+            if entry is not None:
+                self._store_local(key, entry)
+                self.hits += 1
+                self.redis_hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    async def set(self, key, body: bytes, headers=None):
+        entry = CachedResponse(body, make_etag(body), dict(headers or {}))
+        if not self.enabled:
+            return entry
+        self._store_local(key, entry)
+        if self.redis is not None:
+            await self._redis_set(key, entry)
+        return entry
+
+    def _store_local(self, key, entry):
+        self._entries[key] = (self._clock() + self.ttl, entry)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _redis_get(self, key):
+        try:
+            raw = await self.redis.get(self._redis_key(key))
+        except Exception as e:
+            logging.warning("Redis cache get failed: %s", e)
+            return None
+        if raw is None:
+            return None
+        meta, _, body = raw.partition(b"\n")
+        meta = json.loads(meta)
+        return CachedResponse(body, meta["etag"], meta["headers"])
+
+    async def _redis_set(self, key, entry):
+        meta = json.dumps({"etag": entry.etag, "headers": entry.headers}).encode("utf-8")
+        try:
+            await self.redis.set(self._redis_key(key), meta + b"\n" + entry.body, ex=max(1, int(self.ttl)))
+        except Exception as e:
+            logging.warning("Redis cache set failed: %s", e)
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+
+def get_cache(request: Request) -> ResponseCache:
+    return request.app.state.cache
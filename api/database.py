@@ -0,0 +1,49 @@
+from fastapi import Request
+from pymongo import AsyncMongoClient, DESCENDING
+import logging
+
+from crawler.settings import get_settings
+
+from .pagination import sort_indexes
+from .search import text_index
+
+class Database:
+    """
+    Async MongoDB client and the collections the API reads.
+    Created and closed by the app lifespan, never at import time; pool sizing
+    comes from MONGO_MAX_POOL_SIZE / MONGO_MIN_POOL_SIZE (see crawler/settings.py).
+    """
+
+    def __init__(self, uri=None, db_name=None, max_pool_size=None, min_pool_size=None):
+        settings = get_settings()
+        self.client = AsyncMongoClient(
+            uri or settings.mongo_uri,
+            maxPoolSize=max_pool_size or settings.mongo_max_pool_size,
+            minPoolSize=min_pool_size or settings.mongo_min_pool_size,
+        )
+        db = self.client[db_name or settings.db_name]
+        self.books = db[settings.books_collection]
+        self.changes = db[settings.change_log_collection]
+        self.cache_state = db[settings.cache_state_collection]
+        self.price_history = db[settings.price_history_collection]
+        self.price_stats = db[settings.price_stats_collection]
+
+    async def ensure_indexes(self):
+        """
+        Create the indexes behind the /books sort orders, /books/search and /changes at startup.
+        A missing database should not stop the API from starting, so failures are only logged.
+        """
+        try:
+            for keys, name in sort_indexes():
+                await self.books.create_index(keys, name=name)
+            keys, options = text_index()
+            await self.books.create_index(keys, **options)
+            await self.changes.create_index([("timestamp", DESCENDING)])
+        except Exception as e:
+            logging.warning("Could not create indexes: %s", e)
+
+    async def close(self):
+        await self.client.close()
+
+def get_db(request: Request) -> Database:
+    return request.app.state.db
@@ -0,0 +1,64 @@
+"""
+Read side of the price history written by crawler/history.py.
+
+/books/{book_id}/history is a range scan of the price_history time-series
+collection on (meta.book_id, ts). /stats/prices never touches the snapshots:
+it reads the per-day, per-category price_stats_daily documents (a year is 365
+of them per category) and merges them into weeks or months here.
+"""
+from datetime import datetime, timedelta
+
+BUCKETS = ("day", "week", "month")
+
+def format_pence(pence):
+    if pence is None:
+        return None
+    return f"{pence // 100}.{pence % 100:02d}"
+
+def price_point(doc):
+    return {
+        "timestamp": doc["ts"].isoformat(),
+        "price": format_pence(doc.get("price")),
+        "in_stock": doc.get("in_stock"),
+        "stock": doc.get("stock"),
+    }
+
+def bucket_start(day, bucket):
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return datetime(day.year, day.month, 1)
+    return day
+
+def downsample(days, bucket):
+    """
+    Merge daily stats documents (sorted by day) into one entry per bucket.
+    Counts are averaged over the days of a bucket, the average price is taken
+    over every priced book-day and min/max are the extremes seen.
+    """
+    merged = []
+    for doc in days:
+        start = bucket_start(doc["day"], bucket)
+        if not merged or merged[-1]["start"] != start:
+            merged.append({"start": start, "category": doc["category"], "days": 0, "books": 0, "priced": 0,
+                           "sum_price": 0, "min_price": None, "max_price": None, "in_stock": 0})
+        m = merged[-1]
+        m["days"] += 1
+        for field in ("books", "priced", "sum_price", "in_stock"):
+            m[field] += doc.get(field) or 0
+        if doc.get("min_price") is not None:
+            m["min_price"] = doc["min_price"] if m["min_price"] is None else min(m["min_price"], doc["min_price"])
+        if doc.get("max_price") is not None:
+            m["max_price"] = doc["max_price"] if m["max_price"] is None else max(m["max_price"], doc["max_price"])
+    return [
+        {
+            "bucket": m["start"].date().isoformat(),
+            "category": m["category"],
+            "books": round(m["books"] / m["days"]),
+            "avg_price": format_pence(round(m["sum_price"] / m["priced"])) if m["priced"] else None,
+            "min_price": format_pence(m["min_price"]),
+            "max_price": format_pence(m["max_price"]),
+            "in_stock": round(m["in_stock"] / m["days"]),
+        }
+        for m in merged
+    ]
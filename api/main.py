@@ -1,22 +1,39 @@
-from fastapi import FastAPI, Depends, Query, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Depends, Query, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from pymongo import MongoClient, DESCENDING, ASCENDING
+from pymongo import ASCENDING, DESCENDING
 from dotenv import load_dotenv
-import os
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
 
 from .auth import get_api_key
-from .schemas import BookOut, ChangeLogOut
+from .schemas import BookOut, ChangeLogOut, PricePointOut, PriceStatsOut, SearchOut
+from .pagination import SORT_MAP, DEFAULT_SORT, InvalidCursor, sort_spec, encode_cursor, decode_cursor, keyset_filter
+from .database import Database, get_db
+from .cache import ResponseCache, get_cache, item_key, list_key, etag_matches
+from .serialization import BOOK_PROJECTION, list_projection, book_out, dumps, iter_ndjson
+from .metrics import track_requests, metrics_response
+from .ratelimit import RateLimiter, rate_limit
+from .history import BUCKETS, price_point, downsample
+from .search import search_pipeline, search_out
 
 load_dotenv()
 
-app = FastAPI(title="Books API", version="1.0.0")
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.db = Database()
+    app.state.cache = ResponseCache.from_env(app.state.db.cache_state, app.state.db.changes)
+    await app.state.db.ensure_indexes()
+    yield
+    await app.state.limiter.close()
+    await app.state.cache.close()
+    await app.state.db.close()
+
+app = FastAPI(title="Books API", version="1.0.0", lifespan=lifespan)
+# per API key, shared by all workers through Redis when one is configured;
+# RATE_LIMIT_ENABLED=0 turns limits off, e.g. for benchmarks/api_load.py
+app.state.limiter = RateLimiter.from_env()
 
 # CORS (optional)
 app.add_middleware(
@@ -25,21 +42,32 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.middleware("http")(track_requests)
 
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = os.getenv("DB_NAME", "default_db")
-COLLECTION_NAME = os.getenv("COLLECTION_NAME", "books")
-CHANGE_LOG_COLLECTION_NAME = os.getenv("CHANGE_LOG_COLLECTION_NAME", "change_log")
+def _cached_response(request: Request, entry, cache_status):
+    headers = {**entry.headers, "ETag": entry.etag, "X-Cache": cache_status}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
 
-print("Before MongoClient")  # Add this
-client = MongoClient(MONGO_URI)
-print("After MongoClient")   # Add this
-db = client[DB_NAME]
-books_col = db[COLLECTION_NAME]
-changes_col = db[CHANGE_LOG_COLLECTION_NAME]
+def _books_filter(category, min_price, max_price, rating):
+    query = {}
+    if category:
+        query["crawl_metadata.category"] = category
+    if min_price is not None or max_price is not None:
+        # prices are stored as integer pence next to the display strings
+        price_field = "price_incl_tax_pence"
+        price_query = {}
+        if min_price is not None:
+            price_query["$gte"] = round(min_price * 100)
+        if max_price is not None:
+            price_query["$lte"] = round(max_price * 100)
+        query[price_field] = price_query
+    if rating:
+        query["crawl_metadata.rating"] = rating
+    return query
 
-@app.get("/books", response_model=list[BookOut])
-@limiter.limit("100/hour")
+@app.get("/books", response_model=list[BookOut], dependencies=[Depends(rate_limit("100/hour"))])
 async def get_books(
     request:Request,
     category: str = Query(None),
@@ -49,49 +77,150 @@ async def get_books(
     sort_by: str = Query("rating"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, le=100),
-    api_key: str = Depends(get_api_key)
+    cursor: str = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    api_key: str = Depends(get_api_key),
+    db: Database = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
 ):
-    query = {}
-    if category:
-        query["crawl_metadata.category"] = category
-    if min_price or max_price:
-        price_field = "price_incl_tax"
-        price_query = {}
-        if min_price is not None:
-            price_query["$gte"] = min_price
-        if max_price is not None:
-            price_query["$lte"] = max_price
-        query[price_field] = price_query
-    if rating:
-        query["crawl_metadata.rating"] = rating
-
-    sort_map = {
-        "rating": ("crawl_metadata.rating", DESCENDING),
-        "price": ("price_incl_tax", ASCENDING),
-        "reviews": ("number_of_reviews", DESCENDING)
-    }
-    sort_field, sort_dir = sort_map.get(sort_by, ("crawl_metadata.rating", DESCENDING))
+    """
+    List books. Paginate with `cursor` (keyset pagination, constant cost at any
+    depth); the cursor for the next page is returned in the X-Next-Cursor header.
+    `page` is still accepted for the first pages but costs a skip.
+    Responses are cached until the next crawl changes the data and carry an ETag.
+    """
+    if sort_by not in SORT_MAP:
+        sort_by = DEFAULT_SORT
+    key = list_key(category=category, min_price=min_price, max_price=max_price, rating=rating, sort_by=sort_by,
+                   page=None if cursor else page, page_size=page_size, cursor=cursor)
+    entry = await cache.get(key)
+    if entry is not None:
+        return _cached_response(request, entry, "HIT")
 
+    query = _books_filter(category, min_price, max_price, rating)
     skip = (page - 1) * page_size
-    cursor = books_col.find(query).sort(sort_field, sort_dir).skip(skip).limit(page_size)
-    results = [BookOut(**{**doc, "book_id": str(doc["book_id"])}) for doc in cursor]
-    return results
+    if cursor:
+        try:
+            last_value, last_book_id = decode_cursor(cursor, sort_by)
+        except InvalidCursor as e:
+            raise HTTPException(400, str(e))
+        after = keyset_filter(sort_by, last_value, last_book_id)
+        query = {"$and": [query, after]} if query else after
+        skip = 0
+
+    docs = await db.books.find(query, list_projection(sort_by)).sort(sort_spec(sort_by)).skip(skip).limit(page_size).to_list(None)
+    headers = {}
+    if len(docs) == page_size:
+        headers["X-Next-Cursor"] = encode_cursor(sort_by, docs[-1])
+    entry = await cache.set(key, dumps([book_out(doc) for doc in docs]), headers)
+    return _cached_response(request, entry, "MISS")
+
+@app.get("/books/export", response_class=StreamingResponse, dependencies=[Depends(rate_limit("10/hour"))])
+async def export_books(
+    request:Request,
+    category: str = Query(None),
+    api_key: str = Depends(get_api_key),
+    db: Database = Depends(get_db),
+):
+    """
+    Stream the whole catalogue (or one category) as NDJSON, one BookOut per line,
+    in book_id order. Documents are encoded as the cursor yields them, so the
+    response is never held in memory.
+    """
+    query = {"crawl_metadata.category": category} if category else {}
+    cursor = db.books.find(query, BOOK_PROJECTION, batch_size=1000).sort("book_id", ASCENDING)
+    return StreamingResponse(iter_ndjson(cursor), media_type="application/x-ndjson")
 
-@app.get("/books/{book_id}", response_model=BookOut)
-@limiter.limit("100/hour")
-async def get_book(    request:Request,book_id: str, api_key: str = Depends(get_api_key)):
-    doc = books_col.find_one({"book_id": book_id})
+@app.get("/books/search", response_model=SearchOut, dependencies=[Depends(rate_limit("100/hour"))])
+async def search_books(
+    request: Request,
+    q: str = Query(..., min_length=1, description="Words to look for in the title and description"),
+    category: str = Query(None),
+    min_price: float = Query(None),
+    max_price: float = Query(None),
+    rating: int = Query(None),
+    page: int = Query(1, ge=1, le=50),
+    page_size: int = Query(20, le=100),
+    api_key: str = Depends(get_api_key),
+    db: Database = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+):
+    """
+    Search books by title and description words, best matches first, with
+    category, rating and price facet counts over all matches. Takes the
+    same filters as /books. Cached like /books.
+    """
+    key = list_key(search=q, category=category, min_price=min_price, max_price=max_price, rating=rating,
+                   page=page, page_size=page_size)
+    entry = await cache.get(key)
+    if entry is not None:
+        return _cached_response(request, entry, "HIT")
+    pipeline = search_pipeline(q, _books_filter(category, min_price, max_price, rating),
+                               skip=(page - 1) * page_size, limit=page_size)
+    result, = await (await db.books.aggregate(pipeline)).to_list(None)
+    entry = await cache.set(key, dumps(search_out(result, book_out)))
+    return _cached_response(request, entry, "MISS")
+
+@app.get("/books/{book_id}", response_model=BookOut, dependencies=[Depends(rate_limit("100/hour"))])
+async def get_book(    request:Request,book_id: str, api_key: str = Depends(get_api_key), db: Database = Depends(get_db),
+                   cache: ResponseCache = Depends(get_cache)):
+    key = item_key(book_id)
+    entry = await cache.get(key)
+    if entry is not None:
+        return _cached_response(request, entry, "HIT")
+    doc = await db.books.find_one({"book_id": book_id}, BOOK_PROJECTION)
     if not doc:
         raise HTTPException(404, "Book not found")
-    return BookOut(**{**doc, "book_id": str(doc["book_id"])})
+    entry = await cache.set(key, dumps(book_out(doc)))
+    return _cached_response(request, entry, "MISS")
+
+@app.get("/books/{book_id}/history", response_model=list[PricePointOut],
+         dependencies=[Depends(rate_limit("100/hour"))])
+async def get_book_history(
+    book_id: str,
+    start: Optional[datetime] = Query(None, description="Snapshots at or after this time"),
+    end: Optional[datetime] = Query(None, description="Snapshots before this time"),
+    limit: int = Query(366, ge=1, le=5000),
+    api_key: str = Depends(get_api_key),
+    db: Database = Depends(get_db),
+):
+    """
+    Price and availability of one book at every crawl, oldest first: the
+    latest limit snapshots in the range.
+    """
+    query = {"meta.book_id": book_id}
+    if start or end:
+        query["ts"] = {k: v for k, v in (("$gte", start), ("$lt", end)) if v is not None}
+    docs = await db.price_history.find(query, {"_id": 0, "meta": 0}).sort("ts", DESCENDING).limit(limit).to_list(None)
+    return [price_point(d) for d in reversed(docs)]
 
-@app.get("/changes", response_model=list[ChangeLogOut])
-@limiter.limit("100/hour")
+@app.get("/stats/prices", response_model=list[PriceStatsOut], dependencies=[Depends(rate_limit("100/hour"))])
+async def get_price_stats(
+    bucket: str = Query("day", description="day, week or month"),
+    category: Optional[str] = Query(None, description="Category name; all books when omitted"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    api_key: str = Depends(get_api_key),
+    db: Database = Depends(get_db),
+):
+    """
+    Catalogue price statistics per day, week or month from the daily rollups
+    written after each crawl.
+    """
+    if bucket not in BUCKETS:
+        raise HTTPException(400, f"bucket must be one of {', '.join(BUCKETS)}")
+    query = {"category": category or "all"}
+    if start or end:
+        query["day"] = {k: v for k, v in (("$gte", start), ("$lt", end)) if v is not None}
+    days = await db.price_stats.find(query, {"_id": 0}).sort("day", ASCENDING).to_list(None)
+    return downsample(days, bucket)
+
+@app.get("/changes", response_model=list[ChangeLogOut], dependencies=[Depends(rate_limit("100/hour"))])
 async def get_changes(    request:Request,
     limit: int = Query(20, le=100),
-    api_key: str = Depends(get_api_key)
+    api_key: str = Depends(get_api_key),
+    db: Database = Depends(get_db),
 ):
-    cursor = changes_col.find().sort("timestamp", DESCENDING).limit(limit)
+    cursor = await db.changes.find().sort("timestamp", DESCENDING).limit(limit).to_list(None)
     results = [
         ChangeLogOut(
             book_id=str(doc.get("book_id")),
@@ -104,6 +233,20 @@ async def get_changes(    request:Request,
     ]
     return results
 
+@app.get("/cache/stats")
+async def get_cache_stats(api_key: str = Depends(get_api_key), cache: ResponseCache = Depends(get_cache)):
+    """
+    Hit/miss/eviction counters of the response cache.
+    """
+    return cache.metrics()
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request, cache: ResponseCache = Depends(get_cache)):
+    """
+    Prometheus scrape endpoint: request latency per route, cache and rate limiter counters.
+    """
+    return metrics_response(cache, request.app.state.limiter)
+
 @app.get("/")
 def root():
     return {"message": "Books API is running. See /docs for documentation."}
\ No newline at end of file
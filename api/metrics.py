@@ -0,0 +1,48 @@
+from fastapi import Request, Response
+from prometheus_client import CollectorRegistry, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+import time
+
+REGISTRY = CollectorRegistry()
+
+REQUEST_SECONDS = Histogram(
+    "api_request_seconds", "API request latency by route and status", ["method", "route", "status"],
+    registry=REGISTRY, buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+IN_PROGRESS = Gauge("api_requests_in_progress", "Requests being handled", registry=REGISTRY)
+CACHE = Gauge("api_response_cache", "Response cache counters, see /cache/stats", ["stat"], registry=REGISTRY)
+RATE_LIMIT = Gauge("api_rate_limiter", "Rate limiter checks by where they were decided", ["stat"], registry=REGISTRY)
+
+async def track_requests(request: Request, call_next):
+    """
+    HTTP middleware: time every request, labelled with the route template
+    (/books/{book_id}) so a label is never a raw path.
+    """
+    IN_PROGRESS.inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        IN_PROGRESS.dec()
+        route = request.scope.get("route")
+        REQUEST_SECONDS.labels(request.method, route.path if route else "unmatched", str(status)).observe(
+            time.perf_counter() - started
+        )
+
+def _copy(gauge, metrics):
+    for stat, value in metrics.items():
+        if isinstance(value, (int, float)):
+            gauge.labels(stat).set(value)
+
+def metrics_response(cache=None, limiter=None):
+    """
+    Prometheus exposition of the API metrics, with the response cache and rate
+    limiter counters copied in at scrape time.
+    """
+    if cache is not None:
+        _copy(CACHE, cache.metrics())
+    if limiter is not None:
+        _copy(RATE_LIMIT, limiter.metrics())
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
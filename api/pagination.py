@@ -0,0 +1,87 @@
+import base64
+import json
+from pymongo import ASCENDING, DESCENDING
+
+# sort_by -> (field, direction); book_id (ascending) breaks ties so the order is total
+SORT_MAP = {
+    "rating": ("crawl_metadata.rating", DESCENDING),
+    "price": ("price_incl_tax_pence", ASCENDING),
+    "reviews": ("number_of_reviews", DESCENDING),
+}
+DEFAULT_SORT = "rating"
+
+class InvalidCursor(ValueError):
+    pass
+
+def sort_spec(sort_by):
+    field, direction = SORT_MAP.get(sort_by, SORT_MAP[DEFAULT_SORT])
+    return [(field, direction), ("book_id", ASCENDING)]
+
+# equality filters of GET /books that get their own index prefix
+FILTER_FIELDS = {
+    "category": "crawl_metadata.category",
+    "rating": "crawl_metadata.rating",
+}
+
+def sort_indexes():
+    """
+    Compound indexes backing every filter + sort combination of GET /books, as
+    (keys, name) pairs. Equality filters come first, then the sort keys; the
+    price range filter is answered from the sort index or the price index.
+    """
+    indexes = []
+    for sort_by in SORT_MAP:
+        spec = sort_spec(sort_by)
+        indexes.append((spec, f"books_sort_{sort_by}"))
+        for filter_name, filter_field in FILTER_FIELDS.items():
+            if spec[0][0] == filter_field:
+                continue  # the plain sort index already serves this filter
+            indexes.append(([(filter_field, ASCENDING)] + spec, f"books_{filter_name}_sort_{sort_by}"))
+    return indexes
+
+def _field_value(doc, dotted):
+    value = doc
+    for part in dotted.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def encode_cursor(sort_by, doc):
+    """
+    Opaque cursor pointing just after doc in the given sort order.
+    """
+    field, _ = SORT_MAP.get(sort_by, SORT_MAP[DEFAULT_SORT])
+    payload = json.dumps([sort_by, _field_value(doc, field), str(doc["book_id"])], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, sort_by):
+    """
+    Return (last_value, last_book_id) from a cursor made by encode_cursor.
+    Raises InvalidCursor if it is malformed or was issued for another sort order.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, book_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise InvalidCursor("Malformed cursor")
+    if cursor_sort != sort_by:
+        raise InvalidCursor("Cursor was issued for a different sort_by")
+    return value, book_id
+
+def keyset_filter(sort_by, value, book_id):
+    """
+    Query matching the documents that come after (value, book_id) in sort_by order.
+    Missing values sort lowest in MongoDB, and range operators never match them,
+    so they need their own branch.
+    """
+    field, direction = SORT_MAP.get(sort_by, SORT_MAP[DEFAULT_SORT])
+    same_value_after = {field: value, "book_id": {"$gt": book_id}}
+    if value is None:
+        if direction == DESCENDING:
+            # nulls come last, only the tie-break is left
+            return same_value_after
+        return {"$or": [same_value_after, {field: {"$ne": None}}]}
+    if direction == DESCENDING:
+        return {"$or": [{field: {"$lt": value}}, same_value_after, {field: None}]}
+    return {"$or": [{field: {"$gt": value}}, same_value_after]}
@@ -0,0 +1,326 @@
+"""
+API rate limiting shared by every worker process.
+
+Limits such as "100/hour" are enforced per API key (per client IP for requests
+without one) with GCRA, the generic cell rate algorithm: each key stores only
+its theoretical arrival time (TAT), and a request is let through while the TAT
+is less than one period ahead of now. On Redis (RATE_LIMIT_REDIS_URL, or
+CACHE_REDIS_URL) the check-and-update is one atomic Lua script using the Redis
+clock, so N uvicorn workers share one budget that survives restarts. Without
+Redis an in-process store with the same semantics is used.
+
+To keep Redis off the hot path each worker leases tokens in small batches and
+spends them locally; unused tokens of an expired lease are handed back on the
+next check (or at shutdown), and a denial is remembered locally until its
+retry time. Leases only ever hold tokens the shared store has granted, so a
+key never gets more than its limit.
+
+Batching only pays off for limits of at least lease_divisor tokens per period
+(100 with the defaults). Below that, as on the API's 100/hour and 10/hour
+routes, a lease is a single token and every allowed request is one store
+round trip. Denials are answered locally
+until their retry time, so a key costs at most about (workers + 1) x limit
+round trips per period, however fast it sends requests (see
+benchmarks/ratelimit_bench.py).
+"""
+import hashlib
+import logging
+import math
+from itertools import islice
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from fastapi import Depends, HTTPException, Request
+
+from crawler.settings import get_settings
+
+from .auth import get_api_key
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional, the in-process store works without it
+    aioredis = None
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# KEYS[1]: TAT key. ARGV: emission interval (us), period (us), tokens wanted.
+# Grants as many of the wanted tokens as fit; returns {granted, retry after (us), remaining}.
+_ACQUIRE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000000 + tonumber(t[2])
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local granted = math.min(tonumber(ARGV[3]), math.floor((now + period - tat) / interval))
+if granted <= 0 then
+    return {0, math.ceil(tat + interval - period - now), 0}
+end
+tat = tat + granted * interval
+redis.call('SET', KEYS[1], string.format('%d', tat), 'PX', math.ceil((tat - now) / 1000))
+return {granted, 0, math.floor((now + period - tat) / interval)}
+"""
+
+# KEYS[1]: TAT key. ARGV: emission interval (us), tokens to give back.
+_REFUND = """
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat then return 0 end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000000 + tonumber(t[2])
+tat = tat - tonumber(ARGV[1]) * tonumber(ARGV[2])
+if tat <= now then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('SET', KEYS[1], string.format('%d', tat), 'PX', math.ceil((tat - now) / 1000))
+end
+return 1
+"""
+
+class Limit(NamedTuple):
+    amount: int
+    period: float  # seconds
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        "100/hour", "10/second", "1000/5 minutes" style limits.
+        """
+        amount, _, per = spec.partition("/")
+        count, _, unit = per.strip().partition(" ")
+        if not unit:
+            count, unit = "1", count
+        seconds = PERIODS.get(unit.rstrip("s"))
+        if seconds is None or not amount.strip().isdigit():
+            raise ValueError(f"Invalid rate limit: {spec!r}")
+        return cls(int(amount), float(count) * seconds)
+
+    @property
+    def interval(self):
+        return self.period / self.amount
+
+class Grant(NamedTuple):
+    granted: int
+    retry_after: float  # seconds, when nothing was granted
+    remaining: int
+
+class LocalStore:
+    """
+    GCRA state in this process only: the stand-in when there is no Redis.
+    Holds at most max_keys keys: TATs in the past mean nothing and are swept
+    first, then the least recently used keys are forgotten.
+    """
+
+    def __init__(self, clock=time.monotonic, max_keys=100_000):
+        self._clock = clock
+        self.max_keys = max_keys
+        self._tats = {}
+
+    def _set(self, key, tat, now):
+        # re-inserted, so the dict stays in least recently used order
+        self._tats.pop(key, None)
+        self._tats[key] = tat
+        if len(self._tats) > self.max_keys:
+            self._tats = {k: t for k, t in self._tats.items() if t > now}
+            # sweep down to 90% so a full store of live keys is not swept on every call
+            for k in list(islice(self._tats, max(0, len(self._tats) - int(0.9 * self.max_keys)))):
+                del self._tats[k]
+
+    async def acquire(self, key, limit, tokens):
+        now = self._clock()
+        tat = max(self._tats.get(key, now), now)
+        granted = min(tokens, math.floor((now + limit.period - tat) / limit.interval + 1e-9))
+        if granted <= 0:
+            return Grant(0, tat + limit.interval - limit.period - now, 0)
+        tat += granted * limit.interval
+        self._set(key, tat, now)
+        return Grant(granted, 0.0, math.floor((now + limit.period - tat) / limit.interval + 1e-9))
+
+    async def refund(self, key, limit, tokens):
+        if key in self._tats:
+            now = self._clock()
+            self._set(key, max(now, self._tats[key] - tokens * limit.interval), now)
+
+    async def close(self):
+        pass
+
+class RedisStore:
+    """
+    GCRA state in Redis, updated atomically by Lua scripts on the Redis clock.
+    """
+
+    def __init__(self, redis, prefix="books-api:rl"):
+        self.redis = redis
+        self.prefix = prefix
+        self._acquire = redis.register_script(_ACQUIRE)
+        self._refund = redis.register_script(_REFUND)
+
+    async def acquire(self, key, limit, tokens):
+        granted, retry_after_us, remaining = await self._acquire(
+            keys=[f"{self.prefix}:{key}"], args=[limit.interval * 1e6, limit.period * 1e6, tokens]
+        )
+        return Grant(int(granted), int(retry_after_us) / 1e6, int(remaining))
+
+    async def refund(self, key, limit, tokens):
+        await self._refund(keys=[f"{self.prefix}:{key}"], args=[limit.interval * 1e6, tokens])
+
+    async def close(self):
+        await self.redis.aclose()
+
+class _Lease:
+    __slots__ = ("tokens", "expires_at", "blocked_until")
+
+    def __init__(self):
+        self.tokens = 0
+        self.expires_at = 0.0
+        self.blocked_until = 0.0
+
+class RateLimiter:
+    """
+    Checks requests against a shared store, leasing up to 1/lease_divisor of a
+    limit (at most max_lease tokens) per store round trip. A lease is good for
+    lease_ttl seconds; what is left of it then goes back to the store.
+    A lease is dropped once it holds no tokens and no denial, and at most
+    max_keys are kept: the least recently used one goes first, forfeiting its
+    tokens (which only ever under-admits).
+    """
+
+    def __init__(self, store=None, enabled=True, lease_divisor=100, max_lease=50, lease_ttl=1.0,
+                 clock=time.monotonic, max_keys=100_000):
+        self.store = store if store is not None else LocalStore()
+        self.enabled = enabled
+        self.lease_divisor = lease_divisor
+        self.max_lease = max_lease
+        self.lease_ttl = lease_ttl
+        self._clock = clock
+        self.max_keys = max_keys
+        self._leases = OrderedDict()
+        self.local_hits = 0
+        self.store_calls = 0
+        self.denied = 0
+        self.store_errors = 0
+
+    @classmethod
+    def from_env(cls):
+        settings = get_settings()
+        redis_url = settings.rate_limit_redis_url
+        store = None
+        if redis_url:
+            if aioredis is None:
+                logging.warning("A rate limit Redis URL is set but redis is not installed; limits are per worker")
+            else:
+                store = RedisStore(aioredis.from_url(redis_url))
+        return cls(store, enabled=settings.rate_limit_enabled, lease_ttl=settings.rate_limit_lease_ttl)
+
+    def _lease(self, lease_key):
+        lease = self._leases.get(lease_key)
+        if lease is None:
+            lease = self._leases[lease_key] = _Lease()
+            if len(self._leases) > self.max_keys:
+                self._leases.popitem(last=False)
+        else:
+            self._leases.move_to_end(lease_key)
+        return lease
+
+    def _release(self, lease_key, lease, now):
+        # an empty lease without a pending denial is the same as none
+        if not lease.tokens and lease.blocked_until <= now and self._leases.get(lease_key) is lease:
+            del self._leases[lease_key]
+
+    def lease_size(self, limit):
+        return max(1, min(self.max_lease, limit.amount // self.lease_divisor))
+
+    async def hit(self, key, limit):
+        """
+        Spend one token of key's limit. Returns (allowed, retry_after seconds).
+        """
+        now = self._clock()
+        lease_key = (key, limit)
+        lease = self._lease(lease_key)
+        if lease.blocked_until > now:
+            self.denied += 1
+            return False, lease.blocked_until - now
+        if lease.tokens and lease.expires_at > now:
+            lease.tokens -= 1
+            self.local_hits += 1
+            self._release(lease_key, lease, now)
+            return True, 0.0
+
+        # take the expired tokens before awaiting, so that a concurrent request
+        # for this key cannot refund them a second time
+        expired, lease.tokens = lease.tokens, 0
+        try:
+            if expired:
+                await self.store.refund(key, limit, expired)
+            self.store_calls += 1
+            grant = await self.store.acquire(key, limit, self.lease_size(limit))
+        except Exception as e:
+            # a limiter outage must not take the API down with it
+            self.store_errors += 1
+            logging.warning(f"Rate limit store failed, letting the request through: {e}")
+            self._release(lease_key, lease, now)
+            return True, 0.0
+        # the lease may have been dropped or replaced while we waited
+        lease = self._lease(lease_key)
+        if not grant.granted:
+            lease.blocked_until = now + grant.retry_after
+            self.denied += 1
+            return False, grant.retry_after
+        # += : another request for this key may have leased tokens while we waited
+        lease.tokens += grant.granted - 1
+        lease.expires_at = now + self.lease_ttl
+        self._release(lease_key, lease, now)
+        return True, 0.0
+
+    def metrics(self):
+        checks = self.local_hits + self.store_calls + self.denied
+        return {
+            "store": type(self.store).__name__,
+            "local_hits": self.local_hits,
+            "store_calls": self.store_calls,
+            "denied": self.denied,
+            "store_errors": self.store_errors,
+            "local_ratio": round(self.local_hits / checks, 3) if checks else 0.0,
+        }
+
+    async def close(self):
+        for (key, limit), lease in self._leases.items():
+            if lease.tokens:
+                try:
+                    await self.store.refund(key, limit, lease.tokens)
+                except Exception as e:
+                    logging.warning(f"Could not return rate limit tokens for {key}: {e}")
+        self._leases.clear()
+        await self.store.close()
+
+def client_key(request: Request):
+    """
+    Rate limit key: a hash of the API key, or the client IP without one.
+    """
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:24]
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+def rate_limit(spec):
+    """
+    Route dependency enforcing a limit like "100/hour" per client, e.g.
+    @app.get(..., dependencies=[Depends(rate_limit("100/hour"))]).
+    The API key is checked first, so requests with an invalid key get their
+    401 without touching the limiter.
+    """
+    limit = Limit.parse(spec)
+
+    async def check(request: Request, api_key: str = Depends(get_api_key)):
+        limiter = request.app.state.limiter
+        if not limiter.enabled:
+            return
+        allowed, retry_after = await limiter.hit(f"{request.scope['route'].path}:{client_key(request)}", limit)
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded: {spec}",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+    return check
@@ -19,4 +19,33 @@ class ChangeLogOut(BaseModel):
     change_type: str
     timestamp: str
     old_value: dict
-    new_value: dict
\ No newline at end of file
+    new_value: dict
+
+class PricePointOut(BaseModel):
+    timestamp: str
+    price: Optional[str]
+    in_stock: Optional[bool]
+    stock: Optional[int]
+
+class PriceStatsOut(BaseModel):
+    bucket: str
+    category: str
+    books: int
+    avg_price: Optional[str]
+    min_price: Optional[str]
+    max_price: Optional[str]
+    in_stock: int
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class SearchFacets(BaseModel):
+    category: list[FacetCount]
+    rating: list[FacetCount]
+    price: list[FacetCount]
+
+class SearchOut(BaseModel):
+    total: int
+    results: list[BookOut]
+    facets: SearchFacets
@@ -0,0 +1,90 @@
+"""
+Full-text search over books with facet counts.
+
+Backed by a MongoDB text index on name and product_description (the title
+weighs more), which MongoDB keeps up to date as the crawler writes books.
+One aggregation answers a search: the $text match selects the books through
+the index, then a single $facet pass over the matches returns the page of
+results, the total and the category, rating and price bucket counts.
+"""
+from pymongo import TEXT
+
+from .serialization import BOOK_PROJECTION
+
+TEXT_INDEX = "books_text"
+TEXT_WEIGHTS = {"name": 10, "product_description": 1}
+
+# price facet bucket boundaries in pence; the last bucket is open-ended
+PRICE_BOUNDARIES = [0, 1000, 2000, 3000, 4000, 5000, 10 ** 9]
+NO_PRICE = "unknown"
+
+def text_index():
+    """
+    (keys, options) of the text index, for create_index.
+    """
+    return [(field, TEXT) for field in TEXT_WEIGHTS], {"name": TEXT_INDEX, "weights": TEXT_WEIGHTS,
+                                                       "default_language": "english"}
+
+def _price_label(lower):
+    if lower == NO_PRICE:
+        return NO_PRICE
+    i = PRICE_BOUNDARIES.index(lower)
+    if i == len(PRICE_BOUNDARIES) - 2:
+        return f"{lower // 100}+"
+    return f"{lower // 100}-{PRICE_BOUNDARIES[i + 1] // 100}"
+
+def facet_stage(skip, limit):
+    """
+    The $facet stage run over the matching books: one page of results in
+    relevance order plus the total and the facet counts.
+    """
+    counted = {"count": {"$sum": 1}}
+    return {"$facet": {
+        "results": [
+            {"$sort": {"score": -1, "book_id": 1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": BOOK_PROJECTION},
+        ],
+        "total": [{"$count": "count"}],
+        "category": [
+            {"$group": {"_id": "$crawl_metadata.category", **counted}},
+            {"$sort": {"count": -1, "_id": 1}},
+        ],
+        "rating": [
+            {"$group": {"_id": "$crawl_metadata.rating", **counted}},
+            {"$sort": {"_id": -1}},
+        ],
+        "price": [
+            {"$bucket": {"groupBy": "$price_incl_tax_pence", "boundaries": PRICE_BOUNDARIES,
+                         "default": NO_PRICE, "output": counted}},
+        ],
+    }}
+
+def search_pipeline(q, filters=None, skip=0, limit=20):
+    """
+    Aggregation pipeline for a search for q, narrowed by the equality/range
+    filters of GET /books.
+    """
+    return [
+        {"$match": {"$text": {"$search": q}, **(filters or {})}},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+        facet_stage(skip, limit),
+    ]
+
+def search_out(result, book_out):
+    """
+    The response body for the $facet output document.
+    """
+    total = result["total"][0]["count"] if result["total"] else 0
+    return {
+        "total": total,
+        "results": [book_out(doc) for doc in result["results"]],
+        "facets": {
+            "category": [{"value": str(f["_id"]), "count": f["count"]}
+                         for f in result["category"] if f["_id"] is not None],
+            "rating": [{"value": str(f["_id"]), "count": f["count"]}
+                       for f in result["rating"] if f["_id"] is not None],
+            "price": [{"value": _price_label(f["_id"]), "count": f["count"]} for f in result["price"]],
+        },
+    }
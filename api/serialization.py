@@ -0,0 +1,59 @@
+"""
+Validation-free serialization of book documents for the read endpoints.
+
+Documents come from our own collection, written by the crawler as BookRecords
+through db.book_document, so the API does not re-validate them through BookOut
+on every request.
+Queries project exactly the BookOut fields and the documents are encoded
+straight to JSON bytes with orjson (stdlib json when orjson is missing).
+"""
+import json
+
+from .pagination import SORT_MAP
+from .schemas import BookOut
+
+try:
+    import orjson
+except ImportError:  # optional, stdlib json is the fallback
+    orjson = None
+
+BOOK_FIELDS = tuple(BookOut.model_fields)
+
+# only what BookOut returns; everything else (_id, page HTML refs, validators,
+# fingerprints) stays in the database
+BOOK_PROJECTION = {"_id": 0, **{f: 1 for f in BOOK_FIELDS}}
+
+def list_projection(sort_by):
+    """
+    BOOK_PROJECTION plus the sort field, which keyset cursors are built from.
+    """
+    field, _ = SORT_MAP[sort_by]
+    return {**BOOK_PROJECTION, field: 1}
+
+def book_out(doc):
+    """
+    The BookOut-shaped dict for a stored book document, without validation.
+    """
+    out = {f: doc.get(f) for f in BOOK_FIELDS}
+    out["book_id"] = str(out["book_id"])
+    return out
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")
+
+async def iter_ndjson(cursor, chunk_size=500):
+    """
+    Encode the documents of an async cursor as NDJSON, one book per line.
+    Lines are yielded in chunks of chunk_size books so memory stays flat for any
+    catalogue size while the per-chunk overhead stays small.
+    """
+    lines = []
+    async for doc in cursor:
+        lines.append(dumps(book_out(doc)))
+        if len(lines) >= chunk_size:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
@@ -0,0 +1,212 @@
+"""
+Load test for the Books API: N concurrent clients hammering a set of endpoints.
+
+    RATE_LIMIT_ENABLED=0 uvicorn api.main:app --workers 1
+    python -m benchmarks.api_load --url http://127.0.0.1:8000 --clients 200 --duration 30
+
+Every client loops over the request paths until the duration is up and the
+latency of each request is recorded. Reports throughput and p50/p95/p99/max
+latency, so runs against different builds or MONGO_MAX_POOL_SIZE settings can
+be compared. Non-2xx responses are counted as errors (turn the rate limiter off
+with RATE_LIMIT_ENABLED=0, or every client is throttled after 100 requests).
+
+Without a server or MongoDB, --in-process runs the app in this process over
+httpx's ASGI transport, on a mongomock catalogue of --books books whose queries
+each take --query-latency-ms. By default a query awaits its latency, as with
+AsyncMongoClient; --blocking sleeps on the event loop instead, as the
+synchronous MongoClient the API used before did. The response cache is off in
+this mode so every request reaches the database:
+
+    python -m benchmarks.api_load --in-process --clients 200 --duration 10
+    python -m benchmarks.api_load --in-process --blocking --clients 200 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import httpx
+
+DEFAULT_PATHS = [
+    "/books?page_size=20",
+    "/books?sort_by=price&page_size=20",
+    "/books?category=Poetry&sort_by=reviews",
+    "/changes?limit=20",
+]
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+async def client_loop(session, paths, deadline, latencies, errors, offset):
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            response = await session.get(path)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        latencies.append(time.perf_counter() - started)
+        if not ok:
+            errors.append(path)
+
+class MockCursor:
+    """
+    Async cursor over a mongomock cursor that pays the query latency once, when read.
+    """
+
+    def __init__(self, cursor, collection):
+        self._cursor = cursor
+        self._collection = collection
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def skip(self, n):
+        self._cursor = self._cursor.skip(n)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    async def to_list(self, length=None):
+        await self._collection.round_trip()
+        return list(self._cursor)
+
+class MockCollection:
+    """
+    The async collection methods the read endpoints use, over a mongomock collection.
+    """
+
+    def __init__(self, col, latency, blocking):
+        self._col = col
+        self.latency = latency
+        self.blocking = blocking
+
+    async def round_trip(self):
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+
+    def find(self, *args, **kwargs):
+        return MockCursor(self._col.find(*args, **kwargs), self)
+
+    async def find_one(self, *args, **kwargs):
+        await self.round_trip()
+        return self._col.find_one(*args, **kwargs)
+
+def in_process_db(books, latency, blocking):
+    """
+    A stand-in for api.database.Database on mongomock, seeded with books from
+    benchmarks.corpus and one change_log entry each.
+    """
+    import mongomock
+    from benchmarks.corpus import make_books
+
+    db = mongomock.MongoClient().db
+    now = datetime.utcnow()
+    docs, changes = [], []
+    for book in make_books(books):
+        price = book["price_incl_tax"]
+        docs.append({
+            **{k: book[k] for k in ("book_id", "name", "price_incl_tax", "price_excl_tax", "tax", "availability",
+                                    "product_description", "upc", "number_of_reviews")},
+            "price_incl_tax_pence": round(float(price) * 100),
+            "image_url": book["image"],
+            "product_page_url": f"https://books.toscrape.com/catalogue/{book['slug']}/index.html",
+            "crawl_metadata": {"category": book["category"], "rating": book["rating"]},
+        })
+        changes.append({"book_id": book["book_id"], "change_type": "insert",
+                        "timestamp": now - timedelta(seconds=len(changes)), "new_value": {"name": book["name"]}})
+    db.books.insert_many(docs)
+    db.change_log.insert_many(changes)
+    wrap = lambda col: MockCollection(col, latency, blocking)
+    return SimpleNamespace(books=wrap(db.books), changes=wrap(db.change_log), cache_state=wrap(db.cache_state),
+                           price_history=wrap(db.price_history), price_stats=wrap(db.price_stats_daily))
+
+def in_process_app(books, latency, blocking):
+    """
+    The API app with its database, cache and limiter replaced for --in-process.
+    """
+    from api.main import app
+    from api.database import get_db
+    from api.cache import ResponseCache, get_cache
+
+    db = in_process_db(books, latency, blocking)
+    cache = ResponseCache(max_entries=0)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_cache] = lambda: cache
+    app.state.limiter.enabled = False
+    return app
+
+async def run(url, clients, duration, paths, api_key=None, app=None):
+    headers = {"X-API-Key": api_key} if api_key else {}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    transport = httpx.ASGITransport(app=app) if app is not None else None
+    latencies, errors = [], []
+    async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=30,
+                                 transport=transport) as session:
+        # warm up connections and the server's Mongo pool
+        await asyncio.gather(*(session.get(paths[0]) for _ in range(min(clients, 20))), return_exceptions=True)
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(client_loop(session, paths, deadline, latencies, errors, n) for n in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    ms = lambda v: round(1000 * v, 2) if v is not None else None
+    return {
+        "url": url,
+        "clients": clients,
+        "duration_s": round(elapsed, 2),
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(max(latencies) if latencies else None),
+        "mean_ms": ms(statistics.fmean(latencies) if latencies else None),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--clients", type=int, default=200)
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds")
+    ap.add_argument("--path", action="append", dest="paths", help="request path, repeatable")
+    ap.add_argument("--in-process", action="store_true", help="run the app in this process on mongomock")
+    ap.add_argument("--books", type=int, default=100, help="catalogue size with --in-process")
+    ap.add_argument("--query-latency-ms", type=float, default=10.0, help="latency of each query with --in-process")
+    ap.add_argument("--blocking", action="store_true", help="with --in-process, block the event loop on queries")
+    ap.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = ap.parse_args()
+
+    app = None
+    if args.in_process:
+        app = in_process_app(args.books, args.query_latency_ms / 1000, args.blocking)
+    result = asyncio.run(run(args.url, args.clients, args.duration, args.paths or DEFAULT_PATHS,
+                             api_key=os.getenv("API_KEY"), app=app))
+    if args.in_process:
+        result.update(url="in-process", queries="blocking" if args.blocking else "async",
+                      query_latency_ms=args.query_latency_ms)
+    for key, value in result.items():
+        print(f"{key:>15}: {value}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Memory and CPU cost of the book objects the crawl passes from parse to write.
+
+    python -m benchmarks.book_record_bench --books 2000 --json record.json
+
+Parses synthetic product pages (corpus.py) with a parser backend and reports,
+per book:
+  bytes_per_book   memory held by one parsed book while it waits in the write
+                   buffer (tracemalloc; the page HTML it references is not counted)
+  parse_us         parse_book_page, HTML to book object
+  document_us      db.book_document, book object to the MongoDB document
+  encode_us        BSON encoding of the upsert ($set document)
+  parse_to_write_us  the three together, page to bytes on the wire
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+import bson
+
+from benchmarks.corpus import generate_site_pages
+from crawler import lxml_parser, parser as bs4_parser
+from crawler.db import book_document
+
+BACKENDS = {"bs4": bs4_parser.parse_book_page, "lxml": lxml_parser.parse_book_page}
+
+def _per_book_us(fn, items, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            fn(item)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(1e6 * best / len(items), 2)
+
+def bytes_per_book(parse_book, pages):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    books = [parse_book(html, url) for url, html in pages]
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del books
+    return round(held / len(pages))
+
+def run(backend, count, repeat):
+    parse_book = BACKENDS[backend]
+    pages = [(url, html) for url, html in generate_site_pages(count, per_page=20) if "/page-" not in url]
+    books = [parse_book(html, url) for url, html in pages]
+    docs = [book_document(b) for b in books]
+
+    def write(page):
+        url, html = page
+        return bson.encode({"$set": book_document(parse_book(html, url))})
+
+    return {
+        "backend": backend,
+        "books": len(pages),
+        "bytes_per_book": bytes_per_book(parse_book, pages),
+        "parse_us": _per_book_us(lambda p: parse_book(p[1], p[0]), pages, repeat),
+        "document_us": _per_book_us(book_document, books, repeat),
+        "encode_us": _per_book_us(lambda d: bson.encode({"$set": d}), docs, repeat),
+        "parse_to_write_us": _per_book_us(write, pages, repeat),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--books", type=int, default=2000)
+    ap.add_argument("--backend", nargs="+", default=["lxml"], choices=sorted(BACKENDS))
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = ap.parse_args()
+
+    results = [run(backend, args.books, args.repeat) for backend in args.backend]
+    print(f"{'backend':<9}{'books':>7}{'B/book':>9}{'parse us':>10}{'doc us':>9}{'encode us':>11}{'total us':>10}")
+    for r in results:
+        print(f"{r['backend']:<9}{r['books']:>7}{r['bytes_per_book']:>9}{r['parse_us']:>10}{r['document_us']:>9}"
+              f"{r['encode_us']:>11}{r['parse_to_write_us']:>10}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Synthetic books.toscrape pages for benchmarks and offline tests.
+
+Product pages are rendered from the real page stored in sample_structure.json,
+with the per-book values swapped in, so they have the same size and markup as
+the live site. List pages follow the live catalogue layout.
+"""
+import html
+import json
+import random
+from pathlib import Path
+
+SAMPLE_PATH = Path(__file__).resolve().parent.parent / "sample_structure.json"
+
+CATEGORIES = [
+    ("Travel", 2), ("Mystery", 3), ("Historical Fiction", 4), ("Sequential Art", 5),
+    ("Classics", 6), ("Philosophy", 7), ("Romance", 8), ("Womens Fiction", 9),
+    ("Fiction", 10), ("Childrens", 11), ("Religion", 12), ("Nonfiction", 13),
+]
+RATINGS = ["One", "Two", "Three", "Four", "Five"]
+
+_sample = None
+
+def load_sample():
+    global _sample
+    if _sample is None:
+        with open(SAMPLE_PATH, encoding="utf-8") as f:
+            _sample = json.load(f)
+    return _sample
+
+def category_slug(name, category_id):
+    return f"{name.lower().replace(' ', '-')}_{category_id}"
+
+def _book(i, rng, words):
+    sample = load_sample()
+    category, category_id = CATEGORIES[rng.randrange(len(CATEGORIES))]
+    price = f"{rng.randint(1000, 5999) / 100:.2f}"
+    start = rng.randrange(len(words))
+    return {
+        "book_id": str(i),
+        "name": f"{sample['name']} Vol. {i}",
+        "slug": f"book-{i}_{i}",
+        "price_incl_tax": price,
+        "price_excl_tax": price,
+        "tax": "0.00",
+        "availability": f"In stock ({rng.randint(1, 22)} available)",
+        "product_description": " ".join(words[start:] + words[:start]),
+        "upc": f"{rng.getrandbits(64):016x}",
+        "number_of_reviews": rng.randint(0, 5),
+        "rating": rng.randint(1, 5),
+        "category": category,
+        "category_id": category_id,
+        "image": f"{i % 256:02x}/{(i // 256) % 256:02x}/{rng.getrandbits(128):032x}.jpg",
+    }
+
+def make_books(count, seed=0):
+    """
+    Return count deterministic book dicts with varied prices, stock, reviews,
+    ratings and categories. Prices are plain "12.34" strings (no currency sign).
+    """
+    rng = random.Random(seed)
+    words = load_sample()["product_description"].split()
+    return [_book(i, rng, words) for i in range(1, count + 1)]
+
+def make_book(index, seed=0):
+    """
+    Book number index (1-based) on its own, for catalogues too large to build
+    up front. Deterministic per (seed, index), but not the same values as
+    make_books gives for that index.
+    """
+    return _book(index, random.Random(f"{seed}:{index}"), load_sample()["product_description"].split())
+
+def render_book_page(book):
+    """
+    Render the product page for one book dict from make_books.
+    """
+    sample = load_sample()
+    page = sample["raw_html"]
+    replacements = [
+        (html.escape(sample["name"], quote=False).replace("'", "&#39;"), html.escape(book["name"], quote=False)),
+        (sample["product_description"], html.escape(book["product_description"], quote=False)),
+        ("a-girls-guide-to-moving-on-new-beginnings-2_359", book["slug"]),
+        ("cf3b86489890b9f2", book["upc"]),
+        ('<p class="price_color">£31.30</p>', f'<p class="price_color">£{book["price_incl_tax"]}</p>'),
+        ("<th>Price (excl. tax)</th><td>£31.30</td>", f"<th>Price (excl. tax)</th><td>£{book['price_excl_tax']}</td>"),
+        ("<th>Price (incl. tax)</th><td>£31.30</td>", f"<th>Price (incl. tax)</th><td>£{book['price_incl_tax']}</td>"),
+        ("<th>Tax</th><td>£0.00</td>", f"<th>Tax</th><td>£{book['tax']}</td>"),
+        ("In stock (5 available)", book["availability"]),
+        ("<th>Number of reviews</th>\n                <td>0</td>",
+         f"<th>Number of reviews</th>\n                <td>{book['number_of_reviews']}</td>"),
+        ('../category/books/romance_8/index.html">Romance</a>',
+         f'../category/books/{category_slug(book["category"], book["category_id"])}/index.html">'
+         f'{html.escape(book["category"])}</a>'),
+        ("17/94/17940ad8d367ea5f28db57e7fc32dac9.jpg", book["image"]),
+    ]
+    for old, new in replacements:
+        page = page.replace(old, new)
+    # only the main product carries the book's rating; related products keep theirs
+    return page.replace('<p class="star-rating One">', f'<p class="star-rating {RATINGS[book["rating"] - 1]}">', 1)
+
+def render_list_page(books, page, pages, href_prefix=""):
+    """
+    Render catalogue list page number `page` of `pages` holding the given books.
+    Product links and the next link are relative to href_prefix, e.g. "catalogue/"
+    for the site root and "" for /catalogue/page-N.html.
+    """
+    articles = []
+    for book in books:
+        href = f"{href_prefix}{book['slug']}/index.html"
+        title = html.escape(book["name"])
+        articles.append(f"""
+            <li class="col-xs-6 col-sm-4 col-md-3 col-lg-3">
+    <article class="product_pod">
+            <div class="image_container">
+                    <a href="{href}"><img src="media/cache/{book['image']}" alt="{title}" class="thumbnail"></a>
+            </div>
+                <p class="star-rating {RATINGS[book['rating'] - 1]}">
+                    <i class="icon-star"></i>
+                </p>
+            <h3><a href="{href}" title="{title}">{title[:40]}...</a></h3>
+            <div class="product_price">
+        <p class="price_color">£{book['price_incl_tax']}</p>
+<p class="instock availability">
+    <i class="icon-ok"></i>
+        In stock
+</p>
+            </div>
+    </article>
+</li>""")
+    pager = f'<li class="current">\n            Page {page} of {pages}\n        </li>'
+    if page > 1:
+        pager = f'<li class="previous"><a href="{href_prefix}page-{page - 1}.html">previous</a></li>\n' + pager
+    if page < pages:
+        pager += f'\n<li class="next"><a href="{href_prefix}page-{page + 1}.html">next</a></li>'
+    return f"""<!DOCTYPE html>
+<html lang="en-us" class="no-js">
+<head><title>All products | Books to Scrape - Sandbox</title></head>
+<body id="default" class="default">
+<div class="page_inner">
+<div class="page-header action"><h1>All products</h1></div>
+<section>
+    <div>
+        <ol class="row">{''.join(articles)}
+        </ol>
+            <div>
+                <ul class="pager">
+        {pager}
+                </ul>
+            </div>
+    </div>
+</section>
+</div>
+</body>
+</html>
+"""
+
+def generate_site_pages(count, per_page=20, seed=0, base_url="https://books.toscrape.com/"):
+    """
+    Yield (url, html) for every list and product page of a catalogue of count books.
+    """
+    books = make_books(count, seed=seed)
+    pages = max(1, -(-len(books) // per_page))
+    for page in range(1, pages + 1):
+        chunk = books[(page - 1) * per_page:page * per_page]
+        yield f"{base_url}catalogue/page-{page}.html", render_list_page(chunk, page, pages)
+    for book in books:
+        yield f"{base_url}catalogue/{book['slug']}/index.html", render_book_page(book)
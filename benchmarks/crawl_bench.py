@@ -0,0 +1,208 @@
+"""
+End-to-end crawl benchmark against the local stand-in site.
+
+    python -m benchmarks.crawl_bench --books 5000 --workers 50 --save benchmarks/results
+    python -m benchmarks.crawl_bench --books 5000 --compare benchmarks/results/<earlier>.json
+
+Starts benchmarks.standin_site in a subprocess (so its rendering does not count
+against the crawler's CPU time; pass --url to crawl a site that is already
+running), then runs crawler.main.crawl over it and saves the books to mongomock
+or, with --mongo-uri, to a scratch database on a real server.
+
+Reports books/sec, CPU time per page (crawler process plus parse workers), peak
+RSS and the database write rate. --save writes the result as JSON named after
+the current commit so regressions can be compared across commits, and
+--compare prints the change of each number against an earlier result.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import httpx
+
+from benchmarks.standin_site import add_site_arguments
+from crawler.db import BookWriter
+from crawler.main import crawl
+
+# (key, higher is better)
+COMPARED = [("books_per_s", True), ("cpu_ms_per_page", False), ("peak_rss_mb", False), ("db_docs_per_s", True)]
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_site(args):
+    port = _free_port()
+    cmd = [sys.executable, "-m", "benchmarks.standin_site", "--port", str(port), "--books", str(args.books),
+           "--per-page", str(args.per_page), "--latency", str(args.latency), "--error-rate", str(args.error_rate),
+           "--retry-after", str(args.retry_after), "--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}/"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url + "catalogue/page-1.html", timeout=1)
+            return proc, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("stand-in site did not start")
+
+class _UpdateOneBulk:
+    """
+    A mongomock collection whose bulk_write applies UpdateOne ops one at a
+    time: mongomock 4.3 cannot take the ops of current pymongo releases (they
+    pass a sort option its bulk builder does not know).
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            self._collection.update_one(op._filter, op._doc, upsert=op._upsert)
+
+def collections(mongo_uri, db_name):
+    """
+    The books, change_log and raw_pages collections to write to, emptied.
+    """
+    if mongo_uri:
+        from pymongo import MongoClient
+        db = MongoClient(mongo_uri)[db_name]
+    else:
+        import mongomock
+        db = mongomock.MongoClient()[db_name]
+    for name in ("books", "change_log", "raw_pages", "price_history"):
+        db.drop_collection(name)
+    books = db.books if mongo_uri else _UpdateOneBulk(db.books)
+    return SimpleNamespace(books=books, change_log=db.change_log, raw_pages=db.raw_pages)
+
+def _cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+async def run(url, db, workers, parser_backend, parse_workers, discovery, max_connections, rate_limit):
+    writer = BookWriter(books_collection=db.books, changes_collection=db.change_log, pages_collection=db.raw_pages)
+    cpu_before = _cpu_seconds()
+    started = time.perf_counter()
+    stats = await crawl([url], workers=workers, report_interval=None, parser_backend=parser_backend,
+                        parse_workers=parse_workers, discovery=discovery, max_connections=max_connections,
+                        rate_limit=rate_limit, writer=writer)
+    elapsed = time.perf_counter() - started
+    cpu = _cpu_seconds() - cpu_before
+
+    pages = stats.list_pages + stats.book_pages
+    written = stats.writer["docs_written"]
+    flush_seconds = stats.writer["avg_flush_ms"] * stats.writer["batches"] / 1000
+    # ru_maxrss is in kilobytes on Linux
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "list_pages": stats.list_pages,
+        "book_pages": stats.book_pages,
+        "books_saved": stats.books_saved,
+        "errors": stats.errors,
+        "books_per_s": round(stats.books_saved / elapsed, 1) if elapsed else 0.0,
+        "pages_per_s": round(pages / elapsed, 1) if elapsed else 0.0,
+        "cpu_s": round(cpu, 2),
+        "cpu_ms_per_page": round(1000 * cpu / pages, 3) if pages else None,
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "db_batches": stats.writer["batches"],
+        "db_docs_per_s": round(written / elapsed, 1) if elapsed else 0.0,
+        "db_docs_per_flush_s": round(written / flush_seconds, 1) if flush_seconds else None,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(result, baseline):
+    lines = []
+    for key, higher_is_better in COMPARED:
+        old, new = baseline["result"].get(key), result["result"].get(key)
+        if not old or new is None:
+            continue
+        change = 100 * (new - old) / old
+        better = change > 0 if higher_is_better else change < 0
+        lines.append(f"  {key:<16} {old:>10} -> {new:<10} {change:+6.1f}% {'better' if better else 'worse'}")
+    return "\n".join(lines)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_site_arguments(ap)
+    ap.add_argument("--url", help="crawl this site instead of starting the stand-in")
+    ap.add_argument("--workers", type=int, default=20)
+    ap.add_argument("--parser", default="lxml", choices=["bs4", "lxml"])
+    ap.add_argument("--parse-workers", type=int, default=0)
+    ap.add_argument("--discovery", default="pager", choices=["serial", "pager"])
+    ap.add_argument("--max-connections", type=int, default=None)
+    ap.add_argument("--rate-limit", type=float, default=None)
+    ap.add_argument("--mongo-uri", default=None, help="real MongoDB to write to (default: mongomock)")
+    ap.add_argument("--db-name", default="crawl_bench")
+    ap.add_argument("--save", metavar="DIR", help="write the result as JSON into DIR")
+    ap.add_argument("--compare", metavar="FILE", help="earlier --save result to compare against")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    proc = None
+    url = args.url
+    if not url:
+        proc, url = start_site(args)
+    try:
+        db = collections(args.mongo_uri, args.db_name)
+        result = asyncio.run(run(url, db, args.workers, args.parser, args.parse_workers, args.discovery,
+                                 args.max_connections, args.rate_limit))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    record = {
+        "benchmark": "crawl",
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("save", "compare", "json")},
+        "mongo": "real" if args.mongo_uri else "mongomock",
+        "result": result,
+    }
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+        path = os.path.join(args.save, f"crawl_{record['timestamp'].replace(':', '')}_{record['commit']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(record, f, indent=2)
+        print(f"saved {path}")
+    if args.json:
+        print(json.dumps(record, indent=2))
+    else:
+        r = result
+        print(f"{r['books_saved']} books from {r['list_pages']} list + {r['book_pages']} product pages "
+              f"in {r['elapsed_s']}s ({r['errors']} errors)")
+        print(f"  books/sec        {r['books_per_s']}")
+        print(f"  CPU ms/page      {r['cpu_ms_per_page']}")
+        print(f"  peak RSS MB      {r['peak_rss_mb']}")
+        print(f"  DB docs/sec      {r['db_docs_per_s']} ({r['db_batches']} batches)")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"vs {baseline['commit']} ({baseline['timestamp']}):")
+        print(compare(record, baseline))
+
+if __name__ == "__main__":
+    main()
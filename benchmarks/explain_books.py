@@ -0,0 +1,50 @@
+"""
+Print the winning plan of representative GET /books queries.
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.explain_books
+
+Runs explain() for every filter + sort combination the endpoint supports
+against the configured books collection (after creating the API indexes) and
+flags any plan that falls back to COLLSCAN or an in-memory SORT.
+"""
+import itertools
+import os
+
+from pymongo import MongoClient
+
+from api.pagination import SORT_MAP, sort_spec, sort_indexes
+
+FILTERS = {
+    "none": {},
+    "category": {"crawl_metadata.category": "Mystery"},
+    "rating": {"crawl_metadata.rating": 4},
+    "price": {"price_incl_tax_pence": {"$gte": 1000, "$lte": 3000}},
+    "category+price": {"crawl_metadata.category": "Mystery", "price_incl_tax_pence": {"$gte": 1000}},
+}
+
+def stages(plan):
+    found = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            found += stages(plan[key])
+    for child in plan.get("inputStages", []):
+        found += stages(child)
+    return [s for s in found if s]
+
+def main():
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    col = client[os.getenv("DB_NAME", "default_db")][os.getenv("COLLECTION_NAME", "books")]
+    for keys, name in sort_indexes():
+        col.create_index(keys, name=name)
+
+    bad = 0
+    for (filter_name, query), sort_by in itertools.product(FILTERS.items(), SORT_MAP):
+        plan = col.find(query).sort(sort_spec(sort_by)).limit(20).explain()["queryPlanner"]["winningPlan"]
+        found = stages(plan)
+        flag = "COLLSCAN" in found or "SORT" in found
+        bad += flag
+        print(f"{'!!' if flag else 'ok'} {filter_name:<15} sort={sort_by:<8} {' <- '.join(found)}")
+    raise SystemExit(1 if bad else 0)
+
+if __name__ == "__main__":
+    main()
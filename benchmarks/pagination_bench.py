@@ -0,0 +1,89 @@
+"""
+Compare skip/limit and keyset (cursor) pagination for GET /books queries.
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.pagination_bench --books 120000
+
+Seeds a scratch collection with synthetic books, creates the API's sort indexes
+and times fetching page 1 and page 5000 (page_size 20) under both schemes.
+Needs a running mongod; the scratch collection is dropped afterwards.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+from pymongo import MongoClient
+
+from api.pagination import SORT_MAP, sort_spec, sort_indexes, encode_cursor, decode_cursor, keyset_filter
+
+def seed(col, count):
+    rng = random.Random(0)
+    col.drop()
+    batch = []
+    for i in range(count):
+        batch.append({
+            "book_id": str(i),
+            "name": f"Book {i}",
+            "price_incl_tax": rng.randint(1000, 5999) / 100,
+            "number_of_reviews": rng.randint(0, 50),
+            "crawl_metadata": {"rating": rng.randint(1, 5)},
+        })
+        if len(batch) == 10000:
+            col.insert_many(batch)
+            batch = []
+    if batch:
+        col.insert_many(batch)
+    for keys, name in sort_indexes():
+        col.create_index(keys, name=name)
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return round(1000 * statistics.median(samples), 2)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--books", type=int, default=120000)
+    ap.add_argument("--page-size", type=int, default=20)
+    ap.add_argument("--deep-page", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=15)
+    ap.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = ap.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    col = client[os.getenv("DB_NAME", "default_db")]["bench_pagination"]
+    seed(col, args.books)
+
+    results = []
+    try:
+        for sort_by in SORT_MAP:
+            spec = sort_spec(sort_by)
+            for page in (1, args.deep_page):
+                skip = (page - 1) * args.page_size
+                skip_ms = timed(lambda: list(col.find({}).sort(spec).skip(skip).limit(args.page_size)), args.repeat)
+                if page == 1:
+                    query = {}
+                else:
+                    # the cursor a client would hold after reading the previous page
+                    last = next(col.find({}).sort(spec).skip(skip - 1).limit(1))
+                    cursor = encode_cursor(sort_by, last)
+                    query = keyset_filter(sort_by, *decode_cursor(cursor, sort_by))
+                keyset_ms = timed(lambda: list(col.find(query).sort(spec).limit(args.page_size)), args.repeat)
+                results.append({"sort_by": sort_by, "page": page, "skip_ms": skip_ms, "keyset_ms": keyset_ms})
+    finally:
+        col.drop()
+
+    print(f"{'sort_by':<10}{'page':>8}{'skip ms':>10}{'keyset ms':>11}")
+    for r in results:
+        print(f"{r['sort_by']:<10}{r['page']:>8}{r['skip_ms']:>10}{r['keyset_ms']:>11}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare the HTML parser backends over a synthetic books.toscrape corpus.
+
+    python -m benchmarks.parser_bench --books 500
+
+Reports pages/sec for list and product pages, plus bytes allocated and peak
+traced memory per page (measured in a separate tracemalloc pass so tracing
+overhead doesn't skew the throughput numbers).
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from crawler import parser as bs4_parser
+from crawler import lxml_parser
+from benchmarks.corpus import generate_site_pages
+
+BACKENDS = {
+    "bs4": (bs4_parser.parse_list_page, bs4_parser.parse_book_page),
+    "lxml": (lxml_parser.parse_list_page, lxml_parser.parse_book_page),
+}
+
+def _run(pages, parse_list, parse_book):
+    for url, html, is_list in pages:
+        if is_list:
+            parse_list(html, url)
+        else:
+            parse_book(html, url)
+
+def bench_backend(name, pages, repeat):
+    parse_list, parse_book = BACKENDS[name]
+    _run(pages[:5], parse_list, parse_book)  # warm up imports and caches
+
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _run(pages, parse_list, parse_book)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    peaks = 0
+    for url, html, is_list in pages:
+        snapshot_before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        if is_list:
+            parse_list(html, url)
+        else:
+            parse_book(html, url)
+        peaks += tracemalloc.get_traced_memory()[1] - snapshot_before
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "backend": name,
+        "pages": len(pages),
+        "seconds": round(best, 4),
+        "pages_per_second": round(len(pages) / best, 1),
+        "peak_bytes_per_page": peaks // len(pages),
+        "peak_traced_bytes": peak - before,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--books", type=int, default=500)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    ap.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = ap.parse_args()
+
+    pages = [(url, html, "/page-" in url) for url, html in generate_site_pages(args.books)]
+    results = [bench_backend(name, pages, args.repeat) for name in args.backends]
+
+    print(f"{'backend':<8}{'pages':>8}{'seconds':>10}{'pages/s':>10}{'peak B/page':>14}")
+    for r in results:
+        print(f"{r['backend']:<8}{r['pages']:>8}{r['seconds']:>10}{r['pages_per_second']:>10}{r['peak_bytes_per_page']:>14}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Store round trips of the API rate limiter at the limits the routes use.
+
+    python -m benchmarks.ratelimit_bench --limits 10/hour 100/hour 100000/hour --load 1 10
+
+For each limit, one client key sends evenly spaced requests for one period,
+at load times the limit, round-robin over --workers API workers that share one
+store (as they share Redis). Time is simulated, so an hour takes seconds.
+Reports how many requests were allowed, how many store round trips (acquire
+plus refund, each one Lua call on Redis) the checks cost and the share of
+checks answered without the store.
+"""
+import argparse
+import asyncio
+import json
+
+from api.ratelimit import Limit, LocalStore, RateLimiter
+
+class CountingStore(LocalStore):
+    def __init__(self, clock):
+        super().__init__(clock=clock)
+        self.round_trips = 0
+
+    async def acquire(self, key, limit, tokens):
+        self.round_trips += 1
+        return await super().acquire(key, limit, tokens)
+
+    async def refund(self, key, limit, tokens):
+        self.round_trips += 1
+        await super().refund(key, limit, tokens)
+
+async def run(spec, load, workers, lease_ttl):
+    limit = Limit.parse(spec)
+    now = [0.0]
+    clock = lambda: now[0]
+    store = CountingStore(clock)
+    limiters = [RateLimiter(store, lease_ttl=lease_ttl, clock=clock) for _ in range(workers)]
+    checks = int(limit.amount * load)
+    allowed = 0
+    for i in range(checks):
+        now[0] = i * limit.period / checks
+        ok, _ = await limiters[i % workers].hit("key:bench", limit)
+        allowed += ok
+    # checks that needed the store made one acquire each, plus a refund if a lease had expired
+    answered_locally = checks - sum(l.store_calls for l in limiters)
+    return {
+        "limit": spec,
+        "load": load,
+        "checks": checks,
+        "allowed": allowed,
+        "lease_size": limiters[0].lease_size(limit),
+        "round_trips": store.round_trips,
+        "round_trips_per_check": round(store.round_trips / checks, 4),
+        "local_ratio": round(answered_locally / checks, 3),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--limits", nargs="+", default=["10/hour", "100/hour", "100000/hour"])
+    ap.add_argument("--load", type=float, nargs="+", default=[1, 10], help="request rate as a multiple of the limit")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--lease-ttl", type=float, default=1.0)
+    ap.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = ap.parse_args()
+
+    results = [asyncio.run(run(spec, load, args.workers, args.lease_ttl)) for spec in args.limits for load in args.load]
+    print(f"{'limit':<13}{'load':>6}{'checks':>10}{'allowed':>9}{'lease':>7}{'round trips':>13}{'per check':>11}{'local':>8}")
+    for r in results:
+        print(f"{r['limit']:<13}{r['load']:>6}{r['checks']:>10}{r['allowed']:>9}{r['lease_size']:>7}"
+              f"{r['round_trips']:>13}{r['round_trips_per_check']:>11}{r['local_ratio']:>8}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Size and latency of the books collection with raw_html inlined vs referenced.
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.raw_html_bench --books 50000
+
+Loads the same synthetic catalogue twice: once the old way (page HTML inside
+each book document, full documents read by the API) and once the new way
+(HTML compressed in raw_pages, books keep a reference, API reads projected).
+Reports collection sizes and median latency of the /books and /books/{id}
+queries. Needs a running mongod; scratch collections are dropped afterwards.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+from pymongo import MongoClient
+
+from api.main import BOOK_PROJECTION
+from api.pagination import sort_spec, sort_indexes
+from benchmarks.corpus import make_books, render_book_page
+from crawler.blobstore import store_pages
+from crawler.db import hash_text
+
+def load(books_col, pages_col, books, inline):
+    books_col.drop()
+    if pages_col is not None:
+        pages_col.drop()
+    batch, pages = [], []
+    for book in books:
+        html = render_book_page(book)
+        doc = {k: v for k, v in book.items() if k not in ("slug", "image", "rating", "category", "category_id")}
+        doc["crawl_metadata"] = {"rating": book["rating"], "category": book["category"]}
+        if inline:
+            doc["raw_html"] = html
+        else:
+            doc["raw_html_ref"] = hash_text(html)
+            pages.append((doc["raw_html_ref"], html))
+        batch.append(doc)
+        if len(batch) == 1000:
+            if pages:
+                store_pages(pages_col, pages)
+            books_col.insert_many(batch)
+            batch, pages = [], []
+    if pages:
+        store_pages(pages_col, pages)
+    if batch:
+        books_col.insert_many(batch)
+    books_col.create_index("book_id", unique=True)
+    for keys, name in sort_indexes():
+        books_col.create_index(keys, name=name)
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return round(1000 * statistics.median(samples), 3)
+
+def sizes(db, name):
+    stats = db.command("collStats", name)
+    return {"size_mb": round(stats["size"] / 2**20, 1), "storage_mb": round(stats["storageSize"] / 2**20, 1),
+            "avg_obj_bytes": int(stats.get("avgObjSize", 0)), "index_mb": round(stats["totalIndexSize"] / 2**20, 1)}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--books", type=int, default=50000)
+    ap.add_argument("--repeat", type=int, default=50)
+    ap.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = ap.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    db = client[os.getenv("DB_NAME", "default_db")]
+    books = make_books(args.books)
+    rng = random.Random(1)
+    ids = [str(rng.randint(1, args.books)) for _ in range(args.repeat)]
+
+    results = {}
+    try:
+        for label, inline in (("inline", True), ("referenced", False)):
+            books_col = db[f"bench_books_{label}"]
+            pages_col = None if inline else db["bench_raw_pages"]
+            load(books_col, pages_col, books, inline)
+            projection = None if inline else BOOK_PROJECTION
+            id_iter = iter(ids * 2)
+            results[label] = {
+                "books": sizes(db, books_col.name),
+                "raw_pages": sizes(db, pages_col.name) if pages_col is not None else None,
+                "list_page_ms": timed(lambda: list(books_col.find({}, projection).sort(sort_spec("rating")).limit(20)), args.repeat),
+                "get_book_ms": timed(lambda: books_col.find_one({"book_id": next(id_iter)}, projection), args.repeat),
+            }
+    finally:
+        for name in ("bench_books_inline", "bench_books_referenced", "bench_raw_pages"):
+            db[name].drop()
+
+    print(json.dumps(results, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Show that daily report generation runs in constant memory.
+
+    python -m benchmarks.report_bench --sizes 1000 100000 1000000
+
+Feeds generate_daily_change_report a synthetic change_log whose cursor yields
+documents lazily (like a Mongo cursor with a batch size), and reports rows/sec
+and the peak traced memory for each volume.
+"""
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from crawler.report import generate_daily_change_report
+
+class SyntheticCursor:
+    def __init__(self, count, now):
+        self.count = count
+        self.now = now
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def __iter__(self):
+        start = self.now - timedelta(hours=23)
+        for i in range(self.count):
+            yield {
+                "book_id": str(i % 50000),
+                "change_type": "price_change",
+                "timestamp": start + timedelta(microseconds=i),
+                "old_value": {"price_incl_tax": f"{10 + i % 40}.00"},
+                "new_value": {"price_incl_tax": f"{11 + i % 40}.00"},
+            }
+
+class SyntheticChangeLog:
+    def __init__(self, count, now):
+        self.count = count
+        self.now = now
+
+    def find(self, query, projection=None, batch_size=None):
+        return SyntheticCursor(self.count, self.now)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    ap.add_argument("--gzip", action="store_true")
+    ap.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = ap.parse_args()
+
+    now = datetime.utcnow()
+    results = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as out:
+            tracemalloc.start()
+            started = time.perf_counter()
+            generate_daily_change_report(out, compress=args.gzip, changes_collection=SyntheticChangeLog(size, now), now=now)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        results.append({
+            "rows": size,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(size / elapsed, 1),
+            "peak_traced_bytes": peak,
+        })
+
+    print(f"{'rows':>10}{'seconds':>10}{'rows/s':>12}{'peak KiB':>10}")
+    for r in results:
+        print(f"{r['rows']:>10}{r['seconds']:>10}{r['rows_per_second']:>12}{r['peak_traced_bytes'] // 1024:>10}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
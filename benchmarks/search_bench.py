@@ -0,0 +1,116 @@
+"""
+Latency of GET /books/search queries (results page plus facets) as the catalogue grows.
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.search_bench --books 100000 1000000
+
+For each size, seeds a scratch collection with synthetic books (corpus.py
+categories, prices and ratings; descriptions drawn from the sample page's
+words plus a Zipf-distributed vocabulary, so queries range from very common to
+rare terms), builds the API's text index and runs the endpoint's aggregation
+pipeline for a set of queries. Reports median and p95 milliseconds, the match
+count and the text index size. Needs a running mongod; the scratch collection
+is dropped afterwards.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+from pymongo import MongoClient
+
+from api.search import search_pipeline, text_index
+from api.pagination import sort_indexes
+from benchmarks.corpus import CATEGORIES, load_sample
+
+VOCABULARY = 20000
+
+# name -> (q, filters)
+QUERIES = {
+    "common word": ("book", {}),
+    "rare word": ("term4000", {}),
+    "two words": ("term10 term200", {}),
+    "common + category": ("book", {"crawl_metadata.category": "Mystery"}),
+    "mid + price range": ("term50", {"price_incl_tax_pence": {"$gte": 1000, "$lte": 2000}}),
+}
+
+def _zipf_term(rng):
+    # rank r is drawn with probability ~ 1/r
+    return f"term{int(VOCABULARY ** rng.random())}"
+
+def seed(col, count):
+    rng = random.Random(0)
+    sample = load_sample()["product_description"].split()
+    col.drop()
+    batch = []
+    for i in range(count):
+        category, _ = CATEGORIES[rng.randrange(len(CATEGORIES))]
+        words = rng.sample(sample, 40) + [_zipf_term(rng) for _ in range(8)]
+        batch.append({
+            "book_id": str(i),
+            "name": f"Book {i} {_zipf_term(rng)}",
+            "product_description": " ".join(words),
+            "product_page_url": f"https://books.toscrape.com/catalogue/book_{i}/index.html",
+            "price_incl_tax_pence": rng.randint(1000, 5999),
+            "number_of_reviews": rng.randint(0, 5),
+            "crawl_metadata": {"category": category, "rating": rng.randint(1, 5)},
+        })
+        if len(batch) == 10000:
+            col.insert_many(batch)
+            batch = []
+    if batch:
+        col.insert_many(batch)
+    for keys, name in sort_indexes():
+        col.create_index(keys, name=name)
+    keys, options = text_index()
+    col.create_index(keys, **options)
+
+def run_query(col, q, filters, page_size):
+    result, = col.aggregate(search_pipeline(q, filters, limit=page_size))
+    return result["total"][0]["count"] if result["total"] else 0
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(1000 * (time.perf_counter() - started))
+    samples.sort()
+    return round(statistics.median(samples), 2), round(samples[int(0.95 * (len(samples) - 1))], 2)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--books", type=int, nargs="+", default=[100000, 1000000])
+    ap.add_argument("--page-size", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = ap.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    db = client[os.getenv("DB_NAME", "default_db")]
+    col = db["bench_search"]
+
+    results = []
+    try:
+        for count in args.books:
+            seed(col, count)
+            index_mb = db.command("collStats", col.name)["indexSizes"][text_index()[1]["name"]] / 2 ** 20
+            for name, (q, filters) in QUERIES.items():
+                matches = run_query(col, q, filters, args.page_size)
+                p50, p95 = timed(lambda: run_query(col, q, filters, args.page_size), args.repeat)
+                results.append({"books": count, "query": name, "matches": matches, "p50_ms": p50, "p95_ms": p95,
+                                "text_index_mb": round(index_mb, 1)})
+    finally:
+        col.drop()
+
+    print(f"{'books':>9}  {'query':<20}{'matches':>9}{'p50 ms':>9}{'p95 ms':>9}{'index MB':>10}")
+    for r in results:
+        print(f"{r['books']:>9}  {r['query']:<20}{r['matches']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+              f"{r['text_index_mb']:>10}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Serialization cost of a /books response, per 100 books.
+
+    python -m benchmarks.serialize_bench --books 100 --repeat 2000
+
+Compares the old response path (a BookOut per document, then FastAPI's
+response_model validation and jsonable_encoder + json.dumps) with the fast path
+in api/serialization.py (projected dicts encoded by orjson, or stdlib json when
+orjson is not installed). Documents are built from the synthetic corpus in the
+shape the crawler stores them, including the fields the old projection let through.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from api import serialization
+from api.schemas import BookOut
+from benchmarks.corpus import make_books
+
+def stored_docs(count):
+    docs = []
+    for book in make_books(count):
+        doc = {k: v for k, v in book.items() if k not in ("slug", "image", "rating", "category", "category_id")}
+        doc.update({
+            "image_url": f"https://books.toscrape.com/media/cache/{book['image']}",
+            "product_page_url": f"https://books.toscrape.com/catalogue/{book['slug']}/index.html",
+            "price_incl_tax_pence": int(float(book["price_incl_tax"]) * 100),
+            "price_excl_tax_pence": int(float(book["price_excl_tax"]) * 100),
+            "crawl_metadata": {"rating": book["rating"], "category": book["category"]},
+        })
+        docs.append(doc)
+    return docs
+
+def pydantic_path(docs, adapter):
+    results = [BookOut(**{**doc, "book_id": str(doc["book_id"])}) for doc in docs]
+    # what FastAPI does with a response_model: validate, encode, dump
+    return json.dumps(jsonable_encoder(adapter.validate_python(results))).encode("utf-8")
+
+def fast_path(docs):
+    return serialization.dumps([serialization.book_out(doc) for doc in docs])
+
+def stdlib_path(docs):
+    return json.dumps([serialization.book_out(doc) for doc in docs], separators=(",", ":")).encode("utf-8")
+
+def per_100(fn, docs, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(docs)
+        samples.append(time.perf_counter() - started)
+    return round(1e6 * statistics.median(samples) * 100 / len(docs), 1)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--books", type=int, default=100)
+    ap.add_argument("--repeat", type=int, default=2000)
+    ap.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = ap.parse_args()
+
+    docs = stored_docs(args.books)
+    adapter = TypeAdapter(list[BookOut])
+    assert json.loads(pydantic_path(docs, adapter)) == json.loads(fast_path(docs))
+
+    results = {
+        "books": args.books,
+        "orjson": serialization.orjson is not None,
+        "us_per_100_books": {
+            "pydantic_response_model": per_100(lambda d: pydantic_path(d, adapter), docs, args.repeat),
+            "fast_path": per_100(fast_path, docs, args.repeat),
+            "fast_path_stdlib_json": per_100(stdlib_path, docs, args.repeat),
+        },
+    }
+    print(json.dumps(results, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
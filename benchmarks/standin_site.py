@@ -0,0 +1,118 @@
+"""
+Local stand-in for books.toscrape.com, for offline crawls and benchmarks.
+
+    python -m benchmarks.standin_site --books 100000 --latency 0.05 --error-rate 0.01 --port 8081
+
+Pages are rendered on request from sample_structure.json (see corpus.py), so a
+catalogue of 1M books costs no memory up front. The site root and
+/catalogue/page-N.html are the list pages, /catalogue/book-N_N/index.html the
+product pages. Every response can be delayed by --latency seconds (+/- 50%
+jitter) and answered with a 503 and a Retry-After of --retry-after seconds
+with probability --error-rate.
+"""
+import argparse
+import asyncio
+import random
+from functools import lru_cache
+
+from aiohttp import web
+
+from benchmarks.corpus import make_book, render_book_page, render_list_page
+
+class StandInSite:
+    """
+    Page generator and request handler for a catalogue of `books` books.
+    """
+
+    def __init__(self, books=1000, per_page=20, latency=0.0, error_rate=0.0, retry_after=0, seed=0):
+        self.books = books
+        self.per_page = per_page
+        self.pages = max(1, -(-books // per_page))
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        # hot list pages are rendered once, product pages are fetched once per crawl anyway
+        self.list_page = lru_cache(maxsize=256)(self._list_page)
+
+    def book(self, index):
+        return make_book(index, self.seed)
+
+    def _list_page(self, page, href_prefix):
+        first = (page - 1) * self.per_page + 1
+        books = [self.book(i) for i in range(first, min(first + self.per_page, self.books + 1))]
+        return render_list_page(books, page, self.pages, href_prefix)
+
+    def product_page(self, index):
+        return render_book_page(self.book(index))
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * self._rng.uniform(0.5, 1.5))
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503, headers={"Retry-After": str(self.retry_after)})
+        path = request.path
+        if path in ("/", "/index.html"):
+            body = self.list_page(1, "catalogue/")
+        elif path.startswith("/catalogue/page-") and path.endswith(".html"):
+            page = _int(path[len("/catalogue/page-"):-len(".html")])
+            if page is None or not 1 <= page <= self.pages:
+                raise web.HTTPNotFound()
+            body = self.list_page(page, "")
+        elif path.startswith("/catalogue/book-") and path.endswith("/index.html"):
+            index = _int(path[len("/catalogue/book-"):-len("/index.html")].partition("_")[0])
+            if index is None or not 1 <= index <= self.books:
+                raise web.HTTPNotFound()
+            body = self.product_page(index)
+        else:
+            raise web.HTTPNotFound()
+        return web.Response(text=body, content_type="text/html")
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", self.handle)
+        return app
+
+def _int(text):
+    return int(text) if text.isdigit() else None
+
+async def serve(site, host="127.0.0.1", port=0):
+    """
+    Start the site in the running event loop. Returns (runner, base_url);
+    stop it with `await runner.cleanup()`. port=0 picks a free port.
+    """
+    runner = web.AppRunner(site.app(), access_log=None)
+    await runner.setup()
+    tcp = web.TCPSite(runner, host, port)
+    await tcp.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}/"
+
+def add_site_arguments(ap):
+    ap.add_argument("--books", type=int, default=1000, help="catalogue size (1k-1M)")
+    ap.add_argument("--per-page", type=int, default=20)
+    ap.add_argument("--latency", type=float, default=0.0, help="mean response delay in seconds")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    ap.add_argument("--retry-after", type=int, default=0, help="Retry-After of those 503s, in seconds")
+    ap.add_argument("--seed", type=int, default=0)
+
+def site_from_args(args):
+    return StandInSite(args.books, args.per_page, args.latency, args.error_rate, args.retry_after, args.seed)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_site_arguments(ap)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    args = ap.parse_args()
+    site = site_from_args(args)
+    print(f"Serving {site.books} books on {site.pages} list pages at http://{args.host}:{args.port}/")
+    web.run_app(site.app(), host=args.host, port=args.port, access_log=None, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Cold start cost of the worker, crawler and API entry points.
+
+    python -m benchmarks.startup_bench --runs 7
+    python -X importtime -c "import scheduler.tasks" 2> importtime.log   # the full import tree
+
+For each entry module, starts fresh interpreters with -X importtime and
+reports the median cumulative import time, the number of modules loaded and
+which heavy dependencies came with it. Then measures per-task setup inside a
+started worker: what the first report and crawl task import and the first
+MongoDB client they build, and the same on a second task, which should reuse
+both. Nothing connects to a database (the client is created lazily, unconnected).
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+
+ENTRY_POINTS = ["scheduler.tasks", "crawler.report", "crawler.main", "api.main"]
+HEAVY = ["bs4", "httpx", "lxml", "pymongo", "pydantic", "prometheus_client", "structlog", "tenacity", "fastapi"]
+
+_IMPORTTIME = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| (\S+)$")
+
+_PROBE = """
+import json, sys
+import {module}
+print(json.dumps({{"modules": len(sys.modules), "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+_TASK_SETUP = """
+import json, time
+import scheduler.tasks
+
+def setup(what):
+    started = time.perf_counter()
+    if what == "report":
+        from crawler.report import generate_daily_change_report
+    else:
+        from crawler.main import crawl
+    from crawler.clients import get_collection
+    get_collection("change_log")
+    return round(1000 * (time.perf_counter() - started), 2)
+
+print(json.dumps({{"first_ms": setup("{task}"), "second_ms": setup("{task}")}}))
+"""
+
+def import_ms(module):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module, heavy=HEAVY)],
+                         capture_output=True, text=True, check=True)
+    cumulative = [int(m.group(1)) for line in out.stderr.splitlines()
+                  if (m := _IMPORTTIME.search(line)) and m.group(2) == module]
+    return cumulative[-1] / 1000, json.loads(out.stdout.strip().splitlines()[-1])
+
+def task_setup(task):
+    out = subprocess.run([sys.executable, "-c", _TASK_SETUP.format(task=task)], capture_output=True, text=True,
+                         check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--modules", nargs="+", default=ENTRY_POINTS)
+    ap.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = ap.parse_args()
+
+    imports = []
+    for module in args.modules:
+        samples = [import_ms(module) for _ in range(args.runs)]
+        imports.append({"module": module, "import_ms": round(statistics.median(ms for ms, _ in samples), 1),
+                        **samples[-1][1]})
+    setups = []
+    for task in ("report", "crawl"):
+        samples = [task_setup(task) for _ in range(args.runs)]
+        setups.append({"task": task, **{k: round(statistics.median(s[k] for s in samples), 2)
+                                         for k in ("first_ms", "second_ms")}})
+
+    print(f"{'module':<18}{'import ms':>10}{'modules':>9}  heavy dependencies loaded")
+    for r in imports:
+        print(f"{r['module']:<18}{r['import_ms']:>10}{r['modules']:>9}  {', '.join(r['heavy']) or '-'}")
+    print(f"\n{'task setup':<18}{'first ms':>10}{'second ms':>11}")
+    for r in setups:
+        print(f"{r['task']:<18}{r['first_ms']:>10}{r['second_ms']:>11}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"imports": imports, "task_setup": setups}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
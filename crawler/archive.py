@@ -0,0 +1,263 @@
+"""
+Append-only archive of fetched responses (WARC-style record/replay).
+
+With an archive the crawler keeps every product page response it fetches
+(URL, final URL, status, headers and the compressed body). A parser fix can then be
+re-applied to the whole snapshot with reparse.py, with no network involved.
+
+Layout of an archive directory:
+
+    segment-00001.arc, segment-00002.arc, ...   records, appended in fetch order
+    index.sqlite3                               url -> latest record (segment, offset, body hash)
+
+Several crawls can write to one archive at once (the shards of a distributed
+crawl) by giving each its own segment_prefix, e.g. shard-3-00001.arc; they
+share the index. Index rows are buffered and written in one short transaction
+per checkpoint, together with the fsync of the segment, so a writer holds the
+index's write lock only for that moment.
+
+A record is MAGIC, a little-endian (meta length, body length) header, the
+JSON metadata and the body compressed with blobstore.compress. Segments roll
+over at segment_size bytes and are read back through mmap, front to back.
+"""
+import json
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+from typing import NamedTuple
+from .blobstore import compress, decompress, DEFAULT_CODEC
+from .fetcher import body_hash
+
+MAGIC = b"ARC1"
+HEADER = struct.Struct("<4sIQ")
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".arc"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    url TEXT PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    body_hash TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    prefix TEXT NOT NULL DEFAULT 'segment-'
+);
+"""
+
+_SEGMENT_FILE = re.compile(r"^(.*?)(\d+)" + re.escape(SEGMENT_SUFFIX) + "$")
+
+class Record(NamedTuple):
+    url: str
+    final_url: str
+    status: int
+    headers: dict
+    fetched_at: float
+    body: str
+
+def _segment_name(number, prefix=SEGMENT_PREFIX):
+    return f"{prefix}{number:05d}{SEGMENT_SUFFIX}"
+
+def _encode(meta, body):
+    meta = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    return HEADER.pack(MAGIC, len(meta), len(body)) + meta + body
+
+def _decode(buf, offset):
+    """
+    Decode the record header at offset; returns (meta, body start, next offset).
+    """
+    magic, meta_len, body_len = HEADER.unpack_from(buf, offset)
+    if magic != MAGIC:
+        raise ValueError(f"Corrupt archive record at offset {offset}")
+    start = offset + HEADER.size
+    meta = json.loads(buf[start:start + meta_len])
+    return meta, start + meta_len, start + meta_len + body_len
+
+def _record(meta, body):
+    return Record(meta["url"], meta["final_url"], meta["status"], meta["headers"], meta["fetched_at"],
+                  decompress(body, meta["codec"]))
+
+class Archive:
+    """
+    Response archive in directory path, for writing (the crawl) and reading
+    (reparse). Only the latest record of a URL is indexed, and a body that
+    hashes the same as the one already archived for its URL is not appended
+    again, so re-crawls only grow the archive by what changed.
+    segment_prefix names the segments this writer appends to. Records become
+    durable every checkpoint_interval seconds (and on flush/close); methods may
+    be called from any thread, e.g. through asyncio.to_thread.
+    """
+
+    def __init__(self, path, segment_size=256 * 1024 * 1024, codec=DEFAULT_CODEC, checkpoint_interval=5.0,
+                 clock=time.time, segment_prefix=SEGMENT_PREFIX):
+        self.path = path
+        self.segment_prefix = segment_prefix
+        self.segment_size = segment_size
+        self.codec = codec
+        self.checkpoint_interval = checkpoint_interval
+        self._clock = clock
+        self._last_flush = clock()
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = {}  # url -> index row not yet written to index.sqlite3
+        self._db = sqlite3.connect(os.path.join(path, "index.sqlite3"), timeout=30.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        if "prefix" not in {row[1] for row in self._db.execute("PRAGMA table_info(records)")}:
+            # index of an archive written before segment prefixes
+            self._db.execute(f"ALTER TABLE records ADD COLUMN prefix TEXT NOT NULL DEFAULT '{SEGMENT_PREFIX}'")
+        segments = self.segments()
+        self._segment = segments[-1] if segments else 1
+        self._file = None
+        self.records_written = 0
+        self.records_skipped = 0
+
+    def segments(self, prefix=None):
+        """
+        Numbers of the segments named with prefix (this writer's by default).
+        """
+        prefix = prefix or self.segment_prefix
+        return sorted(number for p, number in self._segment_files() if p == prefix)
+
+    def _segment_files(self):
+        # (prefix, number) of every segment in the directory, whichever writer it belongs to
+        return sorted((m.group(1), int(m.group(2))) for m in map(_SEGMENT_FILE.match, os.listdir(self.path)) if m)
+
+    def _segment_path(self, number, prefix=None):
+        return os.path.join(self.path, _segment_name(number, prefix or self.segment_prefix))
+
+    def _writable(self, size):
+        if self._file is None:
+            self._file = open(self._segment_path(self._segment), "ab")
+        if self._file.tell() and self._file.tell() + size > self.segment_size:
+            self._file.close()
+            self._segment += 1
+            self._file = open(self._segment_path(self._segment), "ab")
+        return self._file
+
+    def record(self, url, response):
+        """
+        Append a fetched httpx response for url. Returns False when the same
+        body is already the latest record of that URL.
+        """
+        text = response.text
+        digest = body_hash(text)
+        with self._lock:
+            if self._latest_hash(url) == digest:
+                self.records_skipped += 1
+                return False
+            self._append(url, response, text, digest)
+            if self._clock() - self._last_flush >= self.checkpoint_interval:
+                self._flush()
+        return True
+
+    def _latest_hash(self, url):
+        if url in self._pending:
+            return self._pending[url][4]
+        row = self._db.execute("SELECT body_hash FROM records WHERE url = ?", (url,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _append(self, url, response, text, digest):
+        meta = {
+            "url": url,
+            "final_url": str(response.url),
+            "status": response.status_code,
+            "headers": dict(response.headers),
+            "fetched_at": self._clock(),
+            "codec": self.codec,
+        }
+        data = _encode(meta, compress(text, self.codec))
+        f = self._writable(len(data))
+        offset = f.tell()
+        f.write(data)
+        self._pending[url] = (url, self._segment, offset, len(data), digest, meta["fetched_at"], self.segment_prefix)
+        self.records_written += 1
+
+    def flush(self):
+        """
+        Make everything recorded so far durable: segment data first, then the
+        index that points into it.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        if self._pending:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO records (url, segment, offset, length, body_hash, fetched_at, prefix) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self._pending.values(),
+                )
+            self._pending.clear()
+        self._last_flush = self._clock()
+
+    def __len__(self):
+        self.flush()
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def get(self, url):
+        """
+        The latest Record archived for url, or None.
+        """
+        with self._lock:
+            if url in self._pending:
+                _, segment, offset, length, _, _, prefix = self._pending[url]
+            else:
+                row = self._db.execute(
+                    "SELECT prefix, segment, offset, length FROM records WHERE url = ?", (url,)
+                ).fetchone()
+                if row is None:
+                    return None
+                prefix, segment, offset, length = row
+            if self._file is not None:
+                self._file.flush()
+        with open(self._segment_path(segment, prefix), "rb") as f:
+            f.seek(offset)
+            buf = f.read(length)
+        meta, body_start, end = _decode(buf, 0)
+        return _record(meta, buf[body_start:end])
+
+    def __iter__(self):
+        """
+        Every URL's latest Record, in the order each writer archived them.
+        Segments are memory-mapped and walked sequentially; superseded records
+        are skipped without decompressing them.
+        """
+        self.flush()
+        with self._lock:
+            latest = set(self._db.execute("SELECT prefix, segment, offset FROM records"))
+        for prefix, segment in self._segment_files():
+            path = self._segment_path(segment, prefix)
+            if not os.path.getsize(path):
+                continue
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                if hasattr(buf, "madvise"):
+                    buf.madvise(mmap.MADV_SEQUENTIAL)
+                offset = 0
+                while offset < len(buf):
+                    if offset + HEADER.size > len(buf):
+                        break
+                    meta, body_start, following = _decode(buf, offset)
+                    if following > len(buf):
+                        # torn write from a crash after the last flush; it was never indexed
+                        break
+                    if (prefix, segment, offset) in latest:
+                        yield _record(meta, buf[body_start:following])
+                    offset = following
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._db.close()
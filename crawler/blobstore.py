@@ -0,0 +1,77 @@
+"""
+Content-addressed, compressed storage for raw product page HTML.
+
+Pages are keyed by the sha256 of their body (the same hash the crawler stores as
+content_hash), so re-crawls of an identical page share one blob. Blobs are
+zstd-compressed when the zstandard package is installed and gzip-compressed
+otherwise; the codec is stored with each blob so either can be read back.
+"""
+import gzip
+from datetime import datetime
+from bson import Binary
+from pymongo.errors import BulkWriteError
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is the fallback
+    zstandard = None
+
+DEFAULT_CODEC = "zstd" if zstandard is not None else "gzip"
+
+def compress(text: str, codec: str = DEFAULT_CODEC) -> bytes:
+    data = text.encode("utf-8")
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    raise ValueError(f"Unknown codec: {codec!r}")
+
+def decompress(data: bytes, codec: str) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed pages")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    if codec == "gzip":
+        return gzip.decompress(data).decode("utf-8")
+    raise ValueError(f"Unknown codec: {codec!r}")
+
+def store_pages(pages_collection, pages, codec: str = DEFAULT_CODEC):
+    """
+    Store (key, html) pairs that are not stored yet. Existing keys are looked up
+    with one $in query so unchanged pages are never re-compressed or re-sent.
+    Returns the number of new blobs written.
+    """
+    pages = dict(pages)
+    if not pages:
+        return 0
+    existing = {d["_id"] for d in pages_collection.find({"_id": {"$in": list(pages)}}, {"_id": 1})}
+    now = datetime.utcnow()
+    docs = [
+        {
+            "_id": key,
+            "codec": codec,
+            "size": len(html),
+            "data": Binary(compress(html, codec)),
+            "stored_at": now,
+        }
+        for key, html in pages.items()
+        if key not in existing
+    ]
+    if not docs:
+        return 0
+    try:
+        pages_collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # another writer stored the same page in the meantime; duplicates are fine
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+    return len(docs)
+
+def load_page(pages_collection, key):
+    """
+    Return the HTML stored under key, or None.
+    """
+    doc = pages_collection.find_one({"_id": key})
+    if doc is None:
+        return None
+    return decompress(bytes(doc["data"]), doc["codec"])
@@ -0,0 +1,54 @@
+"""
+Database clients shared by everything a process runs, created on first use.
+
+Importing a module never connects anywhere. The first task that needs MongoDB
+builds the process's MongoClient (which pools its connections) and every later
+task in the same worker process reuses it. pymongo clients must not cross a
+fork, so a forked child (Celery prefork workers, parse processes) starts
+without one and builds its own.
+"""
+import os
+import threading
+
+from pymongo import MongoClient
+
+from .settings import get_settings
+
+_lock = threading.Lock()
+_mongo = None
+
+def get_mongo_client():
+    global _mongo
+    if _mongo is None:
+        with _lock:
+            if _mongo is None:
+                settings = get_settings()
+                _mongo = MongoClient(settings.mongo_uri, maxPoolSize=settings.mongo_max_pool_size,
+                                     minPoolSize=settings.mongo_min_pool_size, connect=False)
+    return _mongo
+
+def get_database():
+    return get_mongo_client()[get_settings().db_name]
+
+def get_collection(name):
+    """
+    A configured collection by role: "books", "change_log", "raw_pages",
+    "cache_state", "price_history" or "price_stats".
+    """
+    return get_database()[getattr(get_settings(), f"{name}_collection")]
+
+def close_clients():
+    global _mongo
+    with _lock:
+        if _mongo is not None:
+            _mongo.close()
+            _mongo = None
+
+def _after_fork():
+    global _mongo, _lock
+    # the parent's client and lock are unusable here; drop them without closing the parent's sockets
+    _mongo = None
+    _lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
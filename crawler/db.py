@@ -1,25 +1,323 @@
-from pymongo import MongoClient
-from models import Book
-from dotenv import load_dotenv
-import os
+from pymongo import UpdateOne, ReturnDocument, ASCENDING, DESCENDING
+from .models import ChangeLog
+from .records import FIELDS, BookRecord
+from .blobstore import store_pages, load_page
+from .clients import get_collection, get_database
+from .instrumentation import DB_WRITE_SECONDS, DB_DOCS_WRITTEN, timed
+from .history import append_snapshots, ensure_history_collections, rollup_day
+from .settings import get_settings
+from datetime import datetime
+import asyncio
+import hashlib
+import json
+import logging
+import time
 
-load_dotenv()
+# stored field -> change_type recorded in change_log when it differs
+TRACKED_FIELDS = {
+    "price_incl_tax": "price_change",
+    "availability": "availability_change",
+    "number_of_reviews": "reviews_change",
+    "description_hash": "description_change",
+}
+# pre-image needed to diff a stored book against a freshly crawled one
+CHANGE_PROJECTION = {"_id": 0, "book_id": 1, "fingerprint": 1, **{f: 1 for f in TRACKED_FIELDS}}
 
-MONGO_URI = os.getenv("MONGO_URI")  
-DB_NAME = os.getenv("DB_NAME", "default_db")
-COLLECTION_NAME = os.getenv("COLLECTION_NAME", "books")
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest() if text is not None else None
 
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
-collection = db[COLLECTION_NAME]
+def _fingerprint(price_incl_tax, availability, number_of_reviews, description_hash):
+    tracked = {
+        "price_incl_tax": price_incl_tax,
+        "availability": availability,
+        "number_of_reviews": number_of_reviews,
+        "description_hash": description_hash,
+    }
+    return hash_text(json.dumps(tracked, sort_keys=True))
 
-def save_book(book: Book):
+def hash_book(book):
+    """
+    Fingerprint of the change-tracked fields of a book.
+    Equal fingerprints mean there is nothing to record in change_log.
+    """
+    return _fingerprint(book.price_incl_tax, book.availability, book.number_of_reviews,
+                        hash_text(book.product_description))
+
+def book_document(book):
+    """
+    The document stored for a book (a records.BookRecord, or a models.Book):
+    its fields plus the description hash and fingerprint used for change
+    detection, built in one pass. The page HTML is not inlined; the document
+    only references it by content hash in the raw_pages store.
+    """
+    doc = {f: getattr(book, f) for f in FIELDS}
+    doc["raw_html_ref"] = (book.content_hash or hash_text(book.raw_html)) if book.raw_html else None
+    doc["description_hash"] = hash_text(book.product_description)
+    doc["fingerprint"] = _fingerprint(doc["price_incl_tax"], doc["availability"], doc["number_of_reviews"],
+                                      doc["description_hash"])
+    return doc
+
+def diff_book(before, doc, now=None):
+    """
+    Compare the stored pre-image of a book (None if it is new) with the document
+    about to be written and return the ChangeLog entries, one per changed field.
+    """
+    now = now or datetime.utcnow()
+    if before is None:
+        new_value = {f: doc.get(f) for f in TRACKED_FIELDS}
+        return [ChangeLog(book_id=doc["book_id"], change_type="insert", timestamp=now, new_value=new_value)]
+    if before.get("fingerprint") == doc.get("fingerprint"):
+        return []
+    changes = []
+    for field, change_type in TRACKED_FIELDS.items():
+        old, new = before.get(field), doc.get(field)
+        if old != new:
+            changes.append(ChangeLog(
+                book_id=doc["book_id"],
+                change_type=change_type,
+                timestamp=now,
+                old_value={field: old},
+                new_value={field: new},
+            ))
+    return changes
+
+def _record_changes(changes, changes_collection=None):
+    if not changes:
+        return
+    target = changes_collection if changes_collection is not None else get_collection("change_log")
+    target.insert_many([c.dict() for c in changes], ordered=False)
+    logging.info("Recorded %d book changes", len(changes))
+
+def _store_raw_pages(books, docs, pages_collection=None):
+    target = pages_collection if pages_collection is not None else get_collection("raw_pages")
+    store_pages(target, [(d["raw_html_ref"], b.raw_html) for b, d in zip(books, docs) if b.raw_html])
+
+def _history_target(books_collection, history_collection=None):
+    # history lives next to the books collection it snapshots
+    if history_collection is not None:
+        return history_collection
+    if books_collection is None:
+        return get_collection("price_history")
+    return books_collection.database[get_settings().price_history_collection]
+
+def load_raw_html(ref, pages_collection=None):
+    """
+    Return the stored HTML for a book's raw_html_ref, or None.
+    """
+    if not ref:
+        return None
+    return load_page(pages_collection if pages_collection is not None else get_collection("raw_pages"), ref)
+
+def save_book(book: BookRecord):
     """
     Insert or update a book record in MongoDB.
-    Uses upsert to avoid duplicates.
+    Uses upsert to avoid duplicates; the pre-image returned by the same
+    find_one_and_update is diffed to record field changes in change_log.
+    """
+    with timed(DB_WRITE_SECONDS, "save_book"):
+        doc = book_document(book)
+        _store_raw_pages([book], [doc])
+        before = get_collection("books").find_one_and_update(
+            {"book_id": book.book_id},
+            {"$set": doc, "$unset": {"raw_html": ""}},
+            projection=CHANGE_PROJECTION,
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        _record_changes(diff_book(before, doc))
+        append_snapshots(get_collection("price_history"), [doc])
+    DB_DOCS_WRITTEN.inc()
+
+def save_books(books, books_collection=None, changes_collection=None, pages_collection=None,
+               history_collection=None, snapshots=True):
+    """
+    Upsert a batch of book records with a single unordered bulk_write.
+    Pre-images for change detection come from one $in query per batch, so the
+    bulk path never needs an extra read per book. Page HTML goes to the raw_pages
+    store first so a stored raw_html_ref always resolves. Every book also gets a
+    price_history snapshot, unless snapshots=False (books that were not just
+    fetched, e.g. re-parsed from an archive).
+    Returns the number of books sent.
+    """
+    target = books_collection if books_collection is not None else get_collection("books")
+    docs = [book_document(b) for b in books]
+    if not docs:
+        return 0
+    with timed(DB_WRITE_SECONDS, "save_books"):
+        _store_raw_pages(books, docs, pages_collection)
+        ids = [d["book_id"] for d in docs]
+        before = {d["book_id"]: d for d in target.find({"book_id": {"$in": ids}}, CHANGE_PROJECTION)}
+        ops = [
+            UpdateOne({"book_id": d["book_id"]}, {"$set": d, "$unset": {"raw_html": ""}}, upsert=True)
+            for d in docs
+        ]
+        target.bulk_write(ops, ordered=False)
+        now = datetime.utcnow()
+        _record_changes([c for d in docs for c in diff_book(before.get(d["book_id"]), d, now)], changes_collection)
+        if snapshots:
+            append_snapshots(_history_target(target, history_collection), docs, now)
+    DB_DOCS_WRITTEN.inc(len(ops))
+    return len(ops)
+
+def ensure_indexes():
+    """
+    Create the indexes the crawler and API rely on. Safe to call repeatedly.
     """
-    collection.update_one(
-        {"book_id": book.book_id},
-        {"$set": book.dict()},
-        upsert=True
+    get_collection("books").create_index([("book_id", ASCENDING)], unique=True)
+    changes = get_collection("change_log")
+    changes.create_index([("timestamp", DESCENDING)])
+    changes.create_index([("book_id", ASCENDING), ("timestamp", DESCENDING)])
+    settings = get_settings()
+    ensure_history_collections(get_database(), settings.price_history_collection, settings.price_stats_collection)
+
+def update_price_stats(books_collection=None, stats_collection=None, day=None):
+    """
+    Roll the current catalogue up into today's price_stats_daily documents.
+    Run once a crawl has been written.
+    """
+    return rollup_day(books_collection if books_collection is not None else get_collection("books"),
+                      stats_collection if stats_collection is not None else get_collection("price_stats"), day)
+
+def bump_cache_generation(state_collection=None):
+    """
+    Increment the cache generation read by the API response cache (api/cache.py),
+    which drops every cached response once it sees the new value.
+    Call it after a crawl has committed its writes. Returns the new generation.
+    """
+    target = state_collection if state_collection is not None else get_collection("cache_state")
+    doc = target.find_one_and_update(
+        {"_id": "generation"},
+        {"$inc": {"value": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
     )
+    return doc["value"]
+
+class BookWriter:
+    """
+    Buffered, event-loop friendly book writer used by the crawl.
+    Books are collected with `await add(book)` and flushed through save_books in a
+    worker thread once batch_size books are pending or every flush_interval seconds.
+    Books the crawl saw but did not need to save (unchanged pages) are passed to
+    `observe(state)` so they still get their price_history snapshot.
+    A batch whose write fails stays buffered for the next flush and the error is
+    raised to the caller; a book's on_saved callback only runs once it is written.
+    Use it as an async context manager so a final flush always happens on exit.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=2.0, books_collection=None, changes_collection=None,
+                 pages_collection=None, history_collection=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.books_collection = books_collection
+        self.changes_collection = changes_collection
+        self.pages_collection = pages_collection
+        self.history_collection = _history_target(books_collection, history_collection)
+        self._buffer = []
+        self._observed = []
+        self.snapshots_written = 0
+        self._lock = asyncio.Lock()
+        self._ticker = None
+        self.batches = 0
+        self.failed_flushes = 0
+        self.docs_written = 0
+        self.last_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    @property
+    def backlog(self):
+        return len(self._buffer)
+
+    def metrics(self):
+        return {
+            "batches": self.batches,
+            "failed_flushes": self.failed_flushes,
+            "docs_written": self.docs_written,
+            "avg_docs_per_batch": round(self.docs_written / self.batches, 1) if self.batches else 0.0,
+            "avg_flush_ms": round(1000 * self.total_flush_seconds / self.batches, 2) if self.batches else 0.0,
+            "last_flush_ms": round(1000 * self.last_flush_seconds, 2),
+            "backlog": self.backlog,
+            "unchanged_snapshots": self.snapshots_written,
+        }
+
+    async def add(self, book: BookRecord, on_saved=None):
+        self._buffer.append((book, on_saved))
+        if len(self._buffer) >= self.batch_size:
+            # callers wait here while a flush is running, which bounds the backlog
+            await self.flush()
+
+    def observe(self, state):
+        """
+        Record a snapshot for a stored book whose page did not change; state is
+        its entry from load_page_states.
+        """
+        if state.get("book_id"):
+            self._observed.append(state)
+
+    async def flush(self):
+        async with self._lock:
+            if self._observed:
+                observed, self._observed = self._observed, []
+                try:
+                    self.snapshots_written += await asyncio.to_thread(
+                        append_snapshots, self.history_collection, observed
+                    )
+                except BaseException:
+                    self._observed[:0] = observed
+                    raise
+            if not self._buffer:
+                return
+            # books added while this batch is written queue up behind it
+            batch, self._buffer = self._buffer, []
+            started = time.perf_counter()
+            try:
+                written = await asyncio.to_thread(
+                    save_books, [book for book, _ in batch], self.books_collection, self.changes_collection,
+                    self.pages_collection, self.history_collection
+                )
+            except BaseException:
+                # keep the batch (in order, ahead of newer books) for the next flush
+                self._buffer[:0] = batch
+                self.failed_flushes += 1
+                raise
+            for _, on_saved in batch:
+                if on_saved is not None:
+                    on_saved()
+            self.last_flush_seconds = time.perf_counter() - started
+            self.total_flush_seconds += self.last_flush_seconds
+            self.batches += 1
+            self.docs_written += written
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                # shielded: closing the writer must not abandon a batch halfway through its write
+                await asyncio.shield(self.flush())
+            except Exception as e:
+                # the batch stays buffered; the next flush retries it
+                print(f"Periodic book flush failed, retrying with the next one: {e}")
+
+    async def __aenter__(self):
+        self._ticker = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._ticker.cancel()
+        await asyncio.gather(self._ticker, return_exceptions=True)
+        await self.flush()
+
+def load_page_states(urls):
+    """
+    Return the stored HTTP validators and body hash of the books at the given
+    product page URLs, keyed by URL, in a single query. Used to make re-crawls
+    conditional; the crawl loads them per batch of URLs it queues.
+    """
+    # plus what a price_history snapshot of an unchanged book needs
+    projection = {"_id": 0, "product_page_url": 1, "etag": 1, "last_modified": 1, "content_hash": 1,
+                  "book_id": 1, "price_incl_tax_pence": 1, "availability": 1, "crawl_metadata.category": 1}
+    states = {}
+    for doc in get_collection("books").find({"product_page_url": {"$in": list(urls)}}, projection):
+        url = doc.pop("product_page_url")
+        states[url] = doc
+    return states
@@ -0,0 +1,71 @@
+"""
+List page discovery for books.toscrape-style catalogues.
+
+Following li.next puts every list page on the critical path: page N+1 is only
+known once page N is parsed. The first page already says "Page 1 of N" and
+links page 2, which is enough to derive every page URL and fetch them all at
+once. The same works per category: the sidebar of the first page links every
+category index, each with its own pager. A sitemap, when the site has one, is
+an alternative source of list and product URLs.
+"""
+import re
+from urllib.parse import urljoin
+import lxml.etree
+import lxml.html
+
+PAGER_RE = re.compile(r"Page\s+(\d+)\s+of\s+(\d+)")
+# product pages live at /catalogue/<slug>/index.html, categories under /catalogue/category/
+PRODUCT_URL_RE = re.compile(r"/catalogue/(?!category/)[^/]+/index\.html$")
+
+_CATEGORY_LINKS = ("//div[contains(concat(' ', normalize-space(@class), ' '), ' side_categories ')]"
+                   "//ul/li/ul/li/a")
+
+def parse_pager(html):
+    """
+    (current, total) from the "Page X of N" pager text, or None.
+    """
+    m = PAGER_RE.search(html or "")
+    if not m:
+        return None
+    current, total = int(m.group(1)), int(m.group(2))
+    return (current, total) if 1 <= current <= total else None
+
+def pager_urls(next_url, current, total):
+    """
+    URLs of pages current+1..total, derived from the link to page current+1
+    (".../page-2.html" -> ".../page-N.html"). None if the link has another shape.
+    """
+    m = re.search(rf"page-{current + 1}\.html$", next_url or "")
+    if not m:
+        return None
+    prefix = next_url[:m.start()]
+    return [f"{prefix}page-{n}.html" for n in range(current + 1, total + 1)]
+
+def parse_categories(html, base_url):
+    """
+    (name, absolute url) of every category index linked from the sidebar.
+    """
+    if not html or not html.strip():
+        return []
+    root = lxml.html.document_fromstring(html)
+    return [
+        (a.text_content().strip(), urljoin(base_url, a.get("href")))
+        for a in root.xpath(_CATEGORY_LINKS)
+        if a.get("href")
+    ]
+
+def parse_sitemap(xml):
+    """
+    The <loc> URLs of a sitemap (or sitemap index), in document order.
+    """
+    root = lxml.etree.fromstring(xml.encode("utf-8") if isinstance(xml, str) else xml)
+    return [el.text.strip() for el in root.iter("{*}loc") if el.text and el.text.strip()]
+
+def split_sitemap_urls(urls):
+    """
+    Split sitemap URLs into (list_pages, product_pages).
+    """
+    list_pages, product_pages = [], []
+    for url in urls:
+        (product_pages if PRODUCT_URL_RE.search(url) else list_pages).append(url)
+    return list_pages, product_pages
@@ -1,12 +1,87 @@
+import asyncio
+import hashlib
+import time
 import httpx
-from tenacity import retry, wait_exponential, stop_after_attempt
+from . import instrumentation
+from tenacity import retry, retry_if_exception, wait_exponential, stop_after_attempt
+from .politeness import THROTTLE_STATUSES, parse_retry_after
 
-@retry(wait=wait_exponential(multiplier=1, min=2, max=10), stop=stop_after_attempt(5))
-async def fetch(session: httpx.AsyncClient, url: str):
+class Throttled(Exception):
+    """
+    The server answered 429 or 503; retry_after is its Retry-After in seconds, if any.
+    """
+
+    def __init__(self, url, status_code, retry_after=None):
+        super().__init__(f"{status_code} from {url} (retry after {retry_after}s)")
+        self.url = url
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def body_hash(text: str) -> str:
+    """
+    Stable hash of a page body, used to detect unchanged pages between crawls.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+_backoff = wait_exponential(multiplier=1, min=2, max=10)
+
+def _wait(retry_state):
+    # honor the server's Retry-After instead of guessing, capped like the scheduler's pauses
+    exc = retry_state.outcome.exception()
+    if isinstance(exc, Throttled) and exc.retry_after is not None:
+        return min(exc.retry_after, 120.0)
+    return _backoff(retry_state)
+
+def _is_retryable(exc):
+    # other 4xx answers will not change on retry
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return True
+
+async def _get(session, url, headers):
+    with instrumentation.fetch_in_flight():
+        started = time.perf_counter()
+        response = await session.get(url, timeout=30, headers=headers)
+    instrumentation.record_response(url, response, time.perf_counter() - started)
+    return response
+
+@retry(wait=_wait, stop=stop_after_attempt(5), retry=retry_if_exception(_is_retryable),
+       before_sleep=instrumentation.record_retry)
+async def fetch(session: httpx.AsyncClient, url: str, validators: dict = None, scheduler=None, archive=None):
     """
     Fetch HTML content from a URL with retry logic for transient errors.
     Returns a tuple (text, final_url) so callers can resolve relative links.
+
+    If validators is given (a dict with optional "etag" and "last_modified" from a
+    previous crawl) the request is made conditional: the dict is refreshed from the
+    response headers and text is None when the server answers 304 Not Modified.
+
+    With a politeness.HostScheduler the request waits for a slot on its host, and
+    429/503 answers pause the host for their Retry-After before the retry.
+
+    With an archive.Archive every successful response is also archived, in a
+    worker thread so that compression and checkpoints don't block the loop.
     """
-    response = await session.get(url, timeout=30)
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    if scheduler is not None:
+        async with scheduler.slot(url) as slot:
+            response = await _get(session, url, headers)
+            slot.observe(response)
+    else:
+        response = await _get(session, url, headers)
+    if response.status_code in THROTTLE_STATUSES:
+        raise Throttled(url, response.status_code, parse_retry_after(response.headers.get("retry-after")))
+    if validators is not None:
+        validators["etag"] = response.headers.get("etag") or validators.get("etag")
+        validators["last_modified"] = response.headers.get("last-modified") or validators.get("last_modified")
+    if response.status_code == 304:
+        return None, str(response.url)
     response.raise_for_status()
+    if archive is not None:
+        await asyncio.to_thread(archive.record, url, response)
     return response.text, str(response.url)
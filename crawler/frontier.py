@@ -0,0 +1,162 @@
+"""
+Persistent crawl frontier in a local SQLite file.
+
+Every list and product page URL of a crawl is a row with its state (pending,
+in_flight, done or failed), attempt count, lease expiry and last fetch time.
+A crawl that dies leaves its unfinished rows behind and the next crawl resumes
+from them: pending URLs are picked up straight away, in-flight ones once their
+lease has expired. Once nothing is pending or in flight the crawl is complete
+and the next one starts from scratch.
+
+State changes are committed at most every checkpoint_interval seconds, so a
+killed crawl only repeats the work since its last checkpoint.
+"""
+import sqlite3
+import time
+
+LIST = "list"
+BOOK = "book"
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    url TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    leased_until REAL,
+    last_fetch REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS frontier_state ON frontier (kind, state);
+"""
+
+class Frontier:
+    """
+    path: SQLite file, or ":memory:" for a frontier that lives only as long as the crawl.
+    """
+
+    def __init__(self, path=":memory:", lease_seconds=120.0, max_attempts=3, checkpoint_interval=5.0,
+                 clock=time.time):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.checkpoint_interval = checkpoint_interval
+        self._clock = clock
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._last_checkpoint = clock()
+
+    def start(self, seeds, kind=LIST):
+        """
+        Resume the unfinished crawl in the file, or start a new one from the seed
+        URLs (list pages by default). Returns True when resuming.
+        """
+        active, = self._db.execute(
+            "SELECT COUNT(*) FROM frontier WHERE state IN (?, ?)", (PENDING, IN_FLIGHT)
+        ).fetchone()
+        if active:
+            return True
+        self._db.execute("DELETE FROM frontier")
+        self.add(seeds, kind)
+        self.checkpoint()
+        return False
+
+    def add(self, urls, kind, claim=False):
+        """
+        Add URLs not seen before in this crawl and return them, in order.
+        With claim=True they are added in flight, leased to the caller.
+        """
+        now = self._clock()
+        state, attempts, lease = (IN_FLIGHT, 1, now + self.lease_seconds) if claim else (PENDING, 0, None)
+        added = []
+        for url in urls:
+            cur = self._db.execute(
+                "INSERT OR IGNORE INTO frontier (url, kind, state, attempts, leased_until) VALUES (?, ?, ?, ?, ?)",
+                (url, kind, state, attempts, lease),
+            )
+            if cur.rowcount:
+                added.append(url)
+        self._maybe_checkpoint()
+        return added
+
+    def claim(self, kind, limit=None):
+        """
+        Lease pending URLs of a kind, and in-flight ones whose lease expired, in the
+        order they were added. URLs already claimed max_attempts times are marked failed.
+        """
+        now = self._clock()
+        claimable = "kind = ? AND (state = ? OR (state = ? AND leased_until < ?))"
+        args = (kind, PENDING, IN_FLIGHT, now)
+        self._db.execute(
+            f"UPDATE frontier SET state = ?, error = 'too many attempts' WHERE {claimable} AND attempts >= ?",
+            (FAILED, *args, self.max_attempts),
+        )
+        urls = [row[0] for row in self._db.execute(
+            f"SELECT url FROM frontier WHERE {claimable} ORDER BY rowid LIMIT ?", (*args, limit or -1)
+        )]
+        self._db.executemany(
+            "UPDATE frontier SET state = ?, attempts = attempts + 1, leased_until = ? WHERE url = ?",
+            [(IN_FLIGHT, now + self.lease_seconds, url) for url in urls],
+        )
+        self._maybe_checkpoint()
+        return urls
+
+    def done(self, url, final_url=None):
+        """
+        Mark a URL fetched; final_url (after redirects) is recorded as done too.
+        """
+        now = self._clock()
+        self._db.execute(
+            "UPDATE frontier SET state = ?, leased_until = NULL, last_fetch = ?, error = NULL WHERE url = ?",
+            (DONE, now, url),
+        )
+        if final_url and final_url != url:
+            self._db.execute(
+                "INSERT INTO frontier (url, kind, state, last_fetch) "
+                "SELECT ?, kind, ?, ? FROM frontier WHERE url = ? "
+                "ON CONFLICT(url) DO UPDATE SET state = excluded.state, last_fetch = excluded.last_fetch",
+                (final_url, DONE, now, url),
+            )
+        self._maybe_checkpoint()
+
+    def failed(self, url, error=None):
+        self._db.execute(
+            "UPDATE frontier SET state = ?, leased_until = NULL, last_fetch = ?, error = ? WHERE url = ?",
+            (FAILED, self._clock(), error, url),
+        )
+        self._maybe_checkpoint()
+
+    def lease_wait(self):
+        """
+        Seconds until the earliest in-flight lease expires (0 if one already has),
+        or None when nothing is in flight.
+        """
+        earliest, = self._db.execute(
+            "SELECT MIN(leased_until) FROM frontier WHERE state = ?", (IN_FLIGHT,)
+        ).fetchone()
+        if earliest is None:
+            return None
+        return max(0.0, earliest - self._clock())
+
+    def counts(self):
+        return dict(self._db.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state"))
+
+    def checkpoint(self):
+        self._db.commit()
+        self._last_checkpoint = self._clock()
+
+    def _maybe_checkpoint(self):
+        if self._clock() - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def close(self):
+        self.checkpoint()
+        self._db.close()
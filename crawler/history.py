@@ -0,0 +1,135 @@
+"""
+Price and availability history.
+
+Every crawl appends one compact snapshot per book it saw, changed or not, to
+price_history, a MongoDB time-series collection (timeField "ts", metaField
+"meta" holding book_id and category), so a book's history is an indexed range
+scan. After a crawl the catalogue is also rolled up into one price_stats_daily
+document per day and category, which the API downsamples further (weeks,
+months) without touching the raw snapshots.
+"""
+import logging
+import re
+from datetime import datetime
+from itertools import islice
+from pymongo import ASCENDING
+
+STOCK_RE = re.compile(r"\((\d+) available\)")
+ALL_CATEGORIES = "all"
+
+def stock_count(availability):
+    """
+    Copies in stock from an availability string: "In stock (5 available)" -> 5,
+    "Out of stock" -> 0, None when the page does not say.
+    """
+    if not availability:
+        return None
+    match = STOCK_RE.search(availability)
+    if match:
+        return int(match.group(1))
+    return 0 if "out of stock" in availability.lower() else None
+
+def snapshot(doc, ts):
+    """
+    The history entry for a stored book document (or a page state with the
+    same fields) at time ts. Unknown values are left out to keep entries small.
+    """
+    meta = {"book_id": doc["book_id"]}
+    category = (doc.get("crawl_metadata") or {}).get("category")
+    if category:
+        meta["category"] = category
+    entry = {"ts": ts, "meta": meta}
+    if doc.get("price_incl_tax_pence") is not None:
+        entry["price"] = doc["price_incl_tax_pence"]
+    availability = doc.get("availability")
+    if availability:
+        entry["in_stock"] = "in stock" in availability.lower()
+        stock = stock_count(availability)
+        if stock is not None:
+            entry["stock"] = stock
+    return entry
+
+def append_snapshots(history_collection, docs, ts=None):
+    """
+    Append a snapshot of each document with a book_id. Returns how many were written.
+    """
+    ts = ts or datetime.utcnow()
+    entries = [snapshot(d, ts) for d in docs if d.get("book_id")]
+    if entries:
+        history_collection.insert_many(entries, ordered=False)
+    return len(entries)
+
+def ensure_history_collections(db, history_name, stats_name):
+    """
+    Create the time-series collection (MongoDB 5.0+) and the indexes behind
+    the history and stats queries. Safe to call repeatedly. A plain collection
+    of the same name (auto-created by a snapshot insert that ran first) is
+    converted: its points are moved into a new time-series collection.
+    """
+    info = next(iter(db.list_collections(filter={"name": history_name})), None)
+    legacy = None
+    if info is not None and info.get("type") != "timeseries":
+        legacy = f"{history_name}_unconverted"
+        logging.warning(f"{history_name} is not a time-series collection, converting it")
+        db[history_name].rename(legacy)
+        info = None
+    if info is None:
+        db.create_collection(history_name, timeseries={"timeField": "ts", "metaField": "meta",
+                                                       "granularity": "hours"})
+    if legacy is not None:
+        points = db[legacy].find({}, {"_id": 0})
+        while batch := list(islice(points, 10000)):
+            db[history_name].insert_many(batch, ordered=False)
+        db[legacy].drop()
+    db[history_name].create_index([("meta.book_id", ASCENDING), ("ts", ASCENDING)])
+    db[stats_name].create_index([("category", ASCENDING), ("day", ASCENDING)], unique=True)
+
+def _day(value):
+    return datetime(value.year, value.month, value.day)
+
+def rollup_day(books_collection, stats_collection, day=None):
+    """
+    Summarise the current catalogue into the price_stats_daily documents of
+    day (today by default): one per category plus one for all books. A second
+    crawl on the same day overwrites them. Returns the documents written.
+    """
+    day = _day(day or datetime.utcnow())
+    price = "$price_incl_tax_pence"
+    pipeline = [
+        {"$project": {
+            "category": {"$ifNull": ["$crawl_metadata.category", None]},
+            "price": price,
+            "priced": {"$cond": [{"$gt": [price, None]}, 1, 0]},
+            "in_stock": {"$cond": [{"$regexMatch": {"input": {"$ifNull": ["$availability", ""]},
+                                                    "regex": "in stock", "options": "i"}}, 1, 0]},
+        }},
+        {"$group": {
+            "_id": "$category",
+            "books": {"$sum": 1},
+            "priced": {"$sum": "$priced"},
+            "sum_price": {"$sum": "$price"},
+            "min_price": {"$min": "$price"},
+            "max_price": {"$max": "$price"},
+            "in_stock": {"$sum": "$in_stock"},
+        }},
+    ]
+    groups = list(books_collection.aggregate(pipeline))
+    overall = {
+        "_id": ALL_CATEGORIES,
+        "books": sum(g["books"] for g in groups),
+        "priced": sum(g["priced"] for g in groups),
+        "sum_price": sum(g["sum_price"] or 0 for g in groups),
+        "min_price": min((g["min_price"] for g in groups if g["min_price"] is not None), default=None),
+        "max_price": max((g["max_price"] for g in groups if g["max_price"] is not None), default=None),
+        "in_stock": sum(g["in_stock"] for g in groups),
+    }
+    docs = []
+    for group in groups + [overall]:
+        category = group.pop("_id")
+        if category is None:
+            continue
+        docs.append({"day": day, "category": category, **group})
+    # one document per category, a few dozen writes a day
+    for d in docs:
+        stats_collection.update_one({"day": day, "category": d["category"]}, {"$set": d}, upsert=True)
+    return docs
@@ -0,0 +1,157 @@
+"""
+Crawl instrumentation: Prometheus metrics per stage (fetch, parse, database
+writes), a pushgateway/textfile dump at the end of a run, structured JSON run
+summaries and an optional profiler hook.
+
+Metrics live in their own registry so a dump only contains crawl metrics.
+"""
+import cProfile
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, push_to_gateway, write_to_textfile
+
+from .settings import get_settings
+
+try:
+    import pyinstrument
+except ImportError:  # optional, cProfile is always available
+    pyinstrument = None
+
+REGISTRY = CollectorRegistry()
+
+FETCH_SECONDS = Histogram(
+    "crawl_fetch_seconds", "Time to fetch a page, per host", ["host"], registry=REGISTRY,
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+FETCH_RESPONSES = Counter("crawl_fetch_responses_total", "Responses by host and status code", ["host", "status"],
+                          registry=REGISTRY)
+FETCH_BYTES = Counter("crawl_fetch_bytes_total", "Response body bytes fetched", ["host"], registry=REGISTRY)
+FETCH_RETRIES = Counter("crawl_fetch_retries_total", "Fetch attempts that were retried", ["host"],
+                        registry=REGISTRY)
+FETCH_IN_FLIGHT = Gauge("crawl_fetch_in_flight", "Requests currently in flight", registry=REGISTRY)
+PARSE_SECONDS = Histogram(
+    "crawl_parse_seconds", "Time to parse a page", ["page"], registry=REGISTRY,
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+DB_WRITE_SECONDS = Histogram(
+    "crawl_db_write_seconds", "Time of a book write to MongoDB", ["op"], registry=REGISTRY,
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+DB_DOCS_WRITTEN = Counter("crawl_db_docs_written_total", "Book documents written", registry=REGISTRY)
+
+def host_of(url):
+    return urlsplit(url).netloc
+
+@contextmanager
+def fetch_in_flight():
+    FETCH_IN_FLIGHT.inc()
+    try:
+        yield
+    finally:
+        FETCH_IN_FLIGHT.dec()
+
+def record_response(url, response, seconds):
+    host = host_of(url)
+    FETCH_SECONDS.labels(host).observe(seconds)
+    FETCH_RESPONSES.labels(host, str(response.status_code)).inc()
+    FETCH_BYTES.labels(host).inc(len(response.content or b""))
+
+def record_retry(retry_state):
+    """
+    tenacity before_sleep hook: count the retry against the fetched URL's host.
+    """
+    url = retry_state.args[1] if len(retry_state.args) > 1 else retry_state.kwargs.get("url", "")
+    FETCH_RETRIES.labels(host_of(url)).inc()
+
+def push_metrics(job="crawler", grouping_key=None):
+    """
+    Push the crawl metrics to the Prometheus pushgateway at PUSHGATEWAY_URL.
+    Returns False when it is not configured or unreachable.
+    """
+    gateway = get_settings().pushgateway_url
+    if not gateway:
+        return False
+    try:
+        push_to_gateway(gateway, job=job, registry=REGISTRY, grouping_key=grouping_key or {})
+    except Exception as e:
+        print(f"Could not push crawl metrics to {gateway}: {e}")
+        return False
+    return True
+
+def dump_metrics(path=None, job="crawler"):
+    """
+    Write the crawl metrics in Prometheus text format to path (METRICS_DUMP_PATH,
+    default logs/crawl_metrics.prom, for a node_exporter textfile collector) and
+    push them to the pushgateway when one is configured. Returns the file path.
+    """
+    path = path or get_settings().metrics_dump_path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    write_to_textfile(path, REGISTRY)
+    push_metrics(job)
+    return path
+
+def log_run_summary(summary, path=None, **fields):
+    """
+    Log a crawl's summary as one JSON object, to stdout through structlog and
+    appended to the run log (CRAWL_RUN_LOG, default logs/crawl_runs.jsonl).
+    """
+    import structlog  # once per crawl, not at import
+
+    path = path or get_settings().run_log_path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    processors = [structlog.processors.TimeStamper(fmt="iso", utc=True),
+                  structlog.processors.JSONRenderer(default=str)]
+    structlog.wrap_logger(structlog.PrintLogger(), processors=processors).info("crawl_finished", **fields, **summary)
+    with open(path, "a", encoding="utf-8") as f:
+        structlog.wrap_logger(structlog.WriteLogger(f), processors=processors).info(
+            "crawl_finished", **fields, **summary
+        )
+    return path
+
+@contextmanager
+def profiled(mode=None, output_dir="logs", name="crawl"):
+    """
+    Profile the enclosed code with mode "cprofile" (a .pstats file) or
+    "pyinstrument" (an .html report, needs the pyinstrument package).
+    Any other mode, e.g. None, runs it unprofiled. name prefixes the file name.
+    """
+    if mode not in ("cprofile", "pyinstrument"):
+        yield None
+        return
+    if mode == "pyinstrument" and pyinstrument is None:
+        print("pyinstrument is not installed, profiling with cProfile")
+        mode = "cprofile"
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    if mode == "cprofile":
+        path = os.path.join(output_dir, f"{name}_profile_{stamp}.pstats")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    else:
+        path = os.path.join(output_dir, f"{name}_profile_{stamp}.html")
+        profiler = pyinstrument.Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            yield path
+        finally:
+            profiler.stop()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+    print(f"Crawl profile written to {path}")
+
+@contextmanager
+def timed(histogram, *labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(*labels).observe(time.perf_counter() - started)
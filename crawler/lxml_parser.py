@@ -0,0 +1,92 @@
+"""
+lxml/XPath parser backend. Drop-in replacement for the BeautifulSoup functions
+in parser.py that returns identical list-page dicts and BookRecords, but
+parses in C and skips building a Python object per node.
+"""
+from urllib.parse import urljoin
+import lxml.html
+from .parser import build_book, normalize_price, rating_from_classes
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+_ARTICLES = f"//article[{_has_class('product_pod')}]"
+_ARTICLE_LINK = ".//h3//a"
+_ARTICLE_PRICE = f".//*[{_has_class('product_price')}]//*[{_has_class('price_color')}]"
+_NEXT_LINK = f"//ul[{_has_class('pager')}]//li[{_has_class('next')}]//a"
+_TITLE = f"//div[{_has_class('product_main')}]//h1"
+_INFO_ROWS = f"//table[{_has_class('table-striped')}]//tr"
+_AVAILABILITY = f"//p[{_has_class('instock')} and {_has_class('availability')}]"
+_DESCRIPTION = "//*[@id='product_description']/following-sibling::p[1]"
+_IMAGE = "//*[@id='product_gallery']//img"
+_RATING = f"//div[{_has_class('product_main')}]//p[{_has_class('star-rating')}]"
+_CRUMBS = f"//ul[{_has_class('breadcrumb')}]//li//a"
+
+def _document(html: str):
+    if not html or not html.strip():
+        return lxml.html.document_fromstring("<html></html>")
+    return lxml.html.document_fromstring(html)
+
+def _first(root, xpath):
+    found = root.xpath(xpath)
+    return found[0] if found else None
+
+def _text(el):
+    return el.text_content().strip()
+
+def parse_list_page(html: str, base_url: str):
+    """
+    Parse a paginated list page (books.toscrape list).
+    Returns (books, next_page_url), see parser.parse_list_page.
+    """
+    root = _document(html)
+    books = []
+    for article in root.xpath(_ARTICLES):
+        a = _first(article, _ARTICLE_LINK)
+        if a is None:
+            continue
+        book_url = urljoin(base_url, a.get("href"))
+        title = a.get("title") or _text(a)
+        price_tag = _first(article, _ARTICLE_PRICE)
+        price = normalize_price(_text(price_tag)) if price_tag is not None else None
+        books.append({"url": book_url, "title": title, "price": price})
+
+    next_a = _first(root, _NEXT_LINK)
+    next_page = urljoin(base_url, next_a.get("href")) if next_a is not None and next_a.get("href") else None
+    return books, next_page
+
+def parse_book_page(html: str, page_url: str):
+    """
+    Parse an individual book product page from books.toscrape and return a records.BookRecord
+    """
+    root = _document(html)
+
+    title_tag = _first(root, _TITLE)
+    title = _text(title_tag) if title_tag is not None else None
+
+    rows = []
+    for tr in root.xpath(_INFO_ROWS):
+        th = _first(tr, ".//th")
+        td = _first(tr, ".//td")
+        if th is None or td is None:
+            continue
+        rows.append((_text(th), _text(td)))
+
+    avail_tag = _first(root, _AVAILABILITY)
+    availability = None
+    if avail_tag is not None:
+        availability = " ".join(s.strip() for s in avail_tag.itertext() if s.strip())
+
+    desc_tag = _first(root, _DESCRIPTION)
+    desc = _text(desc_tag) if desc_tag is not None else None
+
+    img = _first(root, _IMAGE)
+    image_src = img.get("src") if img is not None else None
+
+    rating_tag = _first(root, _RATING)
+    rating = rating_from_classes((rating_tag.get("class") or "").split()) if rating_tag is not None else None
+
+    crumbs = [_text(a) for a in root.xpath(_CRUMBS)]
+    category = crumbs[-1] if len(crumbs) >= 3 else None
+
+    return build_book(html, page_url, title, rows, availability, desc, image_src, rating, category)
@@ -1,50 +1,447 @@
 import asyncio
+import os
+import time
+from functools import partial
+from urllib.parse import urljoin
 import httpx
-from fetcher import fetch
-from parser import parse_list_page, parse_book_page
-from db import save_book
-
-async def crawl(start_urls, max_pages=None):
-    """
-    Crawl the listing pages starting from start_urls, follow pagination,
-    collect product page URLs, fetch product pages and persist Book models.
-    """
-    async with httpx.AsyncClient() as session:
-        to_visit = list(start_urls)
-        visited_list_pages = set()
-        book_urls = set()
-        pages_crawled = 0
-
-        while to_visit:
-            page = to_visit.pop(0)
-            # simple dedupe of list pages
-            if page in visited_list_pages:
-                continue
-            html, final_url = await fetch(session, page)
-            visited_list_pages.add(final_url)
-            pages_crawled += 1
-
-            books, next_page = parse_list_page(html, final_url)
-            for b in books:
-                book_urls.add(b["url"])
-
-            if next_page and (max_pages is None or pages_crawled < max_pages):
-                if next_page not in visited_list_pages:
-                    to_visit.append(next_page)
-
-        # fetch product pages concurrently (bounded concurrency recommended for large crawls)
-        sem = asyncio.Semaphore(20)
-        async def _fetch_and_parse(u):
-            async with sem:
-                html, final = await fetch(session, u)
-                book = parse_book_page(html, final)
-                save_book(book)
-
-        await asyncio.gather(*[_fetch_and_parse(u) for u in sorted(book_urls)])
+from .fetcher import fetch, body_hash
+from .parser import parse_list_page, parse_book_page
+from . import lxml_parser
+from .parse_pool import ParsePool
+from .politeness import HostScheduler
+from .frontier import Frontier, LIST, BOOK
+from .archive import Archive
+from .discovery import parse_pager, pager_urls, parse_categories, parse_sitemap, split_sitemap_urls
+from .db import BookWriter, load_page_states, ensure_indexes, bump_cache_generation, update_price_stats
+from .instrumentation import PARSE_SECONDS, timed, profiled, dump_metrics, log_run_summary
+from .settings import get_settings
+
+
+class CrawlStats:
+    """
+    Running counters for a single crawl, used for progress reports and the run summary.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.list_pages = 0
+        self.book_pages = 0
+        self.books_saved = 0
+        self.not_modified = 0
+        self.unchanged = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.writer = {}
+        self.hosts = {}
+        self.resumed = False
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    @property
+    def pages_per_second(self):
+        elapsed = self.elapsed
+        return (self.list_pages + self.book_pages) / elapsed if elapsed > 0 else 0.0
+
+    def observe_queue(self, depth):
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def summary(self):
+        return {
+            "list_pages": self.list_pages,
+            "book_pages": self.book_pages,
+            "books_saved": self.books_saved,
+            "skipped_not_modified": self.not_modified,
+            "skipped_unchanged": self.unchanged,
+            "errors": self.errors,
+            "max_queue_depth": self.max_queue_depth,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "pages_per_second": round(self.pages_per_second, 2),
+            "writer": self.writer,
+            "hosts": self.hosts,
+            "resumed": self.resumed,
+        }
+
+
+def _parser_backend(name):
+    """
+    Return the (parse_list_page, parse_book_page) pair for a parser backend name.
+    """
+    if name == "bs4":
+        return parse_list_page, parse_book_page
+    if name == "lxml":
+        return lxml_parser.parse_list_page, lxml_parser.parse_book_page
+    raise ValueError(f"Unknown parser backend: {name!r}")
+
+
+async def _fetch_list_pages(session, pages, scheduler):
+    """
+    Yield (page, (html, final_url) or the exception) as list pages arrive.
+    A single page is fetched inline, several concurrently.
+    """
+    async def fetch_one(page):
+        try:
+            return page, await fetch(session, page, scheduler=scheduler)
+        except Exception as e:
+            return page, e
+
+    if len(pages) == 1:
+        yield await fetch_one(pages[0])
+        return
+    for arrived in asyncio.as_completed([fetch_one(p) for p in pages]):
+        yield await arrived
+
+
+async def _discover(session, html, final_url, next_page, is_seed, discovery, scheduler, list_categories, category):
+    """
+    (list_pages, product_pages, keep_books) to crawl after this page in a discovery
+    mode, or None to fall back to following the next link. Seed pages may list the
+    category indexes ("categories") or point to a sitemap; any first page of a
+    pager yields the URLs of all its pages. keep_books is False when this page's
+    own books will be found again, tagged, on their category pages.
+    """
+    if is_seed and discovery == "categories":
+        categories = parse_categories(html, final_url)
+        if categories:
+            for name, url in categories:
+                list_categories[url] = name
+            return [url for _, url in categories], [], False
+    pager = parse_pager(html)
+    if pager and pager[0] == 1 and next_page:
+        urls = pager_urls(next_page, *pager)
+        if urls:
+            if category:
+                list_categories.update(dict.fromkeys(urls, category))
+            return urls, [], True
+    if is_seed:
+        try:
+            xml, _ = await fetch(session, urljoin(final_url, "/sitemap.xml"), scheduler=scheduler)
+            return (*split_sitemap_urls(parse_sitemap(xml)), True)
+        except Exception as e:
+            print(f"No usable sitemap for {final_url} ({e}), following next links")
+    return None
+
+
+async def _produce_book_urls(session, start_urls, max_pages, queue, stats, parse_list, frontier, scheduler=None,
+                             seed_kind=LIST, discovery="serial", list_concurrency=10, book_categories=None,
+                             flush=None, page_states=None):
+    """
+    Walk the listing pages and push every new product URL onto the queue as soon
+    as its list page is parsed, so workers can start before pagination finishes.
+    URLs are tracked in the frontier, which dedupes them and lets an interrupted
+    crawl resume: its unfinished product pages are queued first, and URLs still
+    leased to a dead crawl are picked up once their lease expires.
+
+    discovery "serial" follows li.next one page at a time; "pager" derives every
+    list page from the first page's "Page 1 of N" pager (or a sitemap) and
+    fetches up to list_concurrency of them at once; "categories" does the same
+    per category index and records each book's category in book_categories.
+    Both fall back to following next links when the pages cannot be derived.
+    flush, when given, is awaited whenever the queue has drained: it must write
+    out everything the workers handed on, so that their URLs are done before
+    the frontier is asked what is left.
+    page_states, when given, gets the db.load_page_states of each batch of
+    product URLs before it is queued; workers take their entry out again.
+    """
+    stats.resumed = frontier.start(start_urls, seed_kind)
+    seeds = set(start_urls)
+    list_categories = {}
+    scheduled = len(start_urls)
+
+    async def queue_books(urls):
+        if page_states is not None and urls:
+            page_states.update(await asyncio.to_thread(load_page_states, urls))
+        for url in urls:
+            # blocks when the queue is full, which keeps memory bounded
+            await queue.put(url)
+            stats.observe_queue(queue.qsize())
+
+    async def enqueue(urls, category=None):
+        urls = frontier.add(urls, BOOK, claim=True)
+        if category and book_categories is not None:
+            book_categories.update(dict.fromkeys(urls, category))
+        await queue_books(urls)
+
+    while True:
+        pages = frontier.claim(LIST, limit=1 if discovery == "serial" else list_concurrency)
+        if pages:
+            async for page, result in _fetch_list_pages(session, pages, scheduler):
+                if isinstance(result, Exception):
+                    frontier.failed(page, str(result))
+                    if page in seeds:
+                        raise result
+                    # without the seed there is nothing to crawl; any other list page is just lost
+                    stats.errors += 1
+                    print(f"Failed to fetch list page {page}: {result}")
+                    continue
+                html, final_url = result
+                stats.list_pages += 1
+                category = list_categories.get(page)
+
+                with timed(PARSE_SECONDS, "list"):
+                    books, next_page = parse_list(html, final_url)
+                following, found_books, keep_books = [next_page] if next_page else [], [], True
+                if discovery != "serial":
+                    discovered = await _discover(session, html, final_url, next_page, page in seeds, discovery,
+                                                 scheduler, list_categories, category)
+                    if discovered is not None:
+                        following, found_books, keep_books = discovered
+                if category and next_page:
+                    list_categories.setdefault(next_page, category)
+
+                if keep_books:
+                    await enqueue([b["url"] for b in books], category)
+                await enqueue(found_books)
+
+                if max_pages is not None:
+                    following = following[:max(0, max_pages - scheduled)]
+                scheduled += len(frontier.add(following, LIST))
+                frontier.done(page, final_url)
+            continue
+
+        # claim product pages only once the queue has drained and no more than it
+        # holds: a lease runs from the claim, so a URL left waiting in the queue
+        # past lease_seconds would be claimed, and fetched, a second time
+        await queue.join()
+        if flush is not None:
+            await flush()
+        books = frontier.claim(BOOK, limit=queue.maxsize or None)
+        await queue_books(books)
+        if books:
+            continue
+
+        wait = frontier.lease_wait()
+        if wait is None:
+            return
+        # what is left is leased to a crawl that died; take it over when the lease runs out
+        await asyncio.sleep(wait)
+
+
+async def _crawl_book_page(session, url, writer, stats, parse_stage, page_states, scheduler, book_categories,
+                           archive=None, done=None):
+    """
+    Fetch, parse and hand one product page to the writer. done() is called once
+    nothing is left to do for the page: straight away for unchanged pages, once
+    the writer has saved its book otherwise.
+    """
+    validators = dict(page_states.pop(url, {})) if page_states is not None else None
+    html, final = await fetch(session, url, validators=validators, scheduler=scheduler, archive=archive)
+    stats.book_pages += 1
+    if html is None:
+        stats.not_modified += 1
+        writer.observe(validators)
+        done()
+        return
+    if validators is not None:
+        digest = body_hash(html)
+        if digest == validators.get("content_hash"):
+            stats.unchanged += 1
+            writer.observe(validators)
+            done()
+            return
+    with timed(PARSE_SECONDS, "book"):
+        book = await parse_stage.parse(html, final)
+    if url in book_categories and not book.crawl_metadata.get("category"):
+        book.crawl_metadata["category"] = book_categories[url]
+    if validators is not None:
+        book.etag = validators.get("etag")
+        book.last_modified = validators.get("last_modified")
+        book.content_hash = digest
+    await writer.add(book, on_saved=done)
+    stats.books_saved += 1
+
+
+async def _book_worker(session, queue, writer, stats, parse_stage, frontier, page_states=None, scheduler=None,
+                       book_categories=None, archive=None):
+    """
+    Fetch, parse and hand product pages to the book writer until cancelled,
+    recording each URL as done or failed in the frontier. A page only counts as
+    done once its book is written, so a crawl that dies with books still
+    buffered fetches them again when it resumes.
+    With page_states (see db.load_page_states) fetches are conditional and pages
+    answering 304 or hashing the same as last crawl are neither parsed nor saved.
+    """
+    while True:
+        url = await queue.get()
+        try:
+            await _crawl_book_page(session, url, writer, stats, parse_stage, page_states, scheduler,
+                                   book_categories or {}, archive, partial(frontier.done, url))
+        except Exception as e:
+            # a single bad product page must not take a worker down with it
+            stats.errors += 1
+            frontier.failed(url, str(e))
+            print(f"Failed to crawl {url}: {e}")
+        finally:
+            queue.task_done()
+
+
+async def _report_progress(queue, writer, stats, interval):
+    while True:
+        await asyncio.sleep(interval)
+        print(
+            f"Crawl progress: {stats.pages_per_second:.1f} pages/s, "
+            f"queue depth {queue.qsize()}, write backlog {writer.backlog}, "
+            f"{stats.books_saved} books saved, {stats.errors} errors"
+        )
+
+
+def _http_client(max_connections, http2):
+    """
+    Shared client for the crawl with explicit pool limits and keep-alive.
+    HTTP/2 needs the optional h2 package; without it the client stays on HTTP/1.1.
+    """
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                          keepalive_expiry=30.0)
+    return httpx.AsyncClient(limits=limits, http2=http2, timeout=30)
+
+
+async def crawl(start_urls, max_pages=None, workers=20, queue_size=100, report_interval=10.0,
+                conditional=False, parser_backend="bs4", parse_workers=None, rate_limit=None,
+                max_connections=None, http2=False, frontier=None, product_pages=False, discovery="serial",
+                writer=None, archive=None):
+    """
+    Crawl the listing pages starting from start_urls, follow pagination and
+    stream product page URLs into a bounded queue drained by a fixed pool of
+    workers that fetch and parse BookRecords for a batched BookWriter.
+    With conditional=True product pages that have not changed since the last
+    crawl are skipped (ETag/Last-Modified revalidation plus a body hash).
+    parser_backend selects the HTML parser: "bs4" (default) or "lxml", and
+    parse_workers > 0 moves product page parsing into that many processes.
+    Requests go through a per-host politeness.HostScheduler: at most rate_limit
+    requests/second per host (unlimited by default) and an adaptive number of
+    concurrent requests between 1 and workers. The HTTP connection pool holds
+    max_connections connections (workers by default); http2=True enables HTTP/2.
+    A frontier.Frontier backed by a file makes the crawl resumable; without one
+    the URLs are tracked in memory for this run only.
+    With product_pages=True start_urls are product pages to crawl directly, e.g.
+    one shard of a distributed crawl, and no list pages are walked.
+    discovery picks how list pages are found: "serial" (follow next links),
+    "pager" or "categories" (fetch list pages in parallel, see _produce_book_urls).
+    writer is the db.BookWriter to save books with, one on the configured
+    database by default. With an archive.Archive every product page fetched is
+    archived, so it can be re-parsed later without the network (see reparse.py).
+    Returns the CrawlStats for the run.
+    """
+    parse_list, parse_book = _parser_backend(parser_backend)
+    stats = CrawlStats()
+    scheduler = HostScheduler(rate=rate_limit, initial_concurrency=max(1, workers // 2), max_concurrency=workers)
+    # filled per batch of queued product pages by _produce_book_urls
+    page_states = {} if conditional else None
+    frontier = frontier if frontier is not None else Frontier()
+    book_categories = {}
+    async with ParsePool(parse_book, parse_workers) as parse_stage, \
+            (writer or BookWriter()) as writer, _http_client(max_connections or workers, http2) as session:
+        queue = asyncio.Queue(maxsize=queue_size)
+        tasks = [
+            asyncio.create_task(
+                _book_worker(session, queue, writer, stats, parse_stage, frontier, page_states, scheduler,
+                             book_categories, archive)
+            )
+            for _ in range(workers)
+        ]
+        if report_interval:
+            tasks.append(asyncio.create_task(_report_progress(queue, writer, stats, report_interval)))
+        try:
+            await _produce_book_urls(session, start_urls, max_pages, queue, stats, parse_list, frontier, scheduler,
+                                     BOOK if product_pages else LIST, discovery, book_categories=book_categories,
+                                     flush=writer.flush, page_states=page_states)
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            frontier.checkpoint()
+            if archive is not None:
+                archive.flush()
+    stats.writer = writer.metrics()
+    stats.hosts = scheduler.metrics()
+
+    print(f"Crawl finished: {stats.summary()}")
+    return stats
+
+async def enumerate_book_urls(start_urls, max_pages=None, parser_backend="bs4", discovery="serial", rate_limit=None,
+                              max_connections=None, concurrency=10):
+    """
+    Walk the listing pages only and return every product page URL, in order and
+    without duplicates. The first step of a distributed crawl. Requests follow
+    the same per-host rate_limit as a crawl, at most concurrency at a time.
+    """
+    parse_list, _ = _parser_backend(parser_backend)
+    stats = CrawlStats()
+    frontier = Frontier()
+    queue = asyncio.Queue()
+    urls = []
+
+    async def collect():
+        while True:
+            url = await queue.get()
+            urls.append(url)
+            frontier.done(url)
+            queue.task_done()
+
+    async with _http_client(max_connections or concurrency, False) as session:
+        collector = asyncio.create_task(collect())
+        try:
+            await _produce_book_urls(session, start_urls, max_pages, queue, stats, parse_list, frontier,
+                                     HostScheduler(rate=rate_limit, initial_concurrency=max(1, concurrency // 2),
+                                                   max_concurrency=concurrency),
+                                     discovery=discovery, list_concurrency=concurrency)
+        finally:
+            collector.cancel()
+            await asyncio.gather(collector, return_exceptions=True)
+    return urls
+
+
+def crawl_options(settings):
+    """
+    The crawl() options taken from settings, shared by the single-process crawl
+    and the shards of a distributed one.
+    """
+    return {
+        "parser_backend": settings.parser_backend,
+        "parse_workers": settings.parse_workers,
+        "rate_limit": settings.rate_limit,
+        "max_connections": settings.max_connections,
+        "http2": settings.http2,
+    }
+
 
 async def crawl_book_urls():
     start_urls = ["https://books.toscrape.com/"]
-    await crawl(start_urls)
+    settings = get_settings()
+    await asyncio.to_thread(ensure_indexes)
+    os.makedirs(os.path.dirname(settings.frontier_path) or ".", exist_ok=True)
+    frontier = Frontier(settings.frontier_path, lease_seconds=settings.lease_seconds)
+    # CRAWL_ARCHIVE_DIR keeps the fetched product pages for reparse.py
+    archive = Archive(settings.archive_dir) if settings.archive_dir else None
+    # CRAWL_PROFILE=cprofile|pyinstrument writes a profile of the run to logs/
+    with profiled(settings.profile):
+        try:
+            stats = await crawl(
+                start_urls,
+                conditional=True,
+                frontier=frontier,
+                discovery=settings.discovery,
+                archive=archive,
+                **crawl_options(settings),
+            )
+        finally:
+            frontier.close()
+            if archive is not None:
+                archive.close()
+    await asyncio.to_thread(update_price_stats)
+    # everything is flushed: let the API drop its cached responses
+    await asyncio.to_thread(bump_cache_generation)
+    log_run_summary(stats.summary(), start_urls=start_urls)
+    dump_metrics()
+    return stats
 
 if __name__ == "__main__":
     asyncio.run(crawl_book_urls())
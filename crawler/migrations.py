@@ -0,0 +1,103 @@
+"""
+One-off data migrations for the books collection.
+
+    python -m crawler.migrations backfill-numeric
+    python -m crawler.migrations extract-raw-html
+
+backfill-numeric normalizes stored price strings ("£51.77" -> "51.77"), adds the
+integer pence fields, and fills crawl_metadata.rating/category by re-parsing the
+stored page HTML where it is available. It only rewrites the fields it owns.
+
+extract-raw-html moves raw_html still inlined in book documents into the
+compressed raw_pages store and leaves a raw_html_ref behind.
+"""
+import sys
+from pymongo import UpdateOne
+from .clients import get_collection
+from .db import hash_text, load_raw_html
+from .blobstore import store_pages
+from .parser import normalize_price, price_to_pence
+from .lxml_parser import parse_book_page
+
+BACKFILL_PROJECTION = {
+    "_id": 1, "price_incl_tax": 1, "price_excl_tax": 1, "tax": 1,
+    "product_page_url": 1, "raw_html": 1, "raw_html_ref": 1, "crawl_metadata": 1,
+}
+
+def _backfill_update(doc):
+    update = {
+        "price_incl_tax": normalize_price(doc.get("price_incl_tax")),
+        "price_excl_tax": normalize_price(doc.get("price_excl_tax")),
+        "tax": normalize_price(doc.get("tax")),
+        "price_incl_tax_pence": price_to_pence(doc.get("price_incl_tax")),
+        "price_excl_tax_pence": price_to_pence(doc.get("price_excl_tax")),
+    }
+    metadata = doc.get("crawl_metadata") or {}
+    if metadata.get("rating") is None or metadata.get("category") is None:
+        html = doc.get("raw_html") or load_raw_html(doc.get("raw_html_ref"))
+    else:
+        html = None
+    if html:
+        parsed = parse_book_page(html, doc.get("product_page_url") or "")
+        update["crawl_metadata.rating"] = parsed.crawl_metadata.get("rating")
+        update["crawl_metadata.category"] = parsed.crawl_metadata.get("category")
+    return update
+
+def backfill_numeric_fields(books_collection=None, batch_size=500):
+    """
+    Backfill numeric prices, rating and category on books crawled before the
+    parser produced them. Idempotent; returns the number of documents updated.
+    """
+    target = books_collection if books_collection is not None else get_collection("books")
+    query = {"$or": [
+        {"price_incl_tax_pence": {"$exists": False}},
+        {"crawl_metadata.rating": {"$exists": False}},
+    ]}
+    updated = 0
+    ops = []
+    for doc in target.find(query, BACKFILL_PROJECTION, batch_size=batch_size):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": _backfill_update(doc)}))
+        if len(ops) >= batch_size:
+            updated += target.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += target.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+def extract_raw_html(books_collection=None, pages_collection=None, batch_size=200):
+    """
+    Move inlined raw_html out of book documents into the raw_pages store.
+    Idempotent; returns the number of documents slimmed down.
+    """
+    target = books_collection if books_collection is not None else get_collection("books")
+    pages = pages_collection if pages_collection is not None else get_collection("raw_pages")
+    updated = 0
+    batch = []
+
+    def flush():
+        store_pages(pages, [(hash_text(d["raw_html"]), d["raw_html"]) for d in batch])
+        ops = [
+            UpdateOne({"_id": d["_id"]}, {"$set": {"raw_html_ref": hash_text(d["raw_html"])}, "$unset": {"raw_html": ""}})
+            for d in batch
+        ]
+        return target.bulk_write(ops, ordered=False).modified_count
+
+    for doc in target.find({"raw_html": {"$type": "string"}}, {"_id": 1, "raw_html": 1}, batch_size=batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            updated += flush()
+            batch = []
+    if batch:
+        updated += flush()
+    return updated
+
+MIGRATIONS = {
+    "backfill-numeric": backfill_numeric_fields,
+    "extract-raw-html": extract_raw_html,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in MIGRATIONS:
+        print(f"usage: python -m crawler.migrations {{{'|'.join(MIGRATIONS)}}}")
+        sys.exit(2)
+    print(f"{sys.argv[1]}: {MIGRATIONS[sys.argv[1]]()} documents updated")
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any
+from datetime import datetime
 
 class Book(BaseModel):
     book_id: Optional[str] = None
@@ -7,6 +8,9 @@ class Book(BaseModel):
     price_incl_tax: Optional[str] = None
     price_excl_tax: Optional[str] = None
     tax: Optional[str] = None
+    # numeric copies of the prices in integer pence, used for filtering and sorting
+    price_incl_tax_pence: Optional[int] = None
+    price_excl_tax_pence: Optional[int] = None
     availability: Optional[str] = None
     product_description: Optional[str] = None
     upc: Optional[str] = None
@@ -14,7 +18,18 @@ class Book(BaseModel):
     image_url: Optional[str] = None
     product_page_url: Optional[str] = None
     raw_html: Optional[str] = None
+    # HTTP validators and body hash from the last crawl, used for conditional re-crawls
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
     crawl_metadata: Optional[Dict[str, Any]] = Field(default_factory=dict)
 
     class Config:
         orm_mode = True
+
+class ChangeLog(BaseModel):
+    book_id: str
+    change_type: str
+    timestamp: datetime
+    old_value: Dict[str, Any] = Field(default_factory=dict)
+    new_value: Dict[str, Any] = Field(default_factory=dict)
@@ -0,0 +1,43 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+def _parse_in_worker(parse_book, html: str, page_url: str):
+    """
+    Runs in a worker process. Parses the page and returns the BookRecord
+    without its raw_html, so only the extracted data is pickled back.
+    """
+    book = parse_book(html, page_url)
+    book.raw_html = None
+    return book
+
+class ParsePool:
+    """
+    Product page parse stage for the crawl.
+    With workers > 0 pages are parsed in a ProcessPoolExecutor so parsing scales
+    with cores instead of running on the event loop thread; otherwise parse_book
+    is called inline. parse_book must be a module-level function so it can be
+    sent to the worker processes.
+    """
+
+    def __init__(self, parse_book, workers=None):
+        self.parse_book = parse_book
+        self.workers = workers or 0
+        self._executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers else None
+
+    async def parse(self, html: str, page_url: str):
+        if self._executor is None:
+            return self.parse_book(html, page_url)
+        loop = asyncio.get_running_loop()
+        book = await loop.run_in_executor(self._executor, _parse_in_worker, self.parse_book, html, page_url)
+        book.raw_html = html
+        return book
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await asyncio.to_thread(self.close)
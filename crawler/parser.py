@@ -1,7 +1,44 @@
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
+from decimal import Decimal, InvalidOperation
 import re
-from models import Book
+from .records import BookRecord
+
+def _soup(html):
+    # bs4 is only imported by crawls that use this backend; the lxml backend shares the helpers below
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "html.parser")
+
+RATING_WORDS = {"One": 1, "Two": 2, "Three": 3, "Four": 4, "Five": 5}
+
+def normalize_price(value):
+    """
+    Strip the currency sign and whitespace from a price, e.g. "£51.77" -> "51.77".
+    """
+    if value is None:
+        return None
+    cleaned = re.sub(r"[^0-9.\-]", "", value)
+    return cleaned or None
+
+def price_to_pence(value):
+    """
+    Convert a price string ("£51.77" or "51.77") to integer pence, or None.
+    """
+    normalized = normalize_price(value)
+    if normalized is None:
+        return None
+    try:
+        return int((Decimal(normalized) * 100).to_integral_value())
+    except InvalidOperation:
+        return None
+
+def rating_from_classes(classes):
+    """
+    Map the classes of a "star-rating Three" element to 1-5, or None.
+    """
+    for c in classes or ():
+        if c in RATING_WORDS:
+            return RATING_WORDS[c]
+    return None
 
 def parse_list_page(html: str, base_url: str):
     """
@@ -9,7 +46,7 @@ def parse_list_page(html: str, base_url: str):
     Returns (books, next_page_url)
     books: list of dicts with keys: url, title, price
     """
-    soup = BeautifulSoup(html, "html.parser")
+    soup = _soup(html)
     books = []
     for article in soup.select("article.product_pod"):
         a = article.select_one("h3 a")
@@ -19,7 +56,7 @@ def parse_list_page(html: str, base_url: str):
         book_url = urljoin(base_url, href)
         title = a.get("title") or a.text.strip()
         price_tag = article.select_one(".product_price .price_color")
-        price = price_tag.text.strip() if price_tag else None
+        price = normalize_price(price_tag.text.strip()) if price_tag else None
         books.append({"url": book_url, "title": title, "price": price})
 
     next_a = soup.select_one("ul.pager li.next a")
@@ -28,39 +65,21 @@ def parse_list_page(html: str, base_url: str):
 
 def parse_book_page(html: str, page_url: str):
     """
-    Parse an individual book product page from books.toscrape and return models.Book
+    Parse an individual book product page from books.toscrape and return a records.BookRecord
     """
-    soup = BeautifulSoup(html, "html.parser")
+    soup = _soup(html)
 
     title_tag = soup.select_one("div.product_main h1")
     title = title_tag.text.strip() if title_tag else None
 
     # Table of product information
-    upc = None
-    price_excl = None
-    price_incl = None
-    tax = None
-    num_reviews = None
+    rows = []
     for tr in soup.select("table.table-striped tr"):
         th = tr.find("th")
         td = tr.find("td")
         if not th or not td:
             continue
-        key = th.text.strip()
-        val = td.text.strip()
-        if key == "UPC":
-            upc = val
-        elif key == "Price (excl. tax)":
-            price_excl = val
-        elif key == "Price (incl. tax)":
-            price_incl = val
-        elif key == "Tax":
-            tax = val
-        elif key == "Number of reviews":
-            try:
-                num_reviews = int(val)
-            except Exception:
-                num_reviews = None
+        rows.append((th.text.strip(), td.text.strip()))
 
     avail_tag = soup.select_one("p.instock.availability")
     availability = " ".join(avail_tag.stripped_strings) if avail_tag else None
@@ -73,7 +92,44 @@ def parse_book_page(html: str, page_url: str):
             desc = p.text.strip()
 
     img = soup.select_one("#product_gallery img")
-    image_url = urljoin(page_url, img["src"]) if img and img.get("src") else None
+    image_src = img.get("src") if img else None
+
+    rating_tag = soup.select_one("div.product_main p.star-rating")
+    rating = rating_from_classes(rating_tag.get("class")) if rating_tag else None
+
+    # Home > Books > Category > Title
+    crumbs = [a.text.strip() for a in soup.select("ul.breadcrumb li a")]
+    category = crumbs[-1] if len(crumbs) >= 3 else None
+
+    return build_book(html, page_url, title, rows, availability, desc, image_src, rating, category)
+
+def build_book(html, page_url, title, rows, availability, desc, image_src, rating=None, category=None):
+    """
+    Assemble a records.BookRecord from the raw values extracted from a product page.
+    Shared by every parser backend so they map fields identically.
+    rows: (header, value) pairs from the product information table.
+    """
+    upc = None
+    price_excl = None
+    price_incl = None
+    tax = None
+    num_reviews = None
+    for key, val in rows:
+        if key == "UPC":
+            upc = val
+        elif key == "Price (excl. tax)":
+            price_excl = normalize_price(val)
+        elif key == "Price (incl. tax)":
+            price_incl = normalize_price(val)
+        elif key == "Tax":
+            tax = normalize_price(val)
+        elif key == "Number of reviews":
+            try:
+                num_reviews = int(val)
+            except Exception:
+                num_reviews = None
+
+    image_url = urljoin(page_url, image_src) if image_src else None
 
     # attempt to derive an ID from URL like "..._1000/index.html"
     book_id = None
@@ -81,12 +137,14 @@ def parse_book_page(html: str, page_url: str):
     if m:
         book_id = m.group(1)
 
-    book = Book(
+    book = BookRecord(
         book_id=book_id,
         name=title or "",
         price_incl_tax=price_incl,
         price_excl_tax=price_excl,
         tax=tax,
+        price_incl_tax_pence=price_to_pence(price_incl),
+        price_excl_tax_pence=price_to_pence(price_excl),
         availability=availability,
         product_description=desc,
         upc=upc,
@@ -94,6 +152,11 @@ def parse_book_page(html: str, page_url: str):
         image_url=image_url,
         product_page_url=page_url,
         raw_html=html,
-        crawl_metadata={"site": "books.toscrape", "parsed_from": "product_page"},
+        crawl_metadata={
+            "site": "books.toscrape",
+            "parsed_from": "product_page",
+            "rating": rating,
+            "category": category,
+        },
     )
-    return book
\ No newline at end of file
+    return book
@@ -0,0 +1,234 @@
+"""
+Per-host politeness for the crawl: a token bucket caps the request rate, an
+AIMD limiter adapts concurrency to observed latency and errors, and 429/503
+answers with Retry-After pause the whole host, not just the request that got
+them.
+
+Used through HostScheduler.slot(url) around each request, see fetcher.fetch.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+THROTTLE_STATUSES = (429, 503)
+
+def parse_retry_after(value, now=None):
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or an HTTP date), or None.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return max(0.0, (when - now).total_seconds())
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average and bursts of up to `burst`.
+    A rate of None means unlimited.
+    """
+
+    def __init__(self, rate=None, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = float(burst or max(1.0, rate or 1.0))
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        async with self._lock:
+            while True:
+                now = self._clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AIMDLimiter:
+    """
+    Concurrency limit with additive increase (about +1 per limit's worth of good
+    responses) and multiplicative decrease when the smoothed latency exceeds
+    latency_target, the smoothed error rate exceeds max_error_rate, or the host
+    throttles us. Decreases happen at most once per cooldown seconds so one
+    burst of failures does not collapse the limit to the minimum.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32, latency_target=2.0, max_error_rate=0.1,
+                 backoff=0.5, cooldown=1.0, clock=time.monotonic):
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.max_error_rate = max_error_rate
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.latency = None
+        self.error_rate = 0.0
+        self._clock = clock
+        self._last_decrease = float("-inf")
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency, outcome="ok"):
+        """
+        outcome: "ok", "error" (transport error or 5xx), "throttled" (429/503) or
+        "cancelled", which frees the slot without counting as a signal.
+        """
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+            if outcome == "cancelled":
+                return
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            self.error_rate = 0.9 * self.error_rate + (0.1 if outcome != "ok" else 0.0)
+            if outcome == "throttled" or self.error_rate > self.max_error_rate or self.latency > self.latency_target:
+                now = self._clock()
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self.limit = max(float(self.minimum), self.limit * self.backoff)
+            elif outcome == "ok":
+                self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+
+class _Slot:
+    def __init__(self, host):
+        self.host = host
+        self.outcome = "error"
+
+    def observe(self, response):
+        """
+        Classify the response; a throttling answer pauses the whole host.
+        """
+        status = response.status_code
+        if status in THROTTLE_STATUSES:
+            self.outcome = "throttled"
+            self.host.throttled += 1
+            retry_after = parse_retry_after(response.headers.get("retry-after"))
+            self.host.block_for(retry_after if retry_after is not None else self.host.default_pause)
+        elif isinstance(status, int) and status >= 500:
+            self.outcome = "error"
+        else:
+            self.outcome = "ok"
+
+class HostState:
+    def __init__(self, host, bucket, limiter, max_pause, default_pause, clock):
+        self.host = host
+        self.bucket = bucket
+        self.limiter = limiter
+        self.max_pause = max_pause
+        self.default_pause = default_pause
+        self.blocked_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self._clock = clock
+
+    def block_for(self, seconds):
+        # never trust a server to pause us for longer than max_pause
+        until = self._clock() + min(seconds, self.max_pause)
+        self.blocked_until = max(self.blocked_until, until)
+
+    async def wait_unblocked(self):
+        while True:
+            delay = self.blocked_until - self._clock()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def metrics(self):
+        limiter = self.limiter
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "concurrency_limit": round(limiter.limit, 2),
+            "in_flight": limiter.in_flight,
+            "latency_ms": round(1000 * limiter.latency, 1) if limiter.latency is not None else None,
+            "error_rate": round(limiter.error_rate, 3),
+        }
+
+class HostScheduler:
+    """
+    Hands out request slots per host. Each host gets its own token bucket
+    (rate requests/second, burst) and AIMD concurrency limit between 1 and
+    max_concurrency, starting at initial_concurrency.
+    """
+
+    def __init__(self, rate=None, burst=None, initial_concurrency=4, max_concurrency=32, latency_target=2.0,
+                 max_pause=120.0, default_pause=5.0, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.max_pause = max_pause
+        self.default_pause = default_pause
+        self._clock = clock
+        self._hosts = {}
+
+    def host(self, url):
+        name = urlsplit(url).netloc
+        state = self._hosts.get(name)
+        if state is None:
+            state = self._hosts[name] = HostState(
+                name,
+                TokenBucket(self.rate, self.burst, clock=self._clock),
+                AIMDLimiter(self.initial_concurrency, maximum=self.max_concurrency,
+                            latency_target=self.latency_target, clock=self._clock),
+                self.max_pause,
+                self.default_pause,
+                self._clock,
+            )
+        return state
+
+    @asynccontextmanager
+    async def slot(self, url):
+        """
+        Wait until the host may be sent another request, then yield a slot whose
+        observe(response) must be called with the response. Exceptions count as errors.
+        """
+        state = self.host(url)
+        await state.wait_unblocked()
+        await state.limiter.acquire()
+        slot = _Slot(state)
+        started = self._clock()
+        try:
+            await state.bucket.acquire()
+            # a Retry-After may have arrived while we queued for a slot
+            await state.wait_unblocked()
+            started = self._clock()
+            yield slot
+        except asyncio.CancelledError:
+            slot.outcome = "cancelled"
+            raise
+        except BaseException:
+            slot.outcome = "error"
+            raise
+        finally:
+            if slot.outcome != "cancelled":
+                state.requests += 1
+                state.errors += slot.outcome == "error"
+            await state.limiter.release(self._clock() - started, slot.outcome)
+
+    def metrics(self):
+        return {name: state.metrics() for name, state in self._hosts.items()}
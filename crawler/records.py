@@ -0,0 +1,67 @@
+"""
+Compact book record for the crawl pipeline, from parse to write.
+
+Parsers build BookRecords out of values they extracted themselves, so there is
+nothing to validate: a record is a plain __slots__ object (no per-instance
+dict, no validation or model machinery) that is turned straight into its
+MongoDB document by db.book_document. models.Book stays the validated model
+for books that come from outside the crawler, and the API has its own
+response schemas.
+"""
+
+# stored fields, in models.Book order; raw_html travels with the record but is
+# stored separately (blobstore)
+FIELDS = (
+    "book_id", "name", "price_incl_tax", "price_excl_tax", "tax", "price_incl_tax_pence",
+    "price_excl_tax_pence", "availability", "product_description", "upc", "number_of_reviews", "image_url",
+    "product_page_url", "etag", "last_modified", "content_hash", "crawl_metadata",
+)
+
+class BookRecord:
+    __slots__ = FIELDS + ("raw_html",)
+
+    def __init__(self, name, book_id=None, price_incl_tax=None, price_excl_tax=None, tax=None,
+                 price_incl_tax_pence=None, price_excl_tax_pence=None, availability=None,
+                 product_description=None, upc=None, number_of_reviews=None, image_url=None,
+                 product_page_url=None, raw_html=None, etag=None, last_modified=None, content_hash=None,
+                 crawl_metadata=None):
+        self.book_id = book_id
+        self.name = name
+        self.price_incl_tax = price_incl_tax
+        self.price_excl_tax = price_excl_tax
+        self.tax = tax
+        self.price_incl_tax_pence = price_incl_tax_pence
+        self.price_excl_tax_pence = price_excl_tax_pence
+        self.availability = availability
+        self.product_description = product_description
+        self.upc = upc
+        self.number_of_reviews = number_of_reviews
+        self.image_url = image_url
+        self.product_page_url = product_page_url
+        self.raw_html = raw_html
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.crawl_metadata = crawl_metadata if crawl_metadata is not None else {}
+
+    def fields(self):
+        """
+        The stored fields as a new dict (raw_html excluded).
+        """
+        return {f: getattr(self, f) for f in FIELDS}
+
+    # explicit state so records pickle compactly to and from parse worker processes
+    def __getstate__(self):
+        return tuple(getattr(self, f) for f in self.__slots__)
+
+    def __setstate__(self, state):
+        for f, value in zip(self.__slots__, state):
+            setattr(self, f, value)
+
+    def __eq__(self, other):
+        if not isinstance(other, BookRecord):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self):
+        return f"BookRecord(book_id={self.book_id!r}, name={self.name!r})"
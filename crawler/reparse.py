@@ -0,0 +1,108 @@
+"""
+Re-extract books from a response archive instead of re-crawling the site.
+
+    python -m crawler.reparse data/archive
+    python -m crawler.reparse data/archive --parser bs4 --workers 4 --dry-run
+
+Streams the latest archived product page of every URL (see archive.py) through
+parse_book_page and saves the books in batches with db.save_books, exactly as
+a crawl would, so change_log records what the parser fix changed. Nothing is
+fetched; the archive is read sequentially from disk. No price_history
+snapshots are written: re-parsing is not a new observation of the site.
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+from .archive import Archive
+from .db import save_books
+from .fetcher import body_hash
+from .parser import parse_book_page
+from . import lxml_parser
+
+BACKENDS = {"bs4": parse_book_page, "lxml": lxml_parser.parse_book_page}
+
+def _parse(parse_book, html, url):
+    # may run in a worker process: only the extracted fields (or the error) travel back
+    try:
+        book = parse_book(html, url)
+    except Exception as e:
+        return e
+    book.raw_html = None
+    return book
+
+def _book(record, book):
+    book.raw_html = record.body
+    book.etag = record.headers.get("etag")
+    book.last_modified = record.headers.get("last-modified")
+    book.content_hash = body_hash(record.body)
+    return book
+
+def _save(books):
+    return save_books(books, snapshots=False)
+
+def _batches(iterable, size):
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+def reparse(archive, parser_backend="lxml", workers=0, batch_size=500, save=_save):
+    """
+    Parse every archived product page and hand the books to save batch_size
+    at a time. workers > 0 parses in that many processes.
+    Returns a summary dict.
+    """
+    parse_book = BACKENDS[parser_backend]
+    executor = ProcessPoolExecutor(max_workers=workers) if workers else None
+    pages = books = errors = 0
+    started = time.perf_counter()
+    try:
+        records = (r for r in archive if r.status == 200)
+        for batch in _batches(records, batch_size):
+            pages += len(batch)
+            args = (repeat(parse_book, len(batch)), [r.body for r in batch], [r.final_url for r in batch])
+            if executor is not None:
+                results = executor.map(_parse, *args, chunksize=max(1, len(batch) // (4 * workers)))
+            else:
+                results = map(_parse, *args)
+            parsed = []
+            for record, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    # one page the parser cannot handle must not stop the snapshot
+                    errors += 1
+                    print(f"Failed to parse {record.url}: {result}")
+                else:
+                    parsed.append(_book(record, result))
+            save(parsed)
+            books += len(parsed)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    elapsed = time.perf_counter() - started
+    return {
+        "pages": pages,
+        "books_saved": books,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "pages_per_second": round(pages / elapsed, 1) if elapsed else 0.0,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("archive", help="archive directory written by a crawl with CRAWL_ARCHIVE_DIR")
+    ap.add_argument("--parser", default="lxml", choices=sorted(BACKENDS))
+    ap.add_argument("--workers", type=int, default=0, help="parse processes, 0 = inline")
+    ap.add_argument("--batch-size", type=int, default=500)
+    ap.add_argument("--dry-run", action="store_true", help="parse only, write nothing")
+    args = ap.parse_args()
+
+    archive = Archive(args.archive)
+    try:
+        summary = reparse(archive, args.parser, args.workers, args.batch_size,
+                          save=(lambda books: None) if args.dry_run else _save)
+    finally:
+        archive.close()
+    print(f"Reparse finished: {summary}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import csv
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from .clients import get_collection
+from .settings import get_settings
+
+REPORT_FIELDS = ["book_id", "change_type", "timestamp", "old_value", "new_value"]
+REPORT_PROJECTION = {"_id": 0, **{f: 1 for f in REPORT_FIELDS}}
+
+def _open_text(path, compress):
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+def _row(doc):
+    ts = doc.get("timestamp")
+    return {
+        "book_id": str(doc.get("book_id")),
+        "change_type": doc.get("change_type"),
+        "timestamp": ts.isoformat() if ts else "",
+        "old_value": doc.get("old_value") or {},
+        "new_value": doc.get("new_value") or {},
+    }
+
+def generate_daily_change_report(output_dir=None, hours=24, batch_size=1000, compress=None,
+                                 changes_collection=None, now=None):
+    """
+    Stream the change_log entries of the last `hours` into a CSV and a JSON-lines
+    report, one row at a time, so memory stays constant regardless of volume.
+    Files are written under a temporary name and renamed into place once complete,
+    next to a small manifest with row count and timing.
+    Returns (json_path, csv_path), or (None, None) when there were no changes.
+    """
+    settings = get_settings()
+    output_dir = output_dir or settings.reports_dir
+    if compress is None:
+        compress = settings.report_gzip
+    source = changes_collection if changes_collection is not None else get_collection("change_log")
+    now = now or datetime.utcnow()
+    since = now - timedelta(hours=hours)
+    started = time.perf_counter()
+
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.join(output_dir, f"daily_changes_{now.strftime('%Y%m%d_%H%M%S')}")
+    suffix = ".gz" if compress else ""
+    json_path = f"{stem}.jsonl{suffix}"
+    csv_path = f"{stem}.csv{suffix}"
+    json_tmp = json_path + ".tmp"
+    csv_tmp = csv_path + ".tmp"
+
+    cursor = source.find({"timestamp": {"$gte": since}}, REPORT_PROJECTION, batch_size=batch_size)
+    rows = 0
+    try:
+        with _open_text(json_tmp, compress) as jf, _open_text(csv_tmp, compress) as cf:
+            writer = csv.DictWriter(cf, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            for doc in cursor.sort("timestamp", ASCENDING):
+                row = _row(doc)
+                jf.write(json.dumps(row, default=str))
+                jf.write("\n")
+                row["old_value"] = json.dumps(row["old_value"], default=str)
+                row["new_value"] = json.dumps(row["new_value"], default=str)
+                writer.writerow(row)
+                rows += 1
+    except BaseException:
+        for tmp in (json_tmp, csv_tmp):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        raise
+
+    if rows == 0:
+        os.remove(json_tmp)
+        os.remove(csv_tmp)
+        logging.info("No changes since %s, no report written", since.isoformat())
+        return None, None
+
+    os.replace(json_tmp, json_path)
+    os.replace(csv_tmp, csv_path)
+    elapsed = time.perf_counter() - started
+    manifest = {
+        "generated_at": now.isoformat(),
+        "window_start": since.isoformat(),
+        "rows": rows,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else None,
+        "files": {"json": json_path, "csv": csv_path},
+    }
+    manifest_tmp = f"{stem}.manifest.json.tmp"
+    with open(manifest_tmp, "w", encoding="utf-8") as mf:
+        json.dump(manifest, mf, indent=2)
+    os.replace(manifest_tmp, f"{stem}.manifest.json")
+    logging.info("Daily change report: %d rows in %.2fs", rows, elapsed)
+    return json_path, csv_path
@@ -0,0 +1,117 @@
+"""
+Configuration of the crawler, the scheduler and the API, read from the
+environment (and .env) once per process.
+
+    from crawler.settings import get_settings
+    get_settings().db_name
+
+Crawler modules read settings when they use them rather than at import, so a
+test or a script can set the environment first.
+"""
+import os
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+def _int(name, default):
+    return int(os.getenv(name, str(default)))
+
+def _float(name, default):
+    return float(os.getenv(name, str(default)))
+
+class Settings(NamedTuple):
+    # MongoDB
+    mongo_uri: Optional[str] = None
+    db_name: str = "default_db"
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    books_collection: str = "books"
+    change_log_collection: str = "change_log"
+    raw_pages_collection: str = "raw_pages"
+    cache_state_collection: str = "cache_state"
+    price_history_collection: str = "price_history"
+    price_stats_collection: str = "price_stats_daily"
+    # Celery
+    broker_url: str = "redis://localhost:6379/0"
+    result_backend: str = "redis://localhost:6379/1"
+    # crawl
+    parser_backend: str = "bs4"
+    parse_workers: int = 0
+    rate_limit: Optional[float] = None
+    max_connections: Optional[int] = None
+    http2: bool = False
+    discovery: str = "pager"
+    frontier_path: str = os.path.join("data", "frontier.sqlite3")
+    lease_seconds: float = 120.0
+    archive_dir: Optional[str] = None
+    profile: Optional[str] = None
+    shard_size: int = 100
+    shard_workers: int = 10
+    shard_concurrency: int = os.cpu_count() or 1
+    # reports and crawl metrics
+    reports_dir: str = "reports"
+    report_gzip: bool = False
+    pushgateway_url: Optional[str] = None
+    metrics_dump_path: str = os.path.join("logs", "crawl_metrics.prom")
+    run_log_path: str = os.path.join("logs", "crawl_runs.jsonl")
+    # API response cache and rate limits
+    response_cache_size: int = 1024
+    response_cache_ttl: float = 300.0
+    cache_sync_interval: float = 1.0
+    cache_redis_url: Optional[str] = None
+    rate_limit_enabled: bool = True
+    rate_limit_redis_url: Optional[str] = None
+    rate_limit_lease_ttl: float = 1.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mongo_uri=os.getenv("MONGO_URI"),
+            db_name=os.getenv("DB_NAME", "default_db"),
+            mongo_max_pool_size=_int("MONGO_MAX_POOL_SIZE", 100),
+            mongo_min_pool_size=_int("MONGO_MIN_POOL_SIZE", 0),
+            books_collection=os.getenv("COLLECTION_NAME", "books"),
+            change_log_collection=os.getenv("CHANGE_LOG_COLLECTION_NAME", "change_log"),
+            raw_pages_collection=os.getenv("RAW_PAGES_COLLECTION_NAME", "raw_pages"),
+            cache_state_collection=os.getenv("CACHE_STATE_COLLECTION_NAME", "cache_state"),
+            price_history_collection=os.getenv("PRICE_HISTORY_COLLECTION_NAME", "price_history"),
+            price_stats_collection=os.getenv("PRICE_STATS_COLLECTION_NAME", "price_stats_daily"),
+            broker_url=os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0"),
+            result_backend=os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/1"),
+            parser_backend=os.getenv("PARSER_BACKEND", "bs4"),
+            parse_workers=_int("PARSE_WORKERS", 0),
+            rate_limit=_float("CRAWL_RATE_LIMIT", 0) or None,
+            max_connections=_int("CRAWL_MAX_CONNECTIONS", 0) or None,
+            http2=os.getenv("CRAWL_HTTP2", "0") == "1",
+            discovery=os.getenv("CRAWL_DISCOVERY", "pager"),
+            frontier_path=os.getenv("CRAWL_FRONTIER_PATH", os.path.join("data", "frontier.sqlite3")),
+            lease_seconds=_float("CRAWL_LEASE_SECONDS", 120),
+            archive_dir=os.getenv("CRAWL_ARCHIVE_DIR") or None,
+            profile=os.getenv("CRAWL_PROFILE") or None,
+            shard_size=_int("CRAWL_SHARD_SIZE", 100),
+            shard_workers=_int("CRAWL_SHARD_WORKERS", 10),
+            shard_concurrency=_int("CRAWL_SHARD_CONCURRENCY", os.cpu_count() or 1),
+            reports_dir=os.getenv("REPORTS_DIR", "reports"),
+            report_gzip=os.getenv("REPORT_GZIP", "").lower() in ("1", "true", "yes"),
+            pushgateway_url=os.getenv("PUSHGATEWAY_URL") or None,
+            metrics_dump_path=os.getenv("METRICS_DUMP_PATH", os.path.join("logs", "crawl_metrics.prom")),
+            run_log_path=os.getenv("CRAWL_RUN_LOG", os.path.join("logs", "crawl_runs.jsonl")),
+            response_cache_size=_int("RESPONSE_CACHE_SIZE", 1024),
+            response_cache_ttl=_float("RESPONSE_CACHE_TTL", 300),
+            cache_sync_interval=_float("CACHE_SYNC_INTERVAL", 1.0),
+            cache_redis_url=os.getenv("CACHE_REDIS_URL") or None,
+            rate_limit_enabled=os.getenv("RATE_LIMIT_ENABLED", "1") != "0",
+            # the limiter shares the cache's Redis unless it has its own
+            rate_limit_redis_url=os.getenv("RATE_LIMIT_REDIS_URL") or os.getenv("CACHE_REDIS_URL") or None,
+            rate_limit_lease_ttl=_float("RATE_LIMIT_LEASE_TTL", 1.0),
+        )
+
+@lru_cache(maxsize=None)
+def get_settings():
+    """
+    The Settings of this process. get_settings.cache_clear() makes the next
+    call read the environment again.
+    """
+    load_dotenv()
+    return Settings.from_env()
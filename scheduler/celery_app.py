@@ -1,22 +1,28 @@
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown
+from crawler.settings import get_settings
 
 app = Celery(
     "book_crawler",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/1",
+    broker=get_settings().broker_url,
+    backend=get_settings().result_backend,
     include=['scheduler.tasks']
 )
 
 app.conf.beat_schedule = {
     "daily-book-crawl": {
-        "task": "scheduler.tasks.run_daily_crawl",
-        "schedule": crontab(hour=2, minute=0),  # Daily crawl at 2 AM UTC
-    },
-    "daily-change-report": {
-        "task": "scheduler.tasks.run_daily_change_report",
-        "schedule": crontab(hour=3, minute=0),  # Generate report 1 hour after crawl
+        "task": "scheduler.tasks.run_distributed_crawl",
+        "schedule": crontab(hour=2, minute=0),  # Daily crawl at 2 AM UTC, the report runs when it finishes
     },
 }
 
 app.conf.timezone = "UTC"
+
+
+@worker_process_shutdown.connect
+def _close_clients(**kwargs):
+    # the MongoClient a worker process built for its tasks (crawler/clients.py)
+    from crawler.clients import close_clients
+
+    close_clients()
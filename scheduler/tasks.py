@@ -1,14 +1,26 @@
+from celery import chord
 from scheduler.celery_app import app
-from crawler.main import crawl_book_urls
-from crawler.db import generate_daily_change_report
+from crawler.settings import get_settings
 
+# The crawler stack (httpx, parsers, pymongo, prometheus) is imported inside
+# the tasks that use it, so a worker starts quickly and a report task never
+# loads the crawl code.
 import asyncio
+import os
+import socket
+
+START_URLS = ["https://books.toscrape.com/"]
+
+# counters of CrawlStats.summary() that add up across shards
+SUMMED_STATS = ["list_pages", "book_pages", "books_saved", "skipped_not_modified", "skipped_unchanged", "errors"]
 
 @app.task
 def run_daily_crawl():
     """
     Celery task to run the book scraper daily.
     """
+    from crawler.main import crawl_book_urls
+
     asyncio.run(crawl_book_urls())
 
 
@@ -17,6 +29,148 @@ def run_daily_change_report():
     """
     Celery task to generate daily change report.
     """
+    from crawler.report import generate_daily_change_report
+
     json_file, csv_file = generate_daily_change_report()
     if json_file and csv_file:
         print(f"Daily report generated: {json_file}, {csv_file}")
+
+
+def shard_urls(urls, shard_size):
+    return [urls[i:i + shard_size] for i in range(0, len(urls), shard_size)]
+
+
+def aggregate_shard_stats(shard_stats):
+    """
+    Combine the per-shard crawl summaries into one summary for the whole crawl.
+    """
+    total = {key: sum(s.get(key, 0) for s in shard_stats) for key in SUMMED_STATS}
+    total["shards"] = len(shard_stats)
+    total["failed_shards"] = sum(1 for s in shard_stats if s.get("failed"))
+    total["max_queue_depth"] = max((s.get("max_queue_depth", 0) for s in shard_stats), default=0)
+    total["shard_seconds"] = round(sum(s.get("elapsed_seconds", 0.0) for s in shard_stats), 3)
+    total["slowest_shard_seconds"] = max((s.get("elapsed_seconds", 0.0) for s in shard_stats), default=0.0)
+    return total
+
+
+def shard_rate_limit(rate_limit, shards, concurrency):
+    """
+    Each shard's share of the per-host rate limit, so that the shards running at
+    once (at most concurrency of them) stay within rate_limit together.
+    """
+    if not rate_limit:
+        return None
+    return rate_limit / max(1, min(shards, concurrency))
+
+
+@app.task
+def run_distributed_crawl(start_urls=None, shard_size=None, max_pages=None):
+    """
+    Crawl the site as a Celery canvas: walk the list pages here, crawl the product
+    pages as a chord of crawl_shard tasks that any number of workers pick up, and
+    let finish_distributed_crawl aggregate the shard stats and start the report.
+    """
+    from crawler.db import ensure_indexes
+    from crawler.main import enumerate_book_urls
+
+    settings = get_settings()
+    # before any shard writes: the first insert would create price_history as a plain collection
+    ensure_indexes()
+    shard_size = shard_size or settings.shard_size
+    urls = asyncio.run(enumerate_book_urls(
+        start_urls or START_URLS, max_pages=max_pages, parser_backend=settings.parser_backend,
+        discovery=settings.discovery, rate_limit=settings.rate_limit, max_connections=settings.max_connections,
+    ))
+    shards = shard_urls(urls, shard_size)
+    print(f"Distributed crawl: {len(urls)} product pages in {len(shards)} shards")
+    if not shards:
+        return finish_distributed_crawl.delay([]).id
+    # CRAWL_SHARD_CONCURRENCY is how many shards the workers run at once
+    rate_limit = shard_rate_limit(settings.rate_limit, len(shards), settings.shard_concurrency)
+    return chord(crawl_shard.s(shard, index, rate_limit) for index, shard in enumerate(shards))(
+        finish_distributed_crawl.s()
+    ).id
+
+
+def _crawl_shard(urls, index, rate_limit, frontier_path):
+    from crawler.archive import Archive
+    from crawler.frontier import Frontier
+    from crawler.instrumentation import profiled
+    from crawler.main import crawl, crawl_options
+
+    settings = get_settings()
+    options = dict(crawl_options(settings), rate_limit=rate_limit)
+    os.makedirs(os.path.dirname(frontier_path) or ".", exist_ok=True)
+    frontier = Frontier(frontier_path, lease_seconds=settings.lease_seconds)
+    # shards archive into CRAWL_ARCHIVE_DIR side by side, each to its own segments
+    archive = None
+    if settings.archive_dir:
+        archive = Archive(settings.archive_dir, segment_prefix=f"shard-{index}-")
+    try:
+        with profiled(settings.profile, name=f"crawl_shard{index}"):
+            stats = asyncio.run(crawl(
+                urls,
+                product_pages=True,
+                conditional=True,
+                workers=settings.shard_workers,
+                report_interval=None,
+                frontier=frontier,
+                archive=archive,
+                **options,
+            ))
+    finally:
+        frontier.close()
+        if archive is not None:
+            archive.close()
+    return stats
+
+
+def _remove_frontier(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+@app.task(bind=True, max_retries=3, acks_late=True)
+def crawl_shard(self, urls, index, rate_limit=None):
+    """
+    Fetch, parse and save one shard of product pages and return its crawl summary.
+    Safe to retry: books are upserted by book_id and a re-saved book that did not
+    change records nothing in change_log. A shard that still fails after its
+    retries returns a summary marked failed, so the chord callback always runs.
+    """
+    from crawler.instrumentation import push_metrics
+
+    # a retry keeps the task id, so it resumes from the shard's own frontier file
+    frontier_path = os.path.join(os.path.dirname(get_settings().frontier_path), f"shard-{self.request.id}.sqlite3")
+    try:
+        stats = _crawl_shard(urls, index, rate_limit, frontier_path)
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        print(f"Shard {index} failed after {self.max_retries} retries: {e}")
+        _remove_frontier(frontier_path)
+        return {"shard": index, "failed": True, "error": str(e)}
+    _remove_frontier(frontier_path)
+    # each worker pushes its own cumulative metrics; a shard is too short to be scraped
+    push_metrics("crawler_shard", {"worker": f"{socket.gethostname()}:{os.getpid()}"})
+    summary = stats.summary()
+    summary["shard"] = index
+    return summary
+
+
+@app.task
+def finish_distributed_crawl(shard_stats):
+    """
+    Chord callback: runs once every shard has finished.
+    """
+    from crawler.db import bump_cache_generation, update_price_stats
+    from crawler.instrumentation import log_run_summary
+
+    total = aggregate_shard_stats(shard_stats)
+    print(f"Distributed crawl finished: {total}")
+    log_run_summary(total, distributed=True)
+    update_price_stats()
+    bump_cache_generation()
+    run_daily_change_report.delay()
+    return total
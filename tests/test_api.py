@@ -1,7 +1,7 @@
 # Python
 import pytest
 import pytest_asyncio
-from unittest.mock import AsyncMock, patch, call
+from unittest.mock import AsyncMock, MagicMock, patch, call
 
 from crawler.main import crawl
 
@@ -22,8 +22,19 @@ def mock_parse_book_page():
 
 @pytest_asyncio.fixture
 def mock_save_book():
-    with patch("crawler.main.save_book") as mock:
-        yield mock
+    with patch("crawler.main.BookWriter") as mock_writer:
+        writer = mock_writer.return_value
+        writer.__aenter__.return_value = writer
+        writer.flush = AsyncMock()
+        saved = AsyncMock()
+
+        async def add(book, on_saved=None):
+            await saved(book)
+            if on_saved is not None:
+                on_saved()
+
+        writer.add = add
+        yield saved
 
 @pytest.mark.asyncio
 async def test_crawl_single_page(
@@ -124,4 +135,732 @@ async def test_crawl_max_pages(
     assert mock_fetch.call_count == 4
     assert mock_parse_list_page.call_count == 2
     assert mock_parse_book_page.call_count == 2
-    assert mock_save_book.call_count == 2
\ No newline at end of file
+    assert mock_save_book.call_count == 2
+
+@pytest.mark.asyncio
+async def test_crawl_failed_book_page_does_not_stop_workers(
+    mock_fetch, mock_parse_list_page, mock_parse_book_page, mock_save_book
+):
+    mock_fetch.side_effect = [
+        ("<html>list</html>", "https://books.toscrape.com/"),
+        Exception("boom"),
+        ("<html>book2</html>", "https://books.toscrape.com/book2.html"),
+    ]
+    mock_parse_list_page.return_value = (
+        [
+            {"url": "https://books.toscrape.com/book1.html"},
+            {"url": "https://books.toscrape.com/book2.html"},
+        ],
+        None,
+    )
+    mock_parse_book_page.return_value = {"book_id": "book2"}
+
+    stats = await crawl(["https://books.toscrape.com/"], workers=1, queue_size=1)
+
+    mock_save_book.assert_called_once_with({"book_id": "book2"})
+    assert stats.errors == 1
+    assert stats.books_saved == 1
+    assert stats.list_pages == 1
+
+@pytest.mark.asyncio
+async def test_crawl_dedupes_book_urls_across_list_pages(
+    mock_fetch, mock_parse_list_page, mock_parse_book_page, mock_save_book
+):
+    mock_fetch.side_effect = [
+        ("<html>list1</html>", "https://books.toscrape.com/"),
+        ("<html>list2</html>", "https://books.toscrape.com/page2.html"),
+        ("<html>book1</html>", "https://books.toscrape.com/book1.html"),
+    ]
+    mock_parse_list_page.side_effect = [
+        ([{"url": "https://books.toscrape.com/book1.html"}], "https://books.toscrape.com/page2.html"),
+        ([{"url": "https://books.toscrape.com/book1.html"}], None),
+    ]
+    mock_parse_book_page.return_value = {"book_id": "book1"}
+
+    stats = await crawl(["https://books.toscrape.com/"])
+
+    assert mock_fetch.call_count == 3
+    assert stats.book_pages == 1
+    assert stats.max_queue_depth == 1
+
+@pytest.mark.asyncio
+async def test_crawl_conditional_skips_unchanged_pages(
+    mock_fetch, mock_parse_list_page, mock_parse_book_page, mock_save_book
+):
+    from crawler.fetcher import body_hash
+
+    same_html = "<html>same</html>"
+    states = {
+        "https://books.toscrape.com/book1.html": {"etag": '"v1"'},
+        "https://books.toscrape.com/book2.html": {"content_hash": body_hash(same_html)},
+    }
+    mock_fetch.side_effect = [
+        ("<html>list</html>", "https://books.toscrape.com/"),
+        (None, "https://books.toscrape.com/book1.html"),
+        (same_html, "https://books.toscrape.com/book2.html"),
+        ("<html>new</html>", "https://books.toscrape.com/book3.html"),
+    ]
+    mock_parse_list_page.return_value = (
+        [{"url": f"https://books.toscrape.com/book{i}.html"} for i in (1, 2, 3)],
+        None,
+    )
+    mock_parse_book_page.return_value = MagicMock()
+
+    with patch("crawler.main.load_page_states", return_value=states) as load_states:
+        stats = await crawl(["https://books.toscrape.com/"], workers=1, conditional=True)
+
+    # states are loaded for the batch of URLs queued from the list page, not for the whole catalogue
+    load_states.assert_called_once_with([f"https://books.toscrape.com/book{i}.html" for i in (1, 2, 3)])
+
+    assert mock_fetch.call_args_list[1].kwargs["validators"] == {"etag": '"v1"'}
+    mock_parse_book_page.assert_called_once_with("<html>new</html>", "https://books.toscrape.com/book3.html")
+    assert mock_save_book.call_count == 1
+    assert mock_parse_book_page.return_value.content_hash == body_hash("<html>new</html>")
+    assert stats.not_modified == 1
+    assert stats.unchanged == 1
+
+def _page_through(col, sort_by, page_size):
+    from api.pagination import sort_spec, encode_cursor, decode_cursor, keyset_filter
+
+    seen, cursor = [], None
+    while True:
+        query = keyset_filter(sort_by, *decode_cursor(cursor, sort_by)) if cursor else {}
+        docs = list(col.find(query).sort(sort_spec(sort_by)).limit(page_size))
+        seen.extend(d["book_id"] for d in docs)
+        if len(docs) < page_size:
+            return seen
+        cursor = encode_cursor(sort_by, docs[-1])
+
+@pytest.mark.parametrize("sort_by", ["rating", "price", "reviews"])
+def test_keyset_pagination_matches_full_sort(sort_by):
+    import mongomock
+    from api.pagination import sort_spec
+
+    col = mongomock.MongoClient().db.books
+    for i in range(47):
+        doc = {"book_id": f"{i:03d}", "price_incl_tax_pence": (i * 7) % 10 if i % 9 else None,
+               "number_of_reviews": i % 4}
+        if i % 5:
+            doc["crawl_metadata"] = {"rating": i % 5}
+        col.insert_one(doc)
+
+    expected = [d["book_id"] for d in col.find().sort(sort_spec(sort_by))]
+    assert _page_through(col, sort_by, page_size=6) == expected
+
+def test_decode_cursor_rejects_bad_or_foreign_cursors():
+    from api.pagination import encode_cursor, decode_cursor, InvalidCursor
+
+    cursor = encode_cursor("price", {"book_id": "7", "price_incl_tax_pence": 1250})
+    assert decode_cursor(cursor, "price") == (1250, "7")
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "rating")
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not-a-cursor", "price")
+
+def _api_book(book_id, **fields):
+    doc = {"book_id": book_id, "name": f"Book {book_id}", "price_incl_tax": None, "price_excl_tax": None,
+           "tax": None, "availability": None, "product_description": None, "upc": None,
+           "number_of_reviews": None, "image_url": None,
+           "product_page_url": f"https://books.toscrape.com/book_{book_id}/index.html"}
+    doc.update(fields)
+    return doc
+
+class _AsyncCursor:
+    """Minimal async cursor over a mongomock cursor, as returned by AsyncMongoClient."""
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def skip(self, n):
+        self._cursor = self._cursor.skip(n)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    async def to_list(self, length=None):
+        return list(self._cursor)
+
+    async def __aiter__(self):
+        for doc in self._cursor:
+            yield doc
+
+class _AsyncCollection:
+    def __init__(self, col):
+        self._col = col
+
+    def find(self, *args, **kwargs):
+        return _AsyncCursor(self._col.find(*args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return self._col.find_one(*args, **kwargs)
+
+    async def aggregate(self, pipeline):
+        return _AsyncCursor(iter(self._col.aggregate(_without_text_search(pipeline))))
+
+def _without_text_search(pipeline):
+    """mongomock has no $text or textScore: match any search word in name or description instead."""
+    import re
+
+    stages = []
+    for stage in pipeline:
+        match = stage.get("$match", {})
+        if "$text" in match:
+            words = "|".join(re.escape(w) for w in match["$text"]["$search"].split())
+            pattern = {"$regex": rf"\b({words})", "$options": "i"}
+            match = {k: v for k, v in match.items() if k != "$text"}
+            stage = {"$match": {**match, "$or": [{"name": pattern}, {"product_description": pattern}]}}
+        elif "$addFields" in stage and "score" in stage["$addFields"]:
+            stage = {"$addFields": {"score": {"$cond": [{"$regexMatch": {"input": "$name", "regex": words,
+                                                                          "options": "i"}}, 10, 1]}}}
+        stages.append(stage)
+    return stages
+
+@pytest.fixture
+def api_client():
+    import mongomock
+    from types import SimpleNamespace
+    from fastapi.testclient import TestClient
+    from api.main import app
+    from api.database import get_db
+    from api.cache import ResponseCache, get_cache
+
+    db = mongomock.MongoClient().db
+    fake = SimpleNamespace(books=_AsyncCollection(db.books), changes=_AsyncCollection(db.change_log),
+                           price_history=_AsyncCollection(db.price_history),
+                           price_stats=_AsyncCollection(db.price_stats_daily),
+                           raw_books=db.books, raw_changes=db.change_log, raw_state=db.cache_state,
+                           raw_history=db.price_history, raw_stats=db.price_stats_daily)
+    fake.cache = ResponseCache(state_collection=_AsyncCollection(db.cache_state), changes_collection=fake.changes,
+                               sync_interval=0)
+    app.dependency_overrides[get_db] = lambda: fake
+    app.dependency_overrides[get_cache] = lambda: fake.cache
+    app.state.limiter.enabled = False
+    try:
+        yield TestClient(app), fake
+    finally:
+        app.dependency_overrides.clear()
+        app.state.limiter.enabled = True
+
+def test_get_books_pages_with_cursor_from_async_collection(api_client):
+    client, db = api_client
+    for i in range(5):
+        db.raw_books.insert_one(_api_book(str(i), price_incl_tax_pence=100 * i, raw_html_ref="x",
+                                          crawl_metadata={"rating": 3}))
+
+    first = client.get("/books", params={"sort_by": "price", "page_size": 3})
+    assert first.status_code == 200
+    assert [b["book_id"] for b in first.json()] == ["0", "1", "2"]
+
+    second = client.get("/books", params={"sort_by": "price", "page_size": 3,
+                                          "cursor": first.headers["X-Next-Cursor"]})
+    assert [b["book_id"] for b in second.json()] == ["3", "4"]
+    assert "X-Next-Cursor" not in second.headers
+
+def test_get_book_and_changes_from_async_collection(api_client):
+    from datetime import datetime
+
+    client, db = api_client
+    db.raw_books.insert_one(_api_book("7", name="Seven"))
+    db.raw_changes.insert_one({"book_id": "7", "change_type": "insert", "timestamp": datetime(2024, 1, 1),
+                               "old_value": {}, "new_value": {"name": "Seven"}})
+
+    assert client.get("/books/7").json()["name"] == "Seven"
+    assert client.get("/books/8").status_code == 404
+    changes = client.get("/changes").json()
+    assert changes[0]["book_id"] == "7" and changes[0]["change_type"] == "insert"
+
+def test_metrics_endpoint_reports_request_latency_by_route(api_client):
+    from api.metrics import REGISTRY
+
+    client, db = api_client
+    db.raw_books.insert_one(_api_book("7"))
+    labels = {"method": "GET", "route": "/books/{book_id}", "status": "200"}
+    before = REGISTRY.get_sample_value("api_request_seconds_count", labels) or 0
+    client.get("/books/7")
+    client.get("/books/7")
+    assert REGISTRY.get_sample_value("api_request_seconds_count", labels) == before + 2
+
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain")
+    assert 'api_response_cache{stat="hits"} 1.0' in metrics.text
+    assert "api_requests_in_progress" in metrics.text
+
+def test_get_books_is_cached_with_etag_until_a_change_is_recorded(api_client):
+    from datetime import datetime
+
+    client, db = api_client
+    db.raw_books.insert_one(_api_book("1", crawl_metadata={"rating": 5}))
+
+    first = client.get("/books", params={"sort_by": "rating"})
+    assert first.headers["X-Cache"] == "MISS"
+    db.raw_books.update_one({"book_id": "1"}, {"$set": {"name": "Renamed"}})
+    # equivalent query string, same entry
+    second = client.get("/books", params={"page": 1, "sort_by": "rating"})
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.content == first.content
+    assert client.get("/books", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    db.raw_changes.insert_one({"book_id": "1", "change_type": "price_change", "timestamp": datetime(2030, 1, 1)})
+    third = client.get("/books")
+    assert third.headers["X-Cache"] == "MISS"
+    assert third.json()[0]["name"] == "Renamed"
+
+def test_get_book_cache_dropped_on_generation_bump(api_client):
+    client, db = api_client
+    db.raw_books.insert_one(_api_book("7", name="Seven"))
+
+    assert client.get("/books/7").headers["X-Cache"] == "MISS"
+    assert client.get("/books/7").headers["X-Cache"] == "HIT"
+    db.raw_state.insert_one({"_id": "generation", "value": 1})
+    db.raw_books.update_one({"book_id": "7"}, {"$set": {"name": "Sieben"}})
+    response = client.get("/books/7")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json()["name"] == "Sieben"
+    stats = client.get("/cache/stats").json()
+    assert stats["hits"] == 1 and stats["misses"] == 2 and stats["generation"] == 1
+
+@pytest.mark.asyncio
+async def test_response_cache_lru_eviction_and_ttl():
+    from api.cache import ResponseCache
+
+    now = [0.0]
+    cache = ResponseCache(max_entries=2, ttl=10, clock=lambda: now[0])
+    await cache.set("a", b"1")
+    await cache.set("b", b"2")
+    assert (await cache.get("a")).body == b"1"  # a is now most recent
+    await cache.set("c", b"3")
+    assert await cache.get("b") is None
+    assert cache.evictions == 1
+
+    now[0] = 11.0
+    assert await cache.get("a") is None
+    assert cache.metrics()["expirations"] == 1
+
+def test_export_streams_ndjson_with_bookout_fields_only(api_client):
+    import json
+
+    client, db = api_client
+    for i in (3, 1, 2):
+        db.raw_books.insert_one(_api_book(str(i), raw_html_ref="x", fingerprint="f",
+                                          crawl_metadata={"category": "Poetry" if i != 2 else "Travel"}))
+
+    response = client.get("/books/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [b["book_id"] for b in lines] == ["1", "2", "3"]
+    assert set(lines[0]) == set(_api_book("1"))
+
+    poetry = client.get("/books/export", params={"category": "Poetry"}).text.splitlines()
+    assert len(poetry) == 2
+
+@pytest.mark.asyncio
+async def test_crawl_resumes_from_frontier_checkpoint(
+    tmp_path, mock_fetch, mock_parse_list_page, mock_parse_book_page, mock_save_book
+):
+    from crawler.frontier import Frontier, LIST, BOOK
+
+    now = [1000.0]
+    path = str(tmp_path / "frontier.sqlite3")
+    killed = Frontier(path, lease_seconds=5, clock=lambda: now[0])
+    killed.start(["https://books.toscrape.com/"])
+    killed.claim(LIST)
+    killed.add(["https://books.toscrape.com/book1.html", "https://books.toscrape.com/book2.html",
+                "https://books.toscrape.com/book3.html"], BOOK, claim=True)
+    killed.done("https://books.toscrape.com/")
+    killed.done("https://books.toscrape.com/book1.html")
+    killed.failed("https://books.toscrape.com/book2.html", "boom")
+    killed.checkpoint()
+
+    # book3 was in flight when the crawl died; its lease has run out since
+    now[0] += 10
+    mock_fetch.side_effect = [("<html>book3</html>", "https://books.toscrape.com/book3.html")]
+    mock_parse_book_page.return_value = {"book_id": "book3"}
+    frontier = Frontier(path, lease_seconds=5, clock=lambda: now[0])
+    stats = await crawl(["https://books.toscrape.com/"], frontier=frontier)
+
+    assert stats.resumed
+    assert mock_fetch.call_count == 1
+    mock_parse_list_page.assert_not_called()
+    mock_save_book.assert_called_once_with({"book_id": "book3"})
+    assert frontier.counts() == {"done": 3, "failed": 1}
+
+@pytest.mark.asyncio
+async def test_crawl_shard_of_product_pages_and_enumerate_book_urls(
+    mock_fetch, mock_parse_list_page, mock_parse_book_page, mock_save_book
+):
+    from crawler.main import enumerate_book_urls
+
+    mock_fetch.side_effect = [
+        ("<html>list1</html>", "https://books.toscrape.com/"),
+        ("<html>list2</html>", "https://books.toscrape.com/page2.html"),
+    ]
+    mock_parse_list_page.side_effect = [
+        ([{"url": "https://books.toscrape.com/book1.html"}, {"url": "https://books.toscrape.com/book2.html"}],
+         "https://books.toscrape.com/page2.html"),
+        ([{"url": "https://books.toscrape.com/book2.html"}, {"url": "https://books.toscrape.com/book3.html"}], None),
+    ]
+    urls = await enumerate_book_urls(["https://books.toscrape.com/"])
+    assert urls == ["https://books.toscrape.com/book1.html", "https://books.toscrape.com/book2.html",
+                    "https://books.toscrape.com/book3.html"]
+
+    mock_fetch.side_effect = [("<html>book3</html>", "https://books.toscrape.com/book3.html")]
+    mock_parse_book_page.return_value = {"book_id": "book3"}
+    stats = await crawl(urls[2:], product_pages=True)
+    assert stats.list_pages == 0 and stats.book_pages == 1
+    mock_save_book.assert_called_once_with({"book_id": "book3"})
+
+def _list_site(books, per_page=2):
+    from benchmarks.corpus import render_list_page
+
+    base = "https://books.toscrape.com/"
+    count = -(-len(books) // per_page)
+    pages = {base: render_list_page(books[:per_page], 1, count, href_prefix="catalogue/")}
+    for n in range(2, count + 1):
+        pages[f"{base}catalogue/page-{n}.html"] = render_list_page(books[per_page * (n - 1):per_page * n], n, count)
+    return base, pages
+
+@pytest.mark.asyncio
+async def test_crawl_pager_discovery_fetches_list_pages_concurrently(mock_parse_book_page, mock_save_book):
+    import asyncio
+    from benchmarks.corpus import make_books
+
+    base, pages = _list_site(make_books(8))
+    active, peak = [0], [0]
+
+    async def fake_fetch(session, url, validators=None, scheduler=None, archive=None):
+        if url not in pages:
+            return "<html>book</html>", url
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.01)
+        active[0] -= 1
+        return pages[url], url
+
+    mock_parse_book_page.return_value = {"book_id": "x"}
+    with patch("crawler.main.fetch", new_callable=AsyncMock, side_effect=fake_fetch):
+        stats = await crawl([base], discovery="pager")
+
+    assert stats.list_pages == 4
+    assert peak[0] == 3  # pages 2-4 were all in flight at once
+    assert mock_save_book.call_count == 8
+
+@pytest.mark.asyncio
+async def test_crawl_category_discovery_tags_books(mock_save_book):
+    from crawler.models import Book
+
+    base = "https://books.toscrape.com/"
+    seed = """<div class="side_categories"><ul><li><a href="catalogue/category/books_1/index.html">Books</a><ul>
+        <li><a href="catalogue/category/books/travel_2/index.html">Travel</a></li>
+        <li><a href="catalogue/category/books/poetry_3/index.html">Poetry</a></li>
+        </ul></li></ul></div>"""
+    listings = {
+        base: ([{"url": f"{base}catalogue/a_1/index.html"}], None),
+        f"{base}catalogue/category/books/travel_2/index.html": ([{"url": f"{base}catalogue/a_1/index.html"}], None),
+        f"{base}catalogue/category/books/poetry_3/index.html": ([{"url": f"{base}catalogue/b_2/index.html"}], None),
+    }
+
+    async def fake_fetch(session, url, validators=None, scheduler=None, archive=None):
+        return (seed if url == base else "<html></html>"), url
+
+    with patch("crawler.main.fetch", new_callable=AsyncMock, side_effect=fake_fetch), \
+            patch("crawler.main.parse_list_page", side_effect=lambda html, url: listings[url]), \
+            patch("crawler.main.parse_book_page", side_effect=lambda html, url: Book(name=url, product_page_url=url)):
+        stats = await crawl([base], discovery="categories")
+
+    assert stats.list_pages == 3
+    saved = {b.product_page_url: b.crawl_metadata["category"] for (b,), _ in mock_save_book.call_args_list}
+    assert saved == {f"{base}catalogue/a_1/index.html": "Travel", f"{base}catalogue/b_2/index.html": "Poetry"}
+
+@pytest.mark.asyncio
+async def test_crawl_end_to_end_against_stand_in_site(mock_save_book):
+    from benchmarks.standin_site import StandInSite, serve
+
+    site = StandInSite(books=45, per_page=10, error_rate=0.1, seed=3)
+    runner, base = await serve(site)
+    try:
+        stats = await crawl([base], workers=5, report_interval=None, parser_backend="lxml", discovery="pager")
+    finally:
+        await runner.cleanup()
+
+    assert stats.list_pages == 5 and stats.errors == 0
+    saved = sorted(int(b.book_id) for (b,), _ in mock_save_book.call_args_list)
+    assert saved == list(range(1, 46))
+    # every 503 was retried
+    assert site.requests == 50 + site.errors
+    book = next(b for (b,), _ in mock_save_book.call_args_list if b.book_id == "7")
+    assert book.price_incl_tax == site.book(7)["price_incl_tax"]
+
+@pytest.mark.asyncio
+async def test_enumerate_book_urls_follows_the_rate_limit():
+    from benchmarks.standin_site import StandInSite, serve
+    from crawler.main import enumerate_book_urls
+    from crawler.politeness import HostScheduler
+
+    runner, base = await serve(StandInSite(books=30, per_page=10))
+    try:
+        with patch("crawler.main.HostScheduler", wraps=HostScheduler) as scheduler:
+            urls = await enumerate_book_urls([base], parser_backend="lxml", discovery="pager", rate_limit=50.0,
+                                             max_connections=3, concurrency=3)
+    finally:
+        await runner.cleanup()
+
+    assert len(urls) == 30
+    assert scheduler.call_args.kwargs["rate"] == 50.0 and scheduler.call_args.kwargs["max_concurrency"] == 3
+
+@pytest.mark.asyncio
+async def test_crawl_bench_smoke_run_on_mongomock():
+    from benchmarks import crawl_bench
+    from benchmarks.standin_site import StandInSite, serve
+
+    runner, base = await serve(StandInSite(books=30, per_page=10))
+    try:
+        db = crawl_bench.collections(None, "crawl_bench_test")
+        result = await crawl_bench.run(base, db, 5, "lxml", 0, "pager", None, None)
+    finally:
+        await runner.cleanup()
+
+    assert result["books_saved"] == 30 and result["errors"] == 0
+    assert db.books.count_documents({}) == 30 and db.books.database.price_history.count_documents({}) == 30
+    assert result["db_docs_per_s"] > 0
+
+@pytest.mark.asyncio
+async def test_api_load_in_process_run():
+    from benchmarks import api_load
+
+    app = api_load.in_process_app(books=30, latency=0.001, blocking=False)
+    try:
+        result = await api_load.run("http://api", clients=5, duration=0.3, paths=api_load.DEFAULT_PATHS, app=app)
+    finally:
+        app.dependency_overrides.clear()
+        app.state.limiter.enabled = True
+
+    assert result["requests"] > 0 and result["errors"] == 0
+
+def test_cache_and_rate_limiter_configured_from_settings(monkeypatch):
+    from api.cache import ResponseCache
+    from api.ratelimit import RateLimiter
+    from crawler.settings import Settings
+
+    for name in ("CACHE_REDIS_URL", "RATE_LIMIT_REDIS_URL"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("RESPONSE_CACHE_SIZE", "7")
+    monkeypatch.setenv("CACHE_SYNC_INTERVAL", "0.5")
+    monkeypatch.setenv("RATE_LIMIT_ENABLED", "0")
+    monkeypatch.setenv("RATE_LIMIT_LEASE_TTL", "2.5")
+    settings = Settings.from_env()
+    monkeypatch.setattr("api.cache.get_settings", lambda: settings)
+    monkeypatch.setattr("api.ratelimit.get_settings", lambda: settings)
+
+    cache = ResponseCache.from_env()
+    assert (cache.max_entries, cache.sync_interval, cache.redis) == (7, 0.5, None)
+    limiter = RateLimiter.from_env()
+    assert not limiter.enabled and limiter.lease_ttl == 2.5
+
+def test_rate_limit_spec_parsing():
+    from api.ratelimit import Limit
+
+    assert Limit.parse("100/hour") == Limit(100, 3600.0)
+    assert Limit.parse("10/second").interval == 0.1
+    assert Limit.parse("1000/5 minutes") == Limit(1000, 300.0)
+    with pytest.raises(ValueError):
+        Limit.parse("100/fortnight")
+
+@pytest.mark.asyncio
+async def test_local_rate_limit_store_is_gcra():
+    from api.ratelimit import Limit, LocalStore
+
+    now = [0.0]
+    store = LocalStore(clock=lambda: now[0])
+    limit = Limit.parse("3/minute")
+    assert (await store.acquire("k", limit, 2)).granted == 2
+    assert (await store.acquire("k", limit, 2)).granted == 1
+    denied = await store.acquire("k", limit, 1)
+    assert denied.granted == 0 and denied.retry_after == pytest.approx(20.0)
+    now[0] = 20.0
+    assert (await store.acquire("k", limit, 1)).granted == 1
+    await store.refund("k", limit, 1)
+    assert (await store.acquire("k", limit, 5)).granted == 1
+    assert (await store.acquire("other", limit, 5)).granted == 3
+
+@pytest.mark.asyncio
+async def test_redis_rate_limit_is_exact_across_workers_and_mostly_local():
+    import fakeredis
+    from api.ratelimit import Limit, RateLimiter, RedisStore
+
+    server = fakeredis.FakeServer()
+    now = [0.0]
+    workers = [RateLimiter(RedisStore(fakeredis.FakeAsyncRedis(server=server)), lease_ttl=5.0,
+                           clock=lambda: now[0]) for _ in range(4)]
+    limit = Limit.parse("1000/hour")  # leases of 10 tokens
+
+    allowed = 0
+    for i in range(1200):
+        ok, retry_after = await workers[i % 4].hit("key:a", limit)
+        allowed += ok
+    assert allowed == 1000
+    assert not ok and 3 < retry_after <= 3.6  # one token every 3.6s
+    assert sum(w.store_calls for w in workers) <= 110
+    assert (await workers[0].hit("key:b", limit))[0]
+
+    # tokens a worker leased but did not use go back to the shared budget
+    now[0] = 10.0
+    await workers[1].hit("key:c", limit)
+    now[0] = 20.0
+    await workers[1].close()
+    for w in workers[2:]:
+        await w.close()
+    fresh = RateLimiter(RedisStore(fakeredis.FakeAsyncRedis(server=server)), lease_divisor=1, max_lease=1000)
+    assert (await fresh.store.acquire("key:c", limit, 1000)).granted >= 999
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_refunded_once_by_concurrent_requests():
+    import asyncio
+    from api.ratelimit import Limit, LocalStore, RateLimiter
+
+    class SlowStore(LocalStore):
+        refunded = 0
+
+        async def refund(self, key, limit, tokens):
+            self.refunded += tokens
+            await asyncio.sleep(0)
+            await super().refund(key, limit, tokens)
+
+    now = [0.0]
+    store = SlowStore(clock=lambda: now[0])
+    limiter = RateLimiter(store, lease_ttl=1.0, clock=lambda: now[0])
+    limit = Limit.parse("1000/hour")  # leases of 10 tokens
+    assert (await limiter.hit("k", limit))[0]
+    now[0] = 2.0
+    # both requests find the lease expired while it still holds 9 tokens
+    await asyncio.gather(limiter.hit("k", limit), limiter.hit("k", limit))
+    assert store.refunded == 9
+
+@pytest.mark.asyncio
+async def test_rate_limiter_drops_idle_leases_and_caps_keys():
+    from api.ratelimit import Limit, LocalStore, RateLimiter
+
+    now = [0.0]
+    store = LocalStore(clock=lambda: now[0], max_keys=100)
+    limiter = RateLimiter(store, clock=lambda: now[0], max_keys=10)
+    small, big = Limit.parse("2/hour"), Limit.parse("100000/hour")
+    for i in range(500):
+        assert (await limiter.hit(f"key:{i}", small))[0]
+    # single-token leases are spent at once and not kept
+    assert len(limiter._leases) == 0
+    assert len(store._tats) <= 100
+    for i in range(50):
+        await limiter.hit(f"key:{i}", big)
+    assert len(limiter._leases) == 10
+    # denials are remembered until their retry time
+    for _ in range(2):
+        await limiter.hit("key:fresh", small)
+    assert not (await limiter.hit("key:fresh", small))[0]
+    assert limiter._leases[("key:fresh", small)].blocked_until > now[0]
+    # TATs in the past are swept before live keys are forgotten
+    now[0] = 7200.0
+    await store.acquire("key:late", small, 1)
+    for i in range(100):
+        await store.acquire(f"key:later{i}", small, 1)
+    assert "key:fresh" not in store._tats and "key:later99" in store._tats
+
+def test_api_rate_limit_returns_429_with_retry_after(api_client):
+    from api.main import app
+    from api.ratelimit import RateLimiter
+
+    client, db = api_client
+    db.raw_books.insert_one(_api_book("7"))
+    previous, app.state.limiter = app.state.limiter, RateLimiter()
+    try:
+        statuses = [client.get("/books/7").status_code for _ in range(101)]
+        assert statuses.count(200) == 100 and statuses[-1] == 429
+        limited = client.get("/books/7")
+        assert limited.status_code == 429 and int(limited.headers["Retry-After"]) > 0
+        # limits are per route
+        assert client.get("/changes").status_code == 200
+        # a bad key is turned away before the limiter sees it
+        leases = len(app.state.limiter._leases)
+        for i in range(20):
+            assert client.get("/books/7", headers={"X-API-Key": f"junk-{i}"}).status_code == 401
+        assert len(app.state.limiter._leases) == leases
+    finally:
+        app.state.limiter = previous
+
+def test_book_history_and_price_stats_endpoints(api_client):
+    from datetime import datetime
+    from crawler.history import append_snapshots, rollup_day
+
+    client, db = api_client
+    for day, pence, availability in [(1, 1000, "In stock (3 available)"), (2, 950, "In stock (1 available)"),
+                                     (9, 1200, "Out of stock")]:
+        append_snapshots(db.raw_history, [{"book_id": "7", "price_incl_tax_pence": pence,
+                                           "availability": availability,
+                                           "crawl_metadata": {"category": "Poetry"}}], datetime(2024, 1, day))
+        db.raw_books.delete_many({})
+        db.raw_books.insert_many([
+            _api_book("7", price_incl_tax_pence=pence, availability=availability,
+                      crawl_metadata={"category": "Poetry"}),
+            _api_book("8", price_incl_tax_pence=2000, availability="In stock", crawl_metadata={"category": "Travel"}),
+        ])
+        rollup_day(db.raw_books, db.raw_stats, datetime(2024, 1, day))
+
+    history = client.get("/books/7/history").json()
+    assert [p["price"] for p in history] == ["10.00", "9.50", "12.00"]
+    assert history[0] == {"timestamp": "2024-01-01T00:00:00", "price": "10.00", "in_stock": True, "stock": 3}
+    assert history[2]["in_stock"] is False and history[2]["stock"] == 0
+    ranged = client.get("/books/7/history", params={"start": "2024-01-02", "end": "2024-01-09"}).json()
+    assert [p["price"] for p in ranged] == ["9.50"]
+    # limit keeps the latest snapshots, still oldest first
+    latest = client.get("/books/7/history", params={"limit": 2}).json()
+    assert [p["price"] for p in latest] == ["9.50", "12.00"]
+
+    days = client.get("/stats/prices").json()
+    assert [d["bucket"] for d in days] == ["2024-01-01", "2024-01-02", "2024-01-09"]
+    assert days[0] == {"bucket": "2024-01-01", "category": "all", "books": 2, "avg_price": "15.00",
+                       "min_price": "10.00", "max_price": "20.00", "in_stock": 2}
+    # 2024-01-01 is a Monday: the first two days share a week
+    weeks = client.get("/stats/prices", params={"bucket": "week", "category": "Poetry"}).json()
+    assert [(w["bucket"], w["avg_price"], w["min_price"], w["in_stock"]) for w in weeks] == [
+        ("2024-01-01", "9.75", "9.50", 1), ("2024-01-08", "12.00", "12.00", 0)]
+    assert client.get("/stats/prices", params={"bucket": "year"}).status_code == 400
+
+def test_search_returns_ranked_matches_and_facets(api_client):
+    from api.schemas import BookOut
+    from api.search import search_pipeline
+
+    client, db = api_client
+    db.raw_books.insert_many([
+        _api_book("1", name="The Dragon's Tale", product_description="A story.", price_incl_tax_pence=1250,
+                  crawl_metadata={"category": "Fantasy", "rating": 5}),
+        _api_book("2", name="Gardening", product_description="Nothing like a dragon in the garden.",
+                  price_incl_tax_pence=4599, crawl_metadata={"category": "Home", "rating": 3}),
+        _api_book("3", name="Dragon Riders", price_incl_tax_pence=1999,
+                  crawl_metadata={"category": "Fantasy", "rating": 4}),
+        _api_book("4", name="Cooking", product_description="Recipes.", price_incl_tax_pence=999,
+                  crawl_metadata={"category": "Food", "rating": 5}),
+        _api_book("5", name="Dragons, unpriced", crawl_metadata={"category": "Fantasy"}),
+    ])
+    assert search_pipeline("dragon", {"crawl_metadata.rating": 5})[0] == {
+        "$match": {"$text": {"$search": "dragon"}, "crawl_metadata.rating": 5}}
+
+    body = client.get("/books/search", params={"q": "dragon"}).json()
+    assert body["total"] == 4
+    # title matches first, then by book_id
+    assert [b["book_id"] for b in body["results"]] == ["1", "3", "5", "2"]
+    assert set(body["results"][0]) == set(BookOut.model_fields)
+    assert body["facets"]["category"] == [{"value": "Fantasy", "count": 3}, {"value": "Home", "count": 1}]
+    assert body["facets"]["rating"] == [{"value": "5", "count": 1}, {"value": "4", "count": 1},
+                                        {"value": "3", "count": 1}]
+    assert body["facets"]["price"] == [{"value": "10-20", "count": 2}, {"value": "40-50", "count": 1},
+                                       {"value": "unknown", "count": 1}]
+
+    page = client.get("/books/search", params={"q": "dragon", "category": "Fantasy", "page_size": 2, "page": 2})
+    assert page.headers["X-Cache"] == "MISS"
+    assert [b["book_id"] for b in page.json()["results"]] == ["5"] and page.json()["total"] == 3
+    assert client.get("/books/search").status_code == 422
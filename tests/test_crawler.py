@@ -70,6 +70,23 @@ async def test_fetch_success():
             assert text == "<html></html>"
             assert url == "https://books.toscrape.com/"
 
+@pytest.mark.asyncio
+async def test_fetch_conditional_not_modified():
+    mock_response = MagicMock()
+    mock_response.status_code = 304
+    mock_response.url = "https://books.toscrape.com/"
+    mock_response.headers = {"etag": '"v2"'}
+    session = MagicMock()
+    session.get = AsyncMock(return_value=mock_response)
+    validators = {"etag": '"v1"', "last_modified": "Wed, 01 Oct 2025 00:00:00 GMT"}
+    text, url = await fetch(session, "https://books.toscrape.com/", validators=validators)
+    assert text is None
+    sent = session.get.call_args.kwargs["headers"]
+    assert sent["If-None-Match"] == '"v1"'
+    assert sent["If-Modified-Since"] == "Wed, 01 Oct 2025 00:00:00 GMT"
+    assert validators["etag"] == '"v2"'
+    mock_response.raise_for_status.assert_not_called()
+
 def test_book_model():
     book = Book(
         book_id="1",
@@ -124,9 +141,682 @@ def test_hash_book_and_save_book(monkeypatch):
     h = hash_book(book)
     assert isinstance(h, str)
     # Patch MongoDB calls in save_book
-    monkeypatch.setattr("crawler.db.collection.find_one", lambda q: None)
-    monkeypatch.setattr("crawler.db.collection.update_one", lambda q, u, upsert: None)
-    monkeypatch.setattr("crawler.db.change_log_collection.insert_one", lambda doc: None)
+    collections = {name: MagicMock() for name in ("books", "change_log", "raw_pages", "price_history")}
+    collections["books"].find_one_and_update.return_value = None
+    collections["raw_pages"].find.return_value = []
+    monkeypatch.setattr("crawler.db.get_collection", collections.__getitem__)
     monkeypatch.setattr("crawler.db.logging", MagicMock())
     # Should not raise
-    save_book(book)
\ No newline at end of file
+    save_book(book)
+    collections["books"].find_one_and_update.assert_called_once()
+    assert collections["change_log"].insert_many.call_args.args[0][0]["change_type"] == "insert"
+    collections["price_history"].insert_many.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_book_writer_batches_and_final_flush():
+    from crawler.db import BookWriter
+
+    books_col = MagicMock()
+    changes_col = MagicMock()
+    books = [Book(book_id=str(i), name=f"Book {i}") for i in range(5)]
+    async with BookWriter(batch_size=2, flush_interval=60, books_collection=books_col,
+                          changes_collection=changes_col) as writer:
+        for b in books:
+            await writer.add(b)
+        assert writer.backlog == 1
+    # two size-triggered batches plus the final flush on exit
+    assert books_col.bulk_write.call_count == 3
+    ops, = books_col.bulk_write.call_args_list[0].args
+    assert len(ops) == 2
+    assert books_col.bulk_write.call_args_list[0].kwargs == {"ordered": False}
+    metrics = writer.metrics()
+    assert metrics["docs_written"] == 5
+    assert metrics["batches"] == 3
+    assert metrics["backlog"] == 0
+
+@pytest.mark.asyncio
+async def test_book_writer_keeps_a_failed_batch_and_raises():
+    from crawler.db import BookWriter
+
+    books_col = MagicMock()
+    books_col.bulk_write.side_effect = [ConnectionError("primary stepped down"), None, None]
+    saved = []
+    books = [Book(book_id=str(i), name=f"Book {i}") for i in range(5)]
+    writer = BookWriter(batch_size=3, flush_interval=60, books_collection=books_col,
+                        changes_collection=MagicMock(), history_collection=MagicMock())
+    async with writer:
+        for b in books[:2]:
+            await writer.add(b, on_saved=lambda b=b: saved.append(b.book_id))
+        with pytest.raises(ConnectionError):
+            await writer.add(books[2], on_saved=lambda: saved.append("2"))
+        # nothing was written, so nothing counts as saved and the batch is kept
+        assert saved == [] and writer.backlog == 3
+        for b in books[3:]:
+            await writer.add(b, on_saved=lambda b=b: saved.append(b.book_id))
+    assert saved == ["0", "1", "2", "3", "4"]
+    # the retry sends the kept batch first, then what was added since
+    (ops,), _ = books_col.bulk_write.call_args_list[1]
+    assert [op._filter["book_id"] for op in ops] == ["0", "1", "2", "3"]
+    assert writer.metrics()["docs_written"] == 5 and writer.metrics()["failed_flushes"] == 1
+
+    # a write that still fails on exit reaches the crawl
+    books_col.bulk_write.side_effect = ConnectionError("down")
+    with pytest.raises(ConnectionError):
+        async with BookWriter(books_collection=books_col, changes_collection=MagicMock(),
+                              history_collection=MagicMock()) as writer:
+            await writer.add(books[0])
+    assert writer.backlog == 1
+
+@pytest.mark.asyncio
+async def test_book_writer_snapshots_saved_and_unchanged_books():
+    import mongomock
+    from crawler.db import BookWriter
+    from crawler.history import stock_count
+
+    assert stock_count("In stock (19 available)") == 19
+    assert stock_count("Out of stock") == 0 and stock_count("In stock") is None
+    db = mongomock.MongoClient().db
+    books_col = MagicMock()
+    async with BookWriter(books_collection=books_col, changes_collection=MagicMock(),
+                          history_collection=db.price_history) as writer:
+        await writer.add(Book(book_id="1", name="Saved", price_incl_tax_pence=1250, availability="In stock (2 available)",
+                              crawl_metadata={"category": "Poetry"}))
+        writer.observe({"book_id": "2", "price_incl_tax_pence": 300, "availability": "Out of stock"})
+        writer.observe({"product_page_url": "http://page"})  # never stored, nothing to snapshot
+    snapshots = {s["meta"]["book_id"]: s for s in db.price_history.find({}, {"_id": 0, "ts": 0})}
+    assert snapshots == {
+        "1": {"meta": {"book_id": "1", "category": "Poetry"}, "price": 1250, "in_stock": True, "stock": 2},
+        "2": {"meta": {"book_id": "2"}, "price": 300, "in_stock": False, "stock": 0},
+    }
+    assert writer.metrics()["unchanged_snapshots"] == 1
+
+def test_ensure_history_collections_converts_a_plain_collection():
+    import mongomock
+    from crawler.history import ensure_history_collections
+
+    db = mongomock.MongoClient().db
+    db.price_history.insert_many([{"ts": datetime(2024, 1, d), "meta": {"book_id": "1"}, "price": d}
+                                  for d in (1, 2)])
+    created = []
+
+    def create_collection(name, **options):
+        # mongomock has no time-series collections (nor list_collections)
+        created.append((name, options))
+        return db[name]
+
+    db.create_collection = create_collection
+    db.list_collections = lambda filter: [{"name": n, "type": "collection"}
+                                          for n in db.list_collection_names() if n == filter["name"]]
+    ensure_history_collections(db, "price_history", "price_stats_daily")
+    assert created == [("price_history", {"timeseries": {"timeField": "ts", "metaField": "meta",
+                                                         "granularity": "hours"}})]
+    assert sorted(p["price"] for p in db.price_history.find()) == [1, 2]
+    assert "price_history_unconverted" not in db.list_collection_names()
+
+    timeseries_db = MagicMock()
+    timeseries_db.list_collections.return_value = [{"name": "price_history", "type": "timeseries"}]
+    ensure_history_collections(timeseries_db, "price_history", "price_stats_daily")
+    timeseries_db.create_collection.assert_not_called()
+
+def test_parser_backends_golden_equivalence():
+    from crawler import lxml_parser
+    from crawler import parser as bs4_parser
+    from benchmarks.corpus import generate_site_pages, load_sample
+
+    sample = load_sample()
+    pages = list(generate_site_pages(45, per_page=20))
+    pages.append((sample["product_page_url"], sample["raw_html"]))
+    for url, html in pages:
+        if "/page-" in url:
+            assert lxml_parser.parse_list_page(html, url) == bs4_parser.parse_list_page(html, url)
+        else:
+            assert lxml_parser.parse_book_page(html, url) == bs4_parser.parse_book_page(html, url)
+
+@pytest.mark.asyncio
+async def test_parse_pool_matches_inline_parsing():
+    from crawler.parse_pool import ParsePool
+    from crawler import lxml_parser
+    from benchmarks.corpus import generate_site_pages
+
+    pages = [(u, h) for u, h in generate_site_pages(6, per_page=20) if "/page-" not in u]
+    async with ParsePool(lxml_parser.parse_book_page, workers=2) as pool:
+        for url, html in pages:
+            book = await pool.parse(html, url)
+            assert book == lxml_parser.parse_book_page(html, url)
+
+
+def test_book_record_matches_book_model_and_pickles():
+    import pickle
+    from crawler.db import book_document
+    from crawler.records import FIELDS, BookRecord
+
+    assert set(FIELDS) | {"raw_html"} == set(Book.model_fields)
+    values = dict(book_id="1", name="B", price_incl_tax="10.00", price_incl_tax_pence=1000,
+                  availability="In stock (3 available)", number_of_reviews=1, product_description="Text",
+                  product_page_url="http://page", raw_html="<html></html>", crawl_metadata={"rating": 4})
+    record = BookRecord(**values)
+    assert not hasattr(record, "__dict__")
+    assert book_document(record) == book_document(Book(**values))
+    assert book_document(record)["raw_html_ref"] and "raw_html" not in book_document(record)
+    assert pickle.loads(pickle.dumps(record)) == record
+    assert BookRecord(name="B").crawl_metadata == {}
+
+def test_diff_book_records_field_changes():
+    from crawler.db import book_document, diff_book
+
+    old = Book(book_id="1", name="B", price_incl_tax="10.00", availability="In stock (3 available)",
+               number_of_reviews=1, product_description="Old text")
+    new = Book(book_id="1", name="B", price_incl_tax="12.00", availability="In stock (3 available)",
+               number_of_reviews=2, product_description="New text")
+    before = book_document(old)
+
+    changes = diff_book(before, book_document(new))
+    assert {c.change_type for c in changes} == {"price_change", "reviews_change", "description_change"}
+    price = next(c for c in changes if c.change_type == "price_change")
+    assert price.old_value == {"price_incl_tax": "10.00"}
+    assert price.new_value == {"price_incl_tax": "12.00"}
+
+    assert diff_book(before, book_document(old)) == []
+    inserted, = diff_book(None, book_document(new))
+    assert inserted.change_type == "insert"
+
+def test_save_books_prefetches_pre_images_once_per_batch():
+    from crawler.db import book_document, save_books
+
+    books_col = MagicMock()
+    changes_col = MagicMock()
+    stored = Book(book_id="1", name="B", price_incl_tax="10.00")
+    books_col.find.return_value = [book_document(stored)]
+    books = [Book(book_id="1", name="B", price_incl_tax="11.00"), Book(book_id="2", name="C")]
+
+    assert save_books(books, books_col, changes_col) == 2
+    books_col.find.assert_called_once()
+    assert books_col.find.call_args.args[0] == {"book_id": {"$in": ["1", "2"]}}
+    docs, = changes_col.insert_many.call_args.args
+    assert sorted(d["change_type"] for d in docs) == ["insert", "price_change"]
+
+def test_generate_daily_change_report_streams_to_files(tmp_path):
+    import csv
+    import gzip
+    import json
+    from crawler.report import generate_daily_change_report
+
+    now = datetime(2025, 11, 14, 3, 0, 0)
+    docs = [
+        {"book_id": "1", "change_type": "price_change", "timestamp": datetime(2025, 11, 14, 2, 5),
+         "old_value": {"price_incl_tax": "10.00"}, "new_value": {"price_incl_tax": "12.00"}},
+        {"book_id": "2", "change_type": "insert", "timestamp": datetime(2025, 11, 14, 2, 6),
+         "old_value": {}, "new_value": {"availability": "In stock"}},
+    ]
+    changes_col = MagicMock()
+    changes_col.find.return_value.sort.return_value = iter(docs)
+
+    json_path, csv_path = generate_daily_change_report(
+        str(tmp_path), compress=True, changes_collection=changes_col, now=now
+    )
+
+    query = changes_col.find.call_args.args[0]
+    assert query == {"timestamp": {"$gte": datetime(2025, 11, 13, 3, 0, 0)}}
+    assert changes_col.find.call_args.kwargs["batch_size"] == 1000
+    with gzip.open(json_path, "rt") as f:
+        lines = [json.loads(line) for line in f]
+    assert [l["book_id"] for l in lines] == ["1", "2"]
+    with gzip.open(csv_path, "rt") as f:
+        rows = list(csv.DictReader(f))
+    assert json.loads(rows[0]["new_value"]) == {"price_incl_tax": "12.00"}
+    manifest = json.loads((tmp_path / "daily_changes_20251114_030000.manifest.json").read_text())
+    assert manifest["rows"] == 2
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_generate_daily_change_report_without_changes(tmp_path):
+    from crawler.report import generate_daily_change_report
+
+    changes_col = MagicMock()
+    changes_col.find.return_value.sort.return_value = iter([])
+    assert generate_daily_change_report(str(tmp_path), changes_collection=changes_col) == (None, None)
+    assert list(tmp_path.iterdir()) == []
+
+def test_backfill_numeric_fields():
+    from crawler.migrations import backfill_numeric_fields
+    from benchmarks.corpus import make_books, render_book_page
+
+    book = make_books(1)[0]
+    docs = [
+        {"_id": 1, "price_incl_tax": "£51.77", "price_excl_tax": "£50.00", "tax": "£1.77",
+         "raw_html": render_book_page(book), "product_page_url": "https://x/catalogue/book-1_1/index.html",
+         "crawl_metadata": {"site": "books.toscrape"}},
+        {"_id": 2, "price_incl_tax": "£10.00", "crawl_metadata": {}},
+    ]
+    books_col = MagicMock()
+    books_col.find.return_value = iter(docs)
+    books_col.bulk_write.return_value.modified_count = 2
+
+    assert backfill_numeric_fields(books_col) == 2
+    ops, = books_col.bulk_write.call_args.args
+    first, second = (op._doc["$set"] for op in ops)
+    assert first["price_incl_tax"] == "51.77"
+    assert first["price_incl_tax_pence"] == 5177
+    assert first["crawl_metadata.rating"] == book["rating"]
+    assert first["crawl_metadata.category"] == book["category"]
+    assert second == {"price_incl_tax": "10.00", "price_excl_tax": None, "tax": None,
+                      "price_incl_tax_pence": 1000, "price_excl_tax_pence": None}
+
+def test_raw_pages_are_compressed_and_deduplicated():
+    import mongomock
+    from crawler.blobstore import store_pages, load_page
+    from crawler.db import hash_text
+
+    pages_col = mongomock.MongoClient().db.raw_pages
+    html = "<html>" + "book " * 2000 + "</html>"
+    key = hash_text(html)
+
+    assert store_pages(pages_col, [(key, html)]) == 1
+    # an identical re-crawl stores nothing new
+    assert store_pages(pages_col, [(key, html)]) == 0
+    assert pages_col.count_documents({}) == 1
+    stored = pages_col.find_one({"_id": key})
+    assert len(stored["data"]) < len(html) / 10
+    assert load_page(pages_col, key) == html
+
+def test_book_document_references_raw_html():
+    from crawler.db import book_document, hash_text
+
+    doc = book_document(Book(book_id="1", name="B", raw_html="<html></html>"))
+    assert "raw_html" not in doc
+    assert doc["raw_html_ref"] == hash_text("<html></html>")
+
+def test_bump_cache_generation_counts_up():
+    import mongomock
+    from crawler.db import bump_cache_generation
+
+    state_col = mongomock.MongoClient().db.cache_state
+    assert bump_cache_generation(state_col) == 1
+    assert bump_cache_generation(state_col) == 2
+    assert state_col.find_one({"_id": "generation"})["value"] == 2
+
+async def _stand_in_server(handler):
+    # local aiohttp stand-in for a books.toscrape host
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handler)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+@pytest.mark.asyncio
+async def test_fetch_honors_retry_after_and_pauses_host():
+    import time
+    import httpx
+    from aiohttp import web
+    from crawler.politeness import HostScheduler
+
+    hits = []
+
+    async def handler(request):
+        hits.append(time.monotonic())
+        if len(hits) == 1:
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        return web.Response(text="<html>ok</html>")
+
+    server = await _stand_in_server(handler)
+    scheduler = HostScheduler(initial_concurrency=4)
+    try:
+        async with httpx.AsyncClient() as session:
+            text, _ = await fetch(session, str(server.make_url("/book_1/index.html")), scheduler=scheduler)
+    finally:
+        await server.close()
+
+    assert text == "<html>ok</html>"
+    assert hits[1] - hits[0] >= 0.95
+    host, = scheduler.metrics().values()
+    assert host["throttled"] == 1 and host["requests"] == 2
+    assert host["concurrency_limit"] < 4
+
+@pytest.mark.asyncio
+async def test_scheduler_limits_concurrency_and_rate_per_host():
+    import asyncio
+    import time
+    import httpx
+    from aiohttp import web
+    from crawler.politeness import HostScheduler
+
+    active, peak = [0], [0]
+
+    async def handler(request):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.02)
+        active[0] -= 1
+        return web.Response(text="<html></html>")
+
+    server = await _stand_in_server(handler)
+    scheduler = HostScheduler(rate=40, burst=1, initial_concurrency=2, max_concurrency=2)
+    started = time.monotonic()
+    try:
+        async with httpx.AsyncClient() as session:
+            await asyncio.gather(*(fetch(session, str(server.make_url(f"/p{i}")), scheduler=scheduler)
+                                   for i in range(10)))
+    finally:
+        await server.close()
+
+    assert peak[0] <= 2
+    # 10 requests at 40/s with a burst of 1 need at least 9 token refills
+    assert time.monotonic() - started >= 9 / 40 - 0.01
+
+@pytest.mark.asyncio
+async def test_aimd_limiter_backs_off_and_recovers():
+    from crawler.politeness import AIMDLimiter
+
+    limiter = AIMDLimiter(initial=8, maximum=10, cooldown=0)
+    await limiter.acquire()
+    await limiter.release(0.1, "throttled")
+    assert limiter.limit == 4
+    for _ in range(8):
+        await limiter.acquire()
+        await limiter.release(0.1, "ok")
+    assert 5 <= limiter.limit <= 6
+    await limiter.acquire()
+    await limiter.release(0.1, "cancelled")
+    assert limiter.in_flight == 0 and 5 <= limiter.limit <= 6
+
+def test_frontier_dedupes_leases_and_gives_up_after_max_attempts(tmp_path):
+    from crawler.frontier import Frontier, LIST, BOOK
+
+    now = [1000.0]
+    frontier = Frontier(str(tmp_path / "frontier.sqlite3"), lease_seconds=60, max_attempts=2, clock=lambda: now[0])
+    assert frontier.start(["https://books.toscrape.com/"]) is False
+    assert frontier.claim(LIST) == ["https://books.toscrape.com/"]
+    assert frontier.add(["b1", "b2", "b1"], BOOK, claim=True) == ["b1", "b2"]
+    assert frontier.add(["b2", "b3"], BOOK) == ["b3"]
+    frontier.done("https://books.toscrape.com/", "https://books.toscrape.com/index.html")
+    frontier.done("b1")
+
+    # b2 is leased, b3 pending
+    assert frontier.claim(BOOK) == ["b3"]
+    assert frontier.lease_wait() == 60
+    now[0] += 61
+    # both leases ran out, so both are handed out again
+    assert frontier.claim(BOOK) == ["b2", "b3"]
+    now[0] += 61
+    # claimed max_attempts times without finishing: given up
+    assert frontier.claim(BOOK) == []
+    assert frontier.counts() == {"done": 3, "failed": 2}
+    assert frontier.lease_wait() is None
+    frontier.close()
+
+def test_frontier_resumes_unfinished_crawl_from_file(tmp_path):
+    from crawler.frontier import Frontier, LIST, BOOK
+
+    path = str(tmp_path / "frontier.sqlite3")
+    frontier = Frontier(path, checkpoint_interval=0)
+    frontier.start(["https://books.toscrape.com/"])
+    frontier.claim(LIST)
+    frontier.add(["b1", "b2"], BOOK)
+    frontier.done("b1")
+    # the process dies without closing the frontier
+    frontier._db.close()
+
+    resumed = Frontier(path)
+    assert resumed.start(["https://books.toscrape.com/"]) is True
+    assert resumed.claim(BOOK) == ["b2"]
+    resumed.done("b2")
+    resumed.failed("https://books.toscrape.com/", "boom")
+    # nothing left to do: the next crawl starts over
+    assert resumed.start(["https://books.toscrape.com/"]) is False
+    assert resumed.counts() == {"pending": 1}
+    resumed.close()
+
+@pytest.mark.asyncio
+async def test_book_urls_queued_past_their_lease_are_fetched_once():
+    import asyncio
+    from crawler.frontier import Frontier, BOOK
+    from crawler.main import CrawlStats, _produce_book_urls
+
+    frontier = Frontier(lease_seconds=0.05)
+    queue = asyncio.Queue(maxsize=5)
+    urls = [f"https://books.toscrape.com/catalogue/book_{i}/index.html" for i in range(30)]
+    fetched = []
+
+    async def slow_worker():
+        while True:
+            url = await queue.get()
+            await asyncio.sleep(0.02)
+            fetched.append(url)
+            frontier.done(url)
+            queue.task_done()
+
+    worker = asyncio.create_task(slow_worker())
+    try:
+        await _produce_book_urls(None, urls, None, queue, CrawlStats(), None, frontier, seed_kind=BOOK)
+    finally:
+        worker.cancel()
+    assert fetched == urls
+    assert frontier.counts() == {"done": 30}
+
+def test_discovery_helpers_parse_pager_categories_and_sitemap():
+    from crawler.discovery import parse_pager, pager_urls, parse_categories, parse_sitemap, split_sitemap_urls
+
+    assert parse_pager('<li class="current">\n  Page 1 of 50\n</li>') == (1, 50)
+    assert parse_pager("<html>no pager</html>") is None
+    assert pager_urls("https://books.toscrape.com/catalogue/page-2.html", 1, 4) == [
+        "https://books.toscrape.com/catalogue/page-2.html",
+        "https://books.toscrape.com/catalogue/page-3.html",
+        "https://books.toscrape.com/catalogue/page-4.html",
+    ]
+    assert pager_urls("https://books.toscrape.com/catalogue/next?p=2", 1, 4) is None
+
+    html = """
+    <div class="side_categories"><ul><li><a href="catalogue/category/books_1/index.html">Books</a>
+      <ul>
+        <li><a href="catalogue/category/books/travel_2/index.html">
+            Travel
+        </a></li>
+        <li><a href="catalogue/category/books/mystery_3/index.html">Mystery</a></li>
+      </ul></li></ul></div>
+    """
+    assert parse_categories(html, "https://books.toscrape.com/") == [
+        ("Travel", "https://books.toscrape.com/catalogue/category/books/travel_2/index.html"),
+        ("Mystery", "https://books.toscrape.com/catalogue/category/books/mystery_3/index.html"),
+    ]
+
+    sitemap = """<?xml version="1.0" encoding="UTF-8"?>
+    <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+      <url><loc>https://books.toscrape.com/catalogue/page-2.html</loc></url>
+      <url><loc>https://books.toscrape.com/catalogue/a-light-in-the-attic_1000/index.html</loc></url>
+      <url><loc>https://books.toscrape.com/catalogue/category/books/travel_2/index.html</loc></url>
+    </urlset>"""
+    assert split_sitemap_urls(parse_sitemap(sitemap)) == (
+        ["https://books.toscrape.com/catalogue/page-2.html",
+         "https://books.toscrape.com/catalogue/category/books/travel_2/index.html"],
+        ["https://books.toscrape.com/catalogue/a-light-in-the-attic_1000/index.html"],
+    )
+
+@pytest.mark.asyncio
+async def test_fetch_records_metrics():
+    import httpx
+    from aiohttp import web
+    import crawler.fetcher as fetcher_module
+
+    registry = fetcher_module.instrumentation.REGISTRY
+    hits = []
+
+    async def handler(request):
+        hits.append(request.path)
+        if len(hits) == 1:
+            return web.Response(status=503, headers={"Retry-After": "0"})
+        return web.Response(text="<html>ok</html>")
+
+    server = await _stand_in_server(handler)
+    host = f"{server.host}:{server.port}"
+    try:
+        async with httpx.AsyncClient() as session:
+            await fetch(session, str(server.make_url("/book_1/index.html")))
+    finally:
+        await server.close()
+
+    def sample(name, **labels):
+        return registry.get_sample_value(name, {"host": host, **labels})
+
+    assert sample("crawl_fetch_responses_total", status="503") == 1
+    assert sample("crawl_fetch_responses_total", status="200") == 1
+    assert sample("crawl_fetch_retries_total") == 1
+    assert sample("crawl_fetch_bytes_total") == len("<html>ok</html>")
+    assert sample("crawl_fetch_seconds_count") == 2
+    assert registry.get_sample_value("crawl_fetch_in_flight") == 0
+
+def test_dump_metrics_run_summary_and_profile(tmp_path, monkeypatch):
+    import json
+    import pstats
+    from crawler import instrumentation
+    from crawler.settings import Settings
+
+    # no pushgateway configured
+    monkeypatch.setattr(instrumentation, "get_settings", Settings)
+    instrumentation.PARSE_SECONDS.labels("book").observe(0.01)
+    path = instrumentation.dump_metrics(str(tmp_path / "metrics" / "crawl.prom"))
+    assert 'crawl_parse_seconds_count{page="book"}' in open(path).read()
+
+    log = tmp_path / "runs.jsonl"
+    instrumentation.log_run_summary({"books_saved": 3, "errors": 0}, path=str(log), start_urls=["https://x/"])
+    instrumentation.log_run_summary({"books_saved": 5, "errors": 1}, path=str(log))
+    runs = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [r["books_saved"] for r in runs] == [3, 5]
+    assert runs[0]["event"] == "crawl_finished" and runs[0]["start_urls"] == ["https://x/"]
+    assert "timestamp" in runs[1]
+
+    with instrumentation.profiled("cprofile", str(tmp_path)) as profile_path:
+        sum(range(1000))
+    assert pstats.Stats(profile_path).total_calls > 0
+    with instrumentation.profiled(None) as nothing:
+        pass
+    assert nothing is None
+
+def _archived_response(url, html, etag=None):
+    import httpx
+    headers = {"etag": etag} if etag else {}
+    return httpx.Response(200, text=html, headers=headers, request=httpx.Request("GET", url))
+
+def test_archive_keeps_latest_record_per_url_across_segments(tmp_path):
+    from crawler.archive import Archive
+
+    archive = Archive(str(tmp_path), segment_size=64)
+    assert archive.record("https://x/a", _archived_response("https://x/a", "<p>a1</p>" * 100, etag='"1"'))
+    assert archive.record("https://x/b", _archived_response("https://x/b", "<p>b</p>" * 100))
+    # unchanged body: not appended again
+    assert not archive.record("https://x/b", _archived_response("https://x/b", "<p>b</p>" * 100))
+    assert archive.record("https://x/a", _archived_response("https://x/a", "<p>a2</p>" * 400))
+    archive.close()
+
+    archive = Archive(str(tmp_path))
+    assert len(archive) == 2 and archive.segments() == [1, 2, 3]
+    assert [(r.url, r.body[:9]) for r in archive] == [("https://x/b", "<p>b</p><"), ("https://x/a", "<p>a2</p>")]
+    assert archive.get("https://x/a").headers["content-length"] == str(len("<p>a2</p>" * 400))
+    assert archive.get("https://x/missing") is None
+
+    # a record torn by a crash after the last flush is ignored
+    with open(tmp_path / f"segment-{archive.segments()[-1]:05d}.arc", "ab") as f:
+        f.write(b"ARC1\x10\x00")
+    assert len(list(archive)) == 2
+    archive.close()
+
+def test_archive_shared_by_writers_with_segment_prefixes(tmp_path):
+    import os
+    from crawler.archive import Archive
+
+    shard0 = Archive(str(tmp_path), segment_prefix="shard-0-", checkpoint_interval=0)
+    shard1 = Archive(str(tmp_path), segment_prefix="shard-1-", checkpoint_interval=0)
+    assert shard0.record("https://x/a", _archived_response("https://x/a", "<p>a1</p>"))
+    assert shard1.record("https://x/b", _archived_response("https://x/b", "<p>b</p>"))
+    # a URL in another shard this time: unchanged is still recognised, a change supersedes
+    assert not shard1.record("https://x/a", _archived_response("https://x/a", "<p>a1</p>"))
+    assert shard1.record("https://x/a", _archived_response("https://x/a", "<p>a2</p>"))
+    shard0.close()
+    shard1.close()
+
+    archive = Archive(str(tmp_path))
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith(".arc")) == ["shard-0-00001.arc", "shard-1-00001.arc"]
+    assert archive.segments() == [] and archive.segments("shard-1-") == [1]
+    assert sorted((r.url, r.body) for r in archive) == [("https://x/a", "<p>a2</p>"), ("https://x/b", "<p>b</p>")]
+    assert archive.get("https://x/a").body == "<p>a2</p>"
+    archive.close()
+
+def test_archive_checkpoints_batch_fsync_and_index_writes(tmp_path, monkeypatch):
+    import asyncio
+    import os
+    import threading
+    from crawler import archive as archive_module
+    from crawler.archive import Archive
+    from crawler.fetcher import fetch
+
+    fsyncs, real_fsync = [], os.fsync
+    monkeypatch.setattr(archive_module.os, "fsync", lambda fd: fsyncs.append(fd) or real_fsync(fd))
+    now = [0.0]
+    shard0 = Archive(str(tmp_path), segment_prefix="shard-0-", clock=lambda: now[0])
+    shard1 = Archive(str(tmp_path), segment_prefix="shard-1-", clock=lambda: now[0])
+    for i in range(5):
+        assert shard0.record(f"https://x/{i}", _archived_response(f"https://x/{i}", f"<p>{i}</p>"))
+    # no fsync and no open index transaction per record, but the records are readable
+    assert fsyncs == [] and not shard0._db.in_transaction
+    assert shard0.get("https://x/3").body == "<p>3</p>"
+    assert shard1.record("https://x/b", _archived_response("https://x/b", "<p>b</p>"))
+    now[0] = 5.0
+    assert shard0.record("https://x/5", _archived_response("https://x/5", "<p>5</p>"))
+    assert len(fsyncs) == 1 and len(Archive(str(tmp_path))) == 6
+
+    # fetch archives in a worker thread, off the event loop
+    threads = []
+    record = shard1.record
+    monkeypatch.setattr(shard1, "record", lambda url, response: threads.append(threading.current_thread()) or record(url, response))
+
+    class Session:
+        async def get(self, url, **kwargs):
+            return _archived_response(url, "<p>c</p>")
+
+    assert asyncio.run(fetch(Session(), "https://x/c", archive=shard1))[0] == "<p>c</p>"
+    assert threads and threads[0] is not threading.main_thread()
+    shard0.close()
+    shard1.close()
+    assert len(Archive(str(tmp_path))) == 8
+
+def test_reparse_streams_archive_through_parser(tmp_path):
+    from benchmarks.corpus import make_books, render_book_page
+    from crawler.archive import Archive
+    from crawler.reparse import reparse
+
+    books = make_books(5)
+    archive = Archive(str(tmp_path))
+    for book in books:
+        url = f"https://books.toscrape.com/catalogue/{book['slug']}/index.html"
+        archive.record(url, _archived_response(url, render_book_page(book), etag=f'"{book["book_id"]}"'))
+
+    saved = []
+    summary = reparse(archive, "lxml", batch_size=2, save=saved.extend)
+    archive.close()
+
+    assert summary["pages"] == 5 and summary["books_saved"] == 5 and summary["errors"] == 0
+    assert [b.price_incl_tax for b in saved] == [b["price_incl_tax"] for b in books]
+    assert saved[0].etag == '"1"' and saved[0].content_hash and saved[0].raw_html
+
+def test_reparse_leaves_price_history_unchanged(tmp_path, monkeypatch):
+    from benchmarks.corpus import make_books, render_book_page
+    from crawler.archive import Archive
+    from crawler.reparse import reparse
+
+    archive = Archive(str(tmp_path))
+    for book in make_books(3):
+        url = f"https://books.toscrape.com/catalogue/{book['slug']}/index.html"
+        archive.record(url, _archived_response(url, render_book_page(book)))
+    collections = {name: MagicMock() for name in ("books", "change_log", "raw_pages", "price_history")}
+    collections["books"].find.return_value = []
+    collections["raw_pages"].find.return_value = []
+    monkeypatch.setattr("crawler.db.get_collection", collections.__getitem__)
+
+    summary = reparse(archive, "lxml")
+    archive.close()
+
+    assert summary["books_saved"] == 3
+    collections["books"].bulk_write.assert_called_once()
+    collections["books"].database.__getitem__.assert_not_called()
+    collections["price_history"].insert_many.assert_not_called()
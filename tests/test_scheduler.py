@@ -9,7 +9,7 @@ def dummy_coro():
     return _coro()
 
 def test_run_daily_crawl_calls_crawl_book_urls():
-    with patch("scheduler.tasks.crawl_book_urls", return_value=dummy_coro()) as mock_crawl:
+    with patch("crawler.main.crawl_book_urls", return_value=dummy_coro()) as mock_crawl:
         with patch("scheduler.tasks.asyncio.run") as mock_run:
             from scheduler.tasks import run_daily_crawl
             run_daily_crawl()
@@ -18,7 +18,7 @@ def test_run_daily_crawl_calls_crawl_book_urls():
             assert isinstance(mock_run.call_args[0][0], types.CoroutineType)
 
 def test_run_daily_change_report_calls_generate_daily_change_report_and_prints():
-    with patch("scheduler.tasks.generate_daily_change_report") as mock_report:
+    with patch("crawler.report.generate_daily_change_report") as mock_report:
         mock_report.return_value = ("report.json", "report.csv")
         with patch("builtins.print") as mock_print:
             from scheduler.tasks import run_daily_change_report
@@ -27,10 +27,113 @@ def test_run_daily_change_report_calls_generate_daily_change_report_and_prints()
             mock_print.assert_any_call("Daily report generated: report.json, report.csv")
 
 def test_run_daily_change_report_handles_none_files():
-    with patch("scheduler.tasks.generate_daily_change_report") as mock_report:
+    with patch("crawler.report.generate_daily_change_report") as mock_report:
         mock_report.return_value = (None, None)
         with patch("builtins.print") as mock_print:
             from scheduler.tasks import run_daily_change_report
             run_daily_change_report()
             mock_report.assert_called_once()
-            mock_print.assert_not_called()
\ No newline at end of file
+            mock_print.assert_not_called()
+def _shard_stats(books_saved, elapsed):
+    stats = MagicMock()
+    stats.summary.return_value = {"list_pages": 0, "book_pages": books_saved, "books_saved": books_saved,
+                                  "skipped_not_modified": 0, "skipped_unchanged": 0, "errors": 0,
+                                  "max_queue_depth": books_saved, "elapsed_seconds": elapsed}
+    return stats
+
+def test_run_distributed_crawl_shards_urls_and_reports_when_all_shards_finish(tmp_path):
+    from unittest.mock import AsyncMock
+    from crawler.settings import Settings
+    from scheduler.celery_app import app
+    from scheduler import tasks
+
+    urls = [f"https://books.toscrape.com/catalogue/book_{i}/index.html" for i in range(5)]
+    settings = Settings(frontier_path=str(tmp_path / "frontier.sqlite3"), rate_limit=8.0, shard_concurrency=2,
+                        parser_backend="lxml", parse_workers=2, http2=True, max_connections=4,
+                        archive_dir=str(tmp_path / "archive"))
+    app.conf.task_always_eager = True
+    app.conf.task_eager_propagates = True
+    try:
+        with patch("scheduler.tasks.get_settings", return_value=settings), \
+                patch("crawler.db.ensure_indexes") as mock_indexes, \
+                patch("crawler.main.enumerate_book_urls", new_callable=AsyncMock, return_value=urls) as mock_enum, \
+                patch("crawler.main.crawl", new_callable=AsyncMock) as mock_crawl, \
+                patch("crawler.db.bump_cache_generation") as mock_bump, \
+                patch("scheduler.tasks.run_daily_change_report") as mock_report, \
+                patch("crawler.instrumentation.log_run_summary") as mock_summary, \
+                patch("crawler.db.update_price_stats") as mock_stats, \
+                patch("builtins.print") as mock_print:
+            mock_crawl.side_effect = lambda shard, **kwargs: _shard_stats(len(shard), 1.5)
+            tasks.run_distributed_crawl.delay(shard_size=2)
+    finally:
+        app.conf.task_always_eager = False
+        app.conf.task_eager_propagates = False
+
+    mock_indexes.assert_called_once_with()
+    # the list page walk runs alone, at the full per-host rate
+    assert mock_enum.call_args.kwargs["rate_limit"] == 8.0 and mock_enum.call_args.kwargs["max_connections"] == 4
+    shards = [c.args[0] for c in mock_crawl.call_args_list]
+    assert shards == [urls[0:2], urls[2:4], urls[4:]]
+    assert all(c.kwargs["product_pages"] for c in mock_crawl.call_args_list)
+    # 3 shards, 2 running at once: each gets half the per-host rate
+    kwargs = mock_crawl.call_args.kwargs
+    assert kwargs["rate_limit"] == 4.0 and kwargs["frontier"] is not None
+    assert (kwargs["parser_backend"], kwargs["parse_workers"], kwargs["http2"], kwargs["max_connections"]) == \
+        ("lxml", 2, True, 4)
+    # each shard archives to its own segments of the shared archive
+    assert [c.kwargs["archive"].segment_prefix for c in mock_crawl.call_args_list] == ["shard-0-", "shard-1-", "shard-2-"]
+    # finished shards remove their frontier files
+    assert list(tmp_path.iterdir()) == [tmp_path / "archive"]
+    mock_bump.assert_called_once()
+    mock_report.delay.assert_called_once()
+    total = tasks.aggregate_shard_stats([mock_crawl.side_effect(s).summary() for s in shards])
+    assert total["books_saved"] == 5 and total["shards"] == 3
+    assert total["max_queue_depth"] == 2 and total["shard_seconds"] == 4.5
+    mock_print.assert_any_call(f"Distributed crawl finished: {total}")
+    mock_summary.assert_called_once_with(total, distributed=True)
+    mock_stats.assert_called_once_with()
+
+def test_shard_rate_limit_splits_the_limit_between_concurrent_shards():
+    from scheduler.tasks import shard_rate_limit
+
+    assert shard_rate_limit(None, 10, 4) is None
+    assert shard_rate_limit(8.0, 10, 4) == 2.0
+    assert shard_rate_limit(8.0, 2, 4) == 4.0
+
+def test_failed_shard_still_lets_the_distributed_crawl_finish(tmp_path):
+    from unittest.mock import AsyncMock
+    from crawler.settings import Settings
+    from scheduler.celery_app import app
+    from scheduler import tasks
+
+    urls = [f"https://books.toscrape.com/catalogue/book_{i}/index.html" for i in range(4)]
+
+    async def crawl(shard, **kwargs):
+        if shard[0] == urls[2]:
+            raise RuntimeError("boom")
+        return _shard_stats(len(shard), 1.0)
+
+    # eager tasks only run their retries when errors are not propagated
+    app.conf.task_always_eager = True
+    try:
+        with patch("scheduler.tasks.get_settings", return_value=Settings(frontier_path=str(tmp_path / "f.sqlite3"))), \
+                patch("crawler.db.ensure_indexes"), \
+                patch("crawler.main.enumerate_book_urls", new_callable=AsyncMock, return_value=urls), \
+                patch("crawler.main.crawl", side_effect=crawl) as mock_crawl, \
+                patch("crawler.db.bump_cache_generation") as mock_bump, \
+                patch("scheduler.tasks.run_daily_change_report") as mock_report, \
+                patch("crawler.instrumentation.log_run_summary") as mock_summary, \
+                patch("crawler.db.update_price_stats") as mock_stats, \
+                patch("builtins.print"):
+            tasks.run_distributed_crawl.delay(shard_size=2)
+    finally:
+        app.conf.task_always_eager = False
+
+    # the failing shard was tried once and retried max_retries times
+    assert mock_crawl.call_count == 1 + 1 + tasks.crawl_shard.max_retries
+    total = mock_summary.call_args.args[0]
+    assert total["shards"] == 2 and total["failed_shards"] == 1 and total["books_saved"] == 2
+    mock_stats.assert_called_once_with()
+    mock_bump.assert_called_once()
+    mock_report.delay.assert_called_once()
+    assert list(tmp_path.iterdir()) == []